@@ -0,0 +1,206 @@
+# activity_store.py - Shared, persistent log of posts made from the app
+#
+# One row per channel posted to, in an `activity` table in DATABASE_URL
+# (Postgres in production) or a local SQLite file when it isn't set, so the log
+# survives logout and restarts and every team member sees the same history.
+# record() only queues the row; a writer thread inserts queued rows in batches,
+# so posting never waits on the database. page() reads newest first with keyset
+# pagination - WHERE (created_at, id) < the last row seen - so later pages cost
+# the same as the first, and the user/channel filters are served by the
+# (user_name, chat_id, created_at) and (chat_id, created_at) indexes. A batch
+# that can't be written stays queued and is retried with backoff; backlog()
+# tells the page how many rows are waiting and why.
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from db_setup import get_connection, is_sqlite, sql
+
+BATCH_SIZE = 100
+MAX_RETRY_SECONDS = 60
+
+COLUMNS = "id, user_name, channel, chat_id, message_id, preview, media_count, error, created_at, deleted_at"
+
+class ActivityStore:
+    def __init__(self, database_url):
+        self.database_url = database_url
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pending = queue.Queue()
+        self._written = threading.Condition()
+        self._unwritten = 0
+        self._writer_conn = None
+        self._last_error = None
+        with self._lock, self._cursor() as (conn, cur):
+            self._setup(conn, cur)
+        threading.Thread(target=self._write_loop, name="activity-writer", daemon=True).start()
+
+    def _connect(self):
+        if self.database_url.startswith("sqlite:///"):
+            directory = os.path.dirname(self.database_url[len("sqlite:///"):])
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        conn = get_connection(self.database_url)
+        if is_sqlite(conn):
+            conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    @contextmanager
+    def _cursor(self, writer=False):
+        # The writer thread has its own connection so reads never queue behind a batch
+        attr = "_writer_conn" if writer else "_conn"
+        conn = getattr(self, attr)
+        if conn is None or getattr(conn, "closed", 0):
+            conn = self._connect()
+            setattr(self, attr, conn)
+        cur = conn.cursor()
+        try:
+            yield conn, cur
+            conn.commit()  # Also ends the transaction Postgres opens for a SELECT
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+
+    def _setup(self, conn, cur):
+        id_column = "id INTEGER PRIMARY KEY AUTOINCREMENT" if is_sqlite(conn) else "id SERIAL PRIMARY KEY"
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS activity (
+                {id_column},
+                user_name VARCHAR(255),
+                channel VARCHAR(255),
+                chat_id VARCHAR(255),
+                message_id BIGINT,
+                preview TEXT,
+                media_count INTEGER DEFAULT 0,
+                error TEXT,
+                created_at DOUBLE PRECISION NOT NULL,
+                deleted_at DOUBLE PRECISION
+            )
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_activity_user_chat_time ON activity (user_name, chat_id, created_at)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_activity_chat_time ON activity (chat_id, created_at)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_activity_time ON activity (created_at)")
+
+    def record(self, user, channel, chat_id, message_id=None, preview="", media_count=0, error=None, created_at=None):
+        """Queue one row for the writer thread; returns immediately"""
+        with self._written:
+            self._unwritten += 1
+        self._pending.put((
+            user, channel, str(chat_id), message_id, preview, media_count, error,
+            created_at or time.time()
+        ))
+
+    def _write_loop(self):
+        batch = []
+        failures = 0
+        while True:
+            if not batch:
+                batch = [self._pending.get()]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with self._cursor(writer=True) as (conn, cur):
+                    cur.executemany(sql(conn, """
+                        INSERT INTO activity (user_name, channel, chat_id, message_id, preview, media_count, error, created_at)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                    """), batch)
+            except Exception as e:
+                # Keep the rows and try again - the database is probably restarting
+                failures += 1
+                self._last_error = str(e)
+                self._writer_conn = None
+                print(f"Activity log write failed ({len(batch)} rows, attempt {failures}): {e}")
+                time.sleep(min(MAX_RETRY_SECONDS, 2 ** failures))
+                continue
+            failures = 0
+            self._last_error = None
+            with self._written:
+                self._unwritten -= len(batch)
+                self._written.notify_all()
+            batch = []
+
+    def flush(self, timeout=10):
+        """Wait until every queued row has been written; False on timeout"""
+        with self._written:
+            return self._written.wait_for(lambda: self._unwritten == 0, timeout=timeout)
+
+    def backlog(self):
+        """(rows not yet written, error of the last failed write or None)"""
+        with self._written:
+            return self._unwritten, self._last_error
+
+    @staticmethod
+    def _filters(user=None, chat_id=None):
+        where, params = [], []
+        if user:
+            where.append("user_name = %s")
+            params.append(user)
+        if chat_id:
+            where.append("chat_id = %s")
+            params.append(str(chat_id))
+        return where, params
+
+    def page(self, user=None, chat_id=None, before=None, limit=20):
+        """Newest rows first, starting after the `before` cursor
+
+        Returns (rows, cursor for the next page or None).
+        """
+        where, params = self._filters(user, chat_id)
+        if before:
+            where.append("(created_at < %s OR (created_at = %s AND id < %s))")
+            params += [before[0], before[0], before[1]]
+        clause = f"WHERE {' AND '.join(where)}" if where else ""
+        with self._lock, self._cursor() as (conn, cur):
+            cur.execute(sql(conn, f"""
+                SELECT {COLUMNS} FROM activity {clause}
+                ORDER BY created_at DESC, id DESC LIMIT %s
+            """), params + [limit + 1])
+            rows = cur.fetchall()
+        activity = [{
+            "id": row[0],
+            "user": row[1],
+            "channel": row[2],
+            "chat_id": row[3],
+            "message_id": row[4],
+            "preview": row[5] or "",
+            "media_count": row[6] or 0,
+            "error": row[7],
+            "created_at": row[8],
+            "deleted_at": row[9]
+        } for row in rows[:limit]]
+        more = len(rows) > limit
+        return activity, (activity[-1]["created_at"], activity[-1]["id"]) if more else None
+
+    def count(self, user=None, chat_id=None):
+        where, params = self._filters(user, chat_id)
+        clause = f"WHERE {' AND '.join(where)}" if where else ""
+        with self._lock, self._cursor() as (conn, cur):
+            cur.execute(sql(conn, f"SELECT COUNT(*) FROM activity {clause}"), params)
+            return cur.fetchone()[0]
+
+    def users(self):
+        with self._lock, self._cursor() as (conn, cur):
+            cur.execute("SELECT DISTINCT user_name FROM activity WHERE user_name IS NOT NULL ORDER BY user_name")
+            return [row[0] for row in cur.fetchall()]
+
+    def mark_deleted(self, activity_id):
+        with self._lock, self._cursor() as (conn, cur):
+            cur.execute(sql(conn, "UPDATE activity SET deleted_at = %s WHERE id = %s"), (time.time(), activity_id))
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_activity_store():
+    """The process-wide activity log: DATABASE_URL, else ACTIVITY_DB (local SQLite)"""
+    database_url = os.getenv("DATABASE_URL") or f"sqlite:///{os.getenv('ACTIVITY_DB', '.cache/activity.db')}"
+    with _stores_lock:
+        if database_url not in _stores:
+            _stores[database_url] = ActivityStore(database_url)
+        return _stores[database_url]
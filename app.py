@@ -1,13 +1,37 @@
 # app.py - COMPLETE VERSION WITH FFMPEG SUPPORT
 import streamlit as st
-import requests
+import altair as alt
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+import copy
 import json
 import re
 import os
 import tempfile
 from datetime import datetime, timedelta
 import time
-import subprocess
+import uuid
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import http_client
+import metrics
+import tracing
+from activity_store import get_activity_store
+from channel_store import get_channel_store
+from db_setup import get_connection
+from download import download_to_file
+from events import DEBUG_OUTPUT, EventBus, HeadlessUI, UIAdapter
+from file_id_store import file_ids_from_result, get_file_id_store
+from jobs import ACTIVE as JOB_ACTIVE, JobCancelled, JobUI, get_job_runner
+from media_cache import get_media_cache
+from multipart import MultipartStream
+from send_queue import get_send_queue
+from transcode import (
+    CANCELLED, PRIORITY_INTERACTIVE, PRIORITY_SCHEDULED, StreamingTranscode, StreamTooLarge, capped_encode_args,
+    encode, encode_to_size, get_transcode_pool, probe_media, remux, sized_encode_args, transcode_plan,
+    transcode_timeout
+)
+from tweet_cache import get_tweet_cache
+from worker import enqueue_post
 
 st.set_page_config(
     page_title="X to Telegram Scheduler",
@@ -137,62 +161,115 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Same expansions/fields for single and batch lookups so cached entries are interchangeable
+TWEET_LOOKUP_PARAMS = {
+    "expansions": "attachments.media_keys,author_id",
+    "tweet.fields": "attachments,author_id,text,created_at,entities",
+    "media.fields": "type,url,variants,preview_image_url,duration_ms,width,height",
+    "user.fields": "name,username"
+}
+
+# Bot API upload limit; bigger videos are re-encoded from a source of at most TRANSCODE_SOURCE_LIMIT
+TELEGRAM_UPLOAD_LIMIT = 50 * 1024 * 1024
+TRANSCODE_SOURCE_LIMIT = int(os.getenv("TRANSCODE_SOURCE_MB", "512")) * 1024 * 1024
+# Opt-in: pipe oversized videos through ffmpeg straight into the upload instead of temp files
+STREAM_TRANSCODE = os.getenv("STREAM_TRANSCODE", "0") == "1"
+# Channels posted to at once after the first cross-post target has uploaded the media
+CROSS_POST_CONCURRENCY = int(os.getenv("CROSS_POST_CONCURRENCY", "4"))
+# How often the page refreshes while this session has post jobs running
+JOB_POLL_SECONDS = 1
+# Two-pass size-targeted encodes: better quality for the same size, twice the decode work
+TWO_PASS_ENCODE = os.getenv("TWO_PASS_ENCODE", "0") == "1"
+# Channels drawn per sidebar page; the rest are reached by search or paging
+CHANNELS_PER_PAGE = 20
+
+# /2/tweets accepts at most 100 ids per request
+TWEET_BATCH_SIZE = 100
+# Overridable so benchmarks/bench_end_to_end.py can point the app at local stand-ins
+X_API_BASE = os.getenv("X_API_BASE", "https://api.twitter.com").rstrip("/")
+TELEGRAM_API_BASE = os.getenv("TELEGRAM_API_BASE", "https://api.telegram.org").rstrip("/")
+
+timed_remux = metrics.timed("remux", ok=lambda error: error is None)(remux)
+
+# Prometheus scrape endpoint when METRICS_PORT is set; binds once per process
+metrics.start_metrics_server()
+
+@st.cache_resource(show_spinner=False)
+def load_config():
+    """API tokens and passwords from secrets/env - read once per process, not on every rerun"""
+    if hasattr(st.secrets, 'api'):
+        api_secrets = st.secrets.api
+        x_token = api_secrets.get("x_bearer_token")
+        tg_token = api_secrets.get("telegram_bot_token") 
+        app_pass = api_secrets.get("app_password")
+        team_pass = api_secrets.get("team_passwords", {})
+    else:
+        x_token = st.secrets.get("x_bearer_token")
+        tg_token = st.secrets.get("telegram_bot_token")
+        app_pass = st.secrets.get("app_password")
+        team_pass = st.secrets.get("team_passwords", {})
+    
+    return {
+        "X_BEARER_TOKEN": x_token or os.getenv("X_BEARER_TOKEN"),
+        "TELEGRAM_BOT_TOKEN": tg_token or os.getenv("TELEGRAM_BOT_TOKEN"),
+        "APP_PASSWORD": app_pass or os.getenv("APP_PASSWORD"),
+        "TEAM_PASSWORDS": team_pass if isinstance(team_pass, dict) else {}
+    }
+
+def index_includes(includes):
+    """media_key -> media and user id -> user, instead of scanning the lists per tweet"""
+    media_by_key = {m["media_key"]: m for m in includes.get("media", []) if "media_key" in m}
+    users_by_id = {u["id"]: u for u in includes.get("users", []) if "id" in u}
+    return media_by_key, users_by_id
+
+def variant_dimensions(media, variant):
+    """(width, height) of a video variant - from its URL (.../vid/avc1/1280x720/...) or the tweet"""
+    match = re.search(r"/(\d+)x(\d+)/", variant.get("url", ""))
+    if match:
+        return int(match.group(1)), int(match.group(2))
+    return media.get("width", 0), media.get("height", 0)
+
 class SecureXTelegramScheduler:
     def __init__(self):
         self.channels_file = "channels_data.json"
         self.config = self.get_config()
+        self.last_error = None
+        # Where posting progress goes: the page, or a post job's log (see jobs.JobUI)
+        self.ui = st
+        self.on_stage = None
+        self.job = None  # The post job this copy works for (see for_job)
+        self.trace = None  # tracing.Trace of the post being made, if any
+        # This browser session: owns its post jobs in the job runner (Cancel stops them)
+        self.session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex)
+        # Owner of the transcodes this scheduler starts; each post job uses its own id
+        self.transcode_owner = self.session_id
+        self.transcode_priority = PRIORITY_INTERACTIVE
         self.load_channels()
         self.check_team_access()
+
+    @classmethod
+    def headless(cls, config):
+        """Build the scheduler without session/login UI - used by worker.py"""
+        app = cls.__new__(cls)
+        app.channels_file = "channels_data.json"
+        app.config = config
+        app.last_error = None
+        app.ui = HeadlessUI()
+        app.on_stage = None
+        app.job = None
+        app.trace = None
+        app.session_id = None
+        app.transcode_owner = None
+        app.transcode_priority = PRIORITY_SCHEDULED
+        return app
         
     def load_channels(self):
-        try:
-            if os.path.exists(self.channels_file):
-                with open(self.channels_file, 'r') as f:
-                    data = json.load(f)
-                    st.session_state.channels = data.get('channels', {})
-                    st.session_state.channel_links = data.get('channel_links', {})
-            else:
-                if 'channels' not in st.session_state:
-                    st.session_state.channels = {}
-                if 'channel_links' not in st.session_state:
-                    st.session_state.channel_links = {}
-        except:
-            st.session_state.channels = {}
-            st.session_state.channel_links = {}
-    
-    def save_channels(self):
-        try:
-            data = {
-                'channels': st.session_state.channels,
-                'channel_links': st.session_state.channel_links
-            }
-            with open(self.channels_file, 'w') as f:
-                json.dump(data, f, indent=2)
-        except Exception as e:
-            st.error(f"Could not save: {str(e)}")
+        # Cached per process; the table is only re-read when it changes
+        st.session_state.channels, st.session_state.channel_links = get_channel_store(self.channels_file).snapshot()
         
     def get_config(self):
         try:
-            secrets = st.secrets if hasattr(st, 'secrets') and st.secrets else {}
-            
-            if hasattr(st.secrets, 'api'):
-                api_secrets = st.secrets.api
-                x_token = api_secrets.get("x_bearer_token")
-                tg_token = api_secrets.get("telegram_bot_token") 
-                app_pass = api_secrets.get("app_password")
-                team_pass = api_secrets.get("team_passwords", {})
-            else:
-                x_token = st.secrets.get("x_bearer_token")
-                tg_token = st.secrets.get("telegram_bot_token")
-                app_pass = st.secrets.get("app_password")
-                team_pass = st.secrets.get("team_passwords", {})
-            
-            return {
-                "X_BEARER_TOKEN": x_token or os.getenv("X_BEARER_TOKEN"),
-                "TELEGRAM_BOT_TOKEN": tg_token or os.getenv("TELEGRAM_BOT_TOKEN"),
-                "APP_PASSWORD": app_pass or os.getenv("APP_PASSWORD"),
-                "TEAM_PASSWORDS": team_pass if isinstance(team_pass, dict) else {}
-            }
+            return load_config()
         except Exception as e:
             st.error(f"Config error: {e}")
             st.stop()
@@ -243,278 +320,683 @@ class SecureXTelegramScheduler:
         match = re.search(r'/status/(\d+)', clean_url)
         return match.group(1) if match else None
     
+    @metrics.timed("fetch", ok=lambda data: data is not None)
     def fetch_tweet(self, tweet_id):
         if not tweet_id or not self.config['X_BEARER_TOKEN']:
-            st.error("Missing tweet ID or token")
+            self.ui.error("Missing tweet ID or token")
+            return None
+        
+        # Cached per process and on disk; concurrent lookups share one API request
+        data = get_tweet_cache().get_or_fetch(tweet_id, lambda: self._request_tweet(tweet_id))
+        if not data:
             return None
         
-        # Debug: Show what we're sending
-        st.write(f"**Debug Info:**")
-        st.write(f"Tweet ID: `{tweet_id}`")
-        st.write(f"Token exists: {bool(self.config['X_BEARER_TOKEN'])}")
-        st.write(f"Token preview: `{self.config['X_BEARER_TOKEN'][:20]}...`")
+        tweet_data = data["data"]
+        if isinstance(tweet_data, list):
+            if len(tweet_data) == 0:
+                return None
+            data["data"] = tweet_data[0]
+        
+        self.expand_urls(data["data"])
+        return data
+    
+    def expand_urls(self, tweet_obj):
+        # Process text to expand URLs if entities are present
+        if "entities" in tweet_obj and "urls" in tweet_obj["entities"]:
+            text = tweet_obj["text"]
+            urls = tweet_obj["entities"]["urls"]
+            
+            # Replace t.co links with display URLs or expanded URLs
+            for url_entity in reversed(urls):  # Reverse to maintain indices
+                t_co_url = url_entity["url"]
+                # Use display_url or expanded_url if available
+                replacement = url_entity.get("display_url", url_entity.get("expanded_url", t_co_url))
+                text = text.replace(t_co_url, replacement)
+            
+            # Update the tweet text with expanded URLs
+            tweet_obj["text"] = text
+    
+    def fetch_tweets(self, tweet_ids):
+        """Look up many tweets with /2/tweets?ids=, 100 per request; returns {tweet_id: data}
+
+        Each value has the same shape as a fetch_tweet result and shares its cache.
+        """
+        if not self.config['X_BEARER_TOKEN']:
+            self.ui.error("Missing X token")
+            return {}
+        
+        cache = get_tweet_cache()
+        unique_ids = list(dict.fromkeys(str(t) for t in tweet_ids if t))
+        results = {}
+        missing = []
+        for tweet_id in unique_ids:
+            cached = cache.get(tweet_id)
+            if cached:
+                results[tweet_id] = cached
+            else:
+                missing.append(tweet_id)
         
         headers = {"Authorization": f"Bearer {self.config['X_BEARER_TOKEN']}"}
-        params = {
-            "expansions": "attachments.media_keys,author_id",
-            "tweet.fields": "attachments,author_id,text,created_at,entities",
-            "media.fields": "type,url,variants,preview_image_url",
-            "user.fields": "name,username"
-        }
+        for start in range(0, len(missing), TWEET_BATCH_SIZE):
+            chunk = missing[start:start + TWEET_BATCH_SIZE]
+            params = dict(TWEET_LOOKUP_PARAMS, ids=",".join(chunk))
+            try:
+                response = http_client.get(f"{X_API_BASE}/2/tweets", headers=headers, params=params, timeout=30)
+            except Exception as e:
+                self.ui.error(f"Batch lookup failed: {str(e)}")
+                continue
+            
+            if response.status_code != 200:
+                self.ui.error(f"API Error {response.status_code} for {len(chunk)} tweets")
+                continue
+            
+            data = response.json()
+            media_by_key, users_by_id = index_includes(data.get("includes", {}))
+            for tweet in data.get("data", []):
+                media_keys = tweet.get("attachments", {}).get("media_keys", [])
+                includes = {}
+                media = [media_by_key[k] for k in media_keys if k in media_by_key]
+                if media:
+                    includes["media"] = media
+                if tweet.get("author_id") in users_by_id:
+                    includes["users"] = [users_by_id[tweet["author_id"]]]
+                
+                tweet_data = {"data": tweet}
+                if includes:
+                    tweet_data["includes"] = includes
+                cache.put(tweet["id"], tweet_data)
+                results[tweet["id"]] = tweet_data
+            
+            for error in data.get("errors", []):
+                if error.get("resource_id") in chunk:
+                    self.ui.warning(f"Tweet {error['resource_id']}: {error.get('title', 'not available')}")
         
-        url = f"https://api.twitter.com/2/tweets/{tweet_id}"
+        for tweet_data in results.values():
+            self.expand_urls(tweet_data["data"])
+        return results
+    
+    def _request_tweet(self, tweet_id):
+        """Call the X API - only reached on a tweet cache miss"""
+        headers = {"Authorization": f"Bearer {self.config['X_BEARER_TOKEN']}"}
+        params = dict(TWEET_LOOKUP_PARAMS)
         
-        st.write(f"API URL: `{url}`")
+        url = f"{X_API_BASE}/2/tweets/{tweet_id}"
+        self._debug(f"Tweet ID: `{tweet_id}` - API URL: `{url}`")
         
         try:
-            with st.spinner("Fetching tweet..."):
-                response = requests.get(url, headers=headers, params=params, timeout=30)
+            with self.ui.spinner("Fetching tweet..."):
+                response = http_client.get(url, headers=headers, params=params, timeout=30)
             
-            st.write(f"**Response Status:** {response.status_code}")
+            self._debug(f"**Response Status:** {response.status_code}")
             
             if response.status_code == 200:
                 data = response.json()
                 if "data" not in data:
-                    st.error("Invalid response")
-                    with st.expander("Debug: API Response"):
-                        st.json(data)
+                    self.ui.error("Invalid response")
+                    self._debug(f"API Response: `{response.text[:2000]}`")
                     return None
                 
-                tweet_data = data["data"]
-                if isinstance(tweet_data, list):
-                    if len(tweet_data) == 0:
-                        return None
-                    data["data"] = tweet_data[0]
-                
-                st.success("Tweet fetched successfully!")
-                
-                # Process text to expand URLs if entities are present
-                tweet_obj = data["data"]
-                if "entities" in tweet_obj and "urls" in tweet_obj["entities"]:
-                    text = tweet_obj["text"]
-                    urls = tweet_obj["entities"]["urls"]
-                    
-                    # Replace t.co links with display URLs or expanded URLs
-                    for url_entity in reversed(urls):  # Reverse to maintain indices
-                        t_co_url = url_entity["url"]
-                        # Use display_url or expanded_url if available
-                        replacement = url_entity.get("display_url", url_entity.get("expanded_url", t_co_url))
-                        text = text.replace(t_co_url, replacement)
-                    
-                    # Update the tweet text with expanded URLs
-                    data["data"]["text"] = text
-                
+                self.ui.success("Tweet fetched successfully!")
                 return data
             elif response.status_code == 401:
-                st.error("Invalid X Bearer Token - Token is expired or incorrect")
-                st.write("Your X_BEARER_TOKEN needs to be updated in Render environment variables")
+                self.ui.error("Invalid X Bearer Token - Token is expired or incorrect")
+                self.ui.write("Your X_BEARER_TOKEN needs to be updated in Render environment variables")
             elif response.status_code == 404:
-                st.error("Tweet not found - Check the URL is correct")
+                self.ui.error("Tweet not found - Check the URL is correct")
             elif response.status_code == 400:
-                st.error("Bad Request - Invalid tweet URL or parameters")
-                st.write(f"Tweet ID extracted: {tweet_id}")
-                st.write("Make sure you're using the full X URL including the complete status ID")
-                with st.expander("Debug: Full API Response"):
-                    st.code(response.text)
+                self.ui.error("Bad Request - Invalid tweet URL or parameters")
+                self.ui.write(f"Tweet ID extracted: {tweet_id}")
+                self.ui.write("Make sure you're using the full X URL including the complete status ID")
+                self._debug(f"API Response: `{response.text[:2000]}`")
             else:
-                st.error(f"API Error {response.status_code}")
-                with st.expander("Debug: Response Details"):
-                    st.code(response.text)
+                self.ui.error(f"API Error {response.status_code}")
+                self._debug(f"API Response: `{response.text[:2000]}`")
             return None
         except Exception as e:
-            st.error(f"Error: {str(e)}")
+            self.ui.error(f"Error: {str(e)}")
             return None
     
-    def download_media_batch(self, media_list, tweet_id):
+    def for_job(self, job):
+        """A copy of the scheduler that reports into a background post job instead of the page"""
+        poster = copy.copy(self)
+        poster.ui = JobUI(job)
+        poster.on_stage = job.stage
+        poster.job = job
+        # Cancelling the job stops its own ffmpeg processes and nobody else's
+        poster.transcode_owner = job.id
+        return poster
+    
+    def _stage(self, stage, progress=None):
+        if self.job:
+            self.job.raise_if_cancelled()  # Between stages is where a cancelled job stops
+        if self.on_stage:
+            self.on_stage(stage, progress)
+    
+    def _span(self, name, parent=None, **attrs):
+        return self.trace.span(name, parent, **attrs) if self.trace else tracing.NO_SPAN
+    
+    def _debug(self, message):
+        """Diagnostics for troubleshooting, shown only with DEBUG_OUTPUT set"""
+        if DEBUG_OUTPUT:
+            self.ui.write(message)
+    
+    def download_media_batch(self, media_list, tweet_id, concurrency=None):
         if not media_list:
             return []
         
-        downloaded = []
-        total_size = 0
+        items = media_list[:10]
+        concurrency = concurrency or int(os.getenv("MEDIA_DOWNLOAD_CONCURRENCY", "4"))
         
-        st.write(f"Downloading {len(media_list)} media items...")
-        progress_bar = st.progress(0)
+        self._stage("downloading", 0.0)
+        self.ui.write(f"Downloading {len(items)} media items...")
+        progress_bar = self.ui.progress(0)
+        item_slots = [self.ui.empty() for _ in items]
         
-        for i, media in enumerate(media_list[:10]):
-            try:
-                progress_bar.progress((i + 1) / min(len(media_list), 10))
+        # Worker threads only emit events; this thread draws them a few times a second
+        def show_progress(i, done_bytes, total_bytes):
+            total = f"/{total_bytes/1024/1024:.1f}" if total_bytes else ""
+            item_slots[i].caption(f"Item {i+1}: {done_bytes/1024/1024:.1f}{total}MB")
+        view = UIAdapter(self.ui, EventBus(), show_progress)
+        report = view.bus
+        
+        batch_span = self._span("download media", items=len(items))
+        def download(i, media):
+            # Pool threads have no open span of their own, so the batch is named as the parent
+            with self._span(f"item {i+1}", batch_span, type=media.get("type")) as span:
+                item = self._download_item(i, media, report)
+                span.set(bytes=item["size"] if item else 0, reused=bool(item and item.get("file_id")))
+                return item
+        
+        results = [None] * len(items)
+        finished_count = 0
+        with batch_span, ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(items)))) as pool:
+            futures = {pool.submit(download, i, media): i for i, media in enumerate(items)}
+            pending = set(futures)
+            while pending:
+                finished, pending = wait(pending, timeout=0.25, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    # Keep the tweet's order for sendMediaGroup, whatever finishes first
+                    item = future.result()
+                    if item:
+                        item["source"] = items[futures[future]]
+                    results[futures[future]] = item
+                    finished_count += 1
+                view.update()
+                if finished:
+                    progress_bar.progress(finished_count / len(items))
+                    self._stage("downloading", finished_count / len(items))
+        view.update(force=True)
+        
+        downloaded = [item for item in results if item]
+        total_size = sum(item["size"] for item in downloaded)
+        
+        progress_bar.progress(1.0)
+        self.ui.info(f"Downloaded {len(downloaded)} items ({total_size/1024/1024:.1f}MB total)")
+        return downloaded
+    
+    @metrics.timed("download", ok=lambda item: item is not None)
+    def _download_item(self, i, media, report, reuse_file_ids=True):
+        """Download one media item on a worker thread; returns its entry or None"""
+        try:
+            media_type = media.get("type", "unknown")
+            report("debug", f"**Processing item {i+1}: {media_type}**")
+            
+            # Already uploaded to Telegram by this bot - no download or upload needed
+            if reuse_file_ids and media.get("media_key") and media_type in ["photo", "video", "animated_gif"]:
+                file_id = get_file_id_store().get(self.bot_id(), media_key=media["media_key"]) if self.bot_id() else None
+                if file_id:
+                    report("success", f"Item {i+1} already on Telegram, reusing it")
+                    return {
+                        "type": "photo" if media_type == "photo" else "video",
+                        "media_key": media["media_key"],
+                        "file_id": file_id,
+                        "size": 0
+                    }
+            
+            media_cache = get_media_cache()
+            
+            if media_type == "photo":
+                media_key = media.get("media_key", f"photo_{i}")
+                cached = media_cache.lookup(media_key, media["url"])
+                if cached:
+                    report("success", f"Photo {i+1} from cache ({cached['size']/1024/1024:.1f}MB)")
+                    return dict(cached, type="photo", media_key=media_key, cached=True)
                 
-                media_type = media.get("type", "unknown")
-                st.write(f"**Processing item {i+1}: {media_type}**")
+                downloaded_size = 0
+                def count(done, total):
+                    nonlocal downloaded_size
+                    downloaded_size = done
                 
-                if media_type == "photo":
-                    response = requests.get(media["url"], timeout=30, stream=True)
-                    response.raise_for_status()
-                    
-                    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".jpg")
-                    for chunk in response.iter_content(8192):
-                        temp_file.write(chunk)
-                    temp_file.close()
-                    
-                    file_size = os.path.getsize(temp_file.name)
-                    if file_size > 10 * 1024 * 1024:
-                        os.unlink(temp_file.name)
-                        st.warning(f"Photo {i+1} too large, skipped")
-                        continue
-                    
-                    downloaded.append({
-                        "type": "photo",
-                        "file": temp_file.name,
-                        "media_key": media.get("media_key", f"photo_{i}")
-                    })
-                    total_size += file_size
-                    st.success(f"Photo {i+1} downloaded ({file_size/1024/1024:.1f}MB)")
-                    
-                elif media_type in ["video", "animated_gif"]:
-                    # Handle both regular videos and animated GIFs (which Twitter treats as MP4s)
-                    st.write(f"**Processing {'GIF' if media_type == 'animated_gif' else 'video'} {i+1}...**")
-                    # Twitter API uses 'bit_rate' not 'bitrate'
-                    variants = [v for v in media.get("variants", []) if v.get("bit_rate") or v.get("bitrate")]
-                    
-                    if not variants:
-                        st.warning(f"{'GIF' if media_type == 'animated_gif' else 'Video'} {i+1} has no valid variants")
-                        st.write(f"Available variants: {media.get('variants', [])}")
-                        continue
-                    
-                    st.write(f"Found {len(variants)} quality options")
-                    
-                    # Sort by bitrate, highest first (handle both 'bit_rate' and 'bitrate')
-                    variants_sorted = sorted(variants, key=lambda x: x.get("bit_rate", x.get("bitrate", 0)), reverse=True)
-                    
-                    video_downloaded = False
-                    for variant_index, variant in enumerate(variants_sorted):
-                        try:
-                            # Handle both 'bit_rate' and 'bitrate' keys
-                            bitrate_value = variant.get('bit_rate', variant.get('bitrate', 0))
-                            bitrate_mbps = bitrate_value / 1000000
-                            st.info(f"Attempting quality {variant_index + 1}/{len(variants_sorted)}: {bitrate_mbps:.1f} Mbps")
-                            st.write(f"URL: {variant['url'][:100]}...")
-                            
-                            response = requests.get(variant["url"], stream=True, timeout=60)
-                            response.raise_for_status()
-                            
-                            st.write(f"Download started...")
-                            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4")
-                            downloaded_size = 0
-                            chunks_count = 0
-                            
-                            for chunk in response.iter_content(8192):
-                                if not chunk:
-                                    break
-                                temp_file.write(chunk)
-                                downloaded_size += len(chunk)
-                                chunks_count += 1
-                                
-                                # Progress update every 100 chunks
-                                if chunks_count % 100 == 0:
-                                    st.write(f"Downloaded: {downloaded_size/1024/1024:.1f}MB...")
-                                
-                                # Stop if exceeds 50MB
-                                if downloaded_size > 50 * 1024 * 1024:
-                                    st.warning("Stopping download - exceeds 50MB limit")
-                                    break
-                            
-                            temp_file.close()
-                            file_size = os.path.getsize(temp_file.name)
-                            
-                            st.write(f"**Download complete: {file_size/1024/1024:.1f}MB**")
-                            
-                            if file_size <= 50 * 1024 * 1024 and file_size > 100000:  # At least 100KB
-                                downloaded.append({
-                                    "type": "video",  # Telegram treats both as video
-                                    "file": temp_file.name,
-                                    "media_key": media.get("media_key", f"video_{i}")
-                                })
-                                total_size += file_size
-                                st.success(f"✓ {'GIF' if media_type == 'animated_gif' else 'Video'} {i+1} ready ({file_size/1024/1024:.1f}MB)")
-                                video_downloaded = True
-                                break
-                            elif file_size <= 100000:
-                                os.unlink(temp_file.name)
-                                st.error(f"File too small ({file_size} bytes) - might be corrupted")
-                            else:
-                                os.unlink(temp_file.name)
-                                st.warning(f"File too large ({file_size/1024/1024:.1f}MB), trying lower quality...")
-                                continue
-                                
-                        except Exception as variant_error:
-                            if 'temp_file' in locals() and os.path.exists(temp_file.name):
-                                os.unlink(temp_file.name)
-                            st.error(f"Quality {variant_index + 1} failed: {str(variant_error)}")
+                with self._span("download", url=media["url"]) as span:
+                    response = http_client.get(media["url"], timeout=30, stream=True)
+                    try:
+                        response.raise_for_status()
+                        # Stops reading as soon as the photo is over the limit
+                        download = download_to_file(response, ".jpg", 10 * 1024 * 1024, count)
+                    finally:
+                        metrics.BYTES.inc(downloaded_size, direction="download")
+                        span.set(bytes=downloaded_size, status=response.status_code)
+                        response.close()
+                if download is None:
+                    report("warning", f"Photo {i+1} too large, skipped")
+                    return None
+                
+                report("success", f"Photo {i+1} downloaded ({download['size']/1024/1024:.1f}MB)")
+                stored = media_cache.store(media_key, media["url"], download["file"], download["sha256"])
+                return dict(stored, type="photo", media_key=media_key, cached=True)
+                
+            elif media_type in ["video", "animated_gif"]:
+                # Handle both regular videos and animated GIFs (which Twitter treats as MP4s)
+                label = 'GIF' if media_type == 'animated_gif' else 'Video'
+                report("debug", f"**Processing {'GIF' if media_type == 'animated_gif' else 'video'} {i+1}...**")
+                # Twitter API uses 'bit_rate' not 'bitrate'
+                variants = [v for v in media.get("variants", []) if v.get("bit_rate") or v.get("bitrate")]
+                
+                if not variants:
+                    report("warning", f"{label} {i+1} has no valid variants")
+                    report("debug", f"Available variants: {media.get('variants', [])}")
+                    return None
+                
+                report("debug", f"Found {len(variants)} quality options")
+                
+                # Sort by bitrate, highest first (handle both 'bit_rate' and 'bitrate')
+                variants_sorted = sorted(variants, key=lambda x: x.get("bit_rate", x.get("bitrate", 0)), reverse=True)
+                media_key = media.get("media_key", f"video_{i}")
+                
+                # Any variant we already have skips the network entirely
+                for variant in variants_sorted:
+                    cached = media_cache.lookup(media_key, variant["url"])
+                    if cached and 100000 < cached["size"] <= TELEGRAM_UPLOAD_LIMIT:
+                        report("success", f"✓ {label} {i+1} from cache ({cached['size']/1024/1024:.1f}MB)")
+                        return dict(cached, type="video", media_key=media_key, cached=True)
+                
+                # Ask the CDN how big each quality is before downloading any of them
+                with self._span("variant selection", variants=len(variants_sorted)) as selection:
+                    sizes = self.probe_variant_sizes(variants_sorted)
+                candidates = []
+                for variant, size in zip(variants_sorted, sizes):
+                    bitrate_mbps = variant.get('bit_rate', variant.get('bitrate', 0)) / 1000000
+                    if size is None:
+                        report("debug", f"{label} {i+1}: {bitrate_mbps:.1f} Mbps - size unknown")
+                        candidates.append(variant)
+                    elif size <= TELEGRAM_UPLOAD_LIMIT:
+                        report("debug", f"{label} {i+1}: {bitrate_mbps:.1f} Mbps - {size/1024/1024:.1f}MB")
+                        candidates.append(variant)
+                    else:
+                        report("debug", f"{label} {i+1}: {bitrate_mbps:.1f} Mbps - {size/1024/1024:.1f}MB, over the limit")
+                
+                selection.set(sizes=sizes, candidates=len(candidates))
+                if not candidates:
+                    # Nothing fits: re-encode the smallest quality rather than downloading every one
+                    return self._download_and_shrink(i, media_key, label, variants_sorted[-1], report, media)
+                
+                too_big = 0
+                for variant_index, variant in enumerate(candidates):
+                    try:
+                        # Handle both 'bit_rate' and 'bitrate' keys
+                        bitrate_value = variant.get('bit_rate', variant.get('bitrate', 0))
+                        bitrate_mbps = bitrate_value / 1000000
+                        report("debug", f"{label} {i+1}: downloading {bitrate_mbps:.1f} Mbps ({variant_index + 1}/{len(candidates)})")
+                        
+                        download = self._download_variant(i, variant["url"], report, TELEGRAM_UPLOAD_LIMIT)
+                        if download is None:
+                            report("warning", f"{label} {i+1}: exceeds 50MB limit, trying lower quality...")
+                            too_big += 1
                             continue
-                    
-                    if not video_downloaded:
-                        st.error(f"❌ Could not download {'GIF' if media_type == 'animated_gif' else 'video'} {i+1} - all qualities failed")
-                else:
-                    st.warning(f"Unknown media type: {media_type} - skipping")
                         
-            except Exception as e:
-                st.warning(f"Media {i+1} failed: {str(e)}")
-                continue
+                        temp_path, file_size = download["file"], download["size"]
+                        if file_size > 100000:  # At least 100KB
+                            # The hash computed while downloading spares ffprobe's cache and the media cache a re-read
+                            temp_path, sha256 = self.prepare_video(i, label, temp_path, report, download["sha256"])
+                            file_size = os.path.getsize(temp_path)
+                            report("success", f"✓ {label} {i+1} ready ({file_size/1024/1024:.1f}MB)")
+                            stored = media_cache.store(media_key, variant["url"], temp_path, sha256)
+                            # Telegram treats both as video
+                            return dict(stored, type="video", media_key=media_key, cached=True)
+                        
+                        os.unlink(temp_path)
+                        report("error", f"{label} {i+1}: file too small ({file_size} bytes) - might be corrupted")
+                            
+                    except JobCancelled:
+                        raise
+                    except Exception as variant_error:
+                        report("error", f"{label} {i+1}: quality {variant_index + 1} failed: {str(variant_error)}")
+                
+                if too_big == len(candidates):
+                    # Sizes the probe couldn't tell us, and every one was over the limit
+                    return self._download_and_shrink(i, media_key, label, variants_sorted[-1], report, media)
+                report("error", f"❌ Could not download {label.lower()} {i+1} - all qualities failed")
+            else:
+                report("warning", f"Unknown media type: {media_type} - skipping")
+                
+        except JobCancelled:
+            raise  # Ends the whole batch, not just this item
+        except Exception as e:
+            report("warning", f"Media {i+1} failed: {str(e)}")
+        return None
+    
+    def probe_variant_sizes(self, variants):
+        """Content-Length of each variant (None if unknown), probed concurrently"""
+        def size_of(url):
+            try:
+                response = http_client.head(url, timeout=10, allow_redirects=True)
+                if response.ok and response.headers.get("Content-Length"):
+                    return int(response.headers["Content-Length"])
+                # Some CDNs don't answer HEAD properly - a one-byte range tells us the total
+                response = http_client.get(url, headers={"Range": "bytes=0-0"}, stream=True, timeout=10)
+                content_range = response.headers.get("Content-Range", "")
+                response.close()
+                total = content_range.rsplit("/", 1)[-1]
+                return int(total) if total.isdigit() else None
+            except Exception:
+                return None
         
-        progress_bar.progress(1.0)
-        st.info(f"Downloaded {len(downloaded)} items ({total_size/1024/1024:.1f}MB total)")
-        return downloaded
+        if not variants:
+            return []
+        with ThreadPoolExecutor(max_workers=len(variants)) as pool:
+            return list(pool.map(lambda v: size_of(v["url"]), variants))
+    
+    def _download_variant(self, i, url, report, max_bytes):
+        """Stream one video variant to a temp file
+
+        Returns {'file', 'size', 'sha256'}, or None if it turns out bigger than max_bytes.
+        """
+        with self._span("download", url=url) as span:
+            response = http_client.get(url, stream=True, timeout=60)
+            downloaded_size = content_length = 0
+            def progress(done, total):
+                nonlocal downloaded_size
+                downloaded_size = done
+                report("progress", (i, done, total))
+            try:
+                response.raise_for_status()
+                content_length = int(response.headers.get("Content-Length", 0))
+                return download_to_file(response, ".mp4", max_bytes, progress)
+            finally:
+                metrics.BYTES.inc(downloaded_size, direction="download")
+                span.set(bytes=downloaded_size, content_length=content_length, status=response.status_code)
+                response.close()  # Return the connection to the pool even if we stopped early
     
-    def post_media_group(self, chat_id, text, media_list):
+    def _download_and_shrink(self, i, media_key, label, variant, report, source_media=None, stream=None):
+        """Re-encode the smallest variant under the Telegram limit, streamed or via temp files
+
+        stream=None follows STREAM_TRANSCODE.
+        """
+        source_media = source_media or {}
+        media_cache = get_media_cache()
+        fit_url = variant["url"] + "#fit"  # Cache key for the re-encoded result
+        cached = media_cache.lookup(media_key, fit_url)
+        if cached:
+            report("success", f"✓ {label} {i+1} (re-encoded) from cache ({cached['size']/1024/1024:.1f}MB)")
+            return dict(cached, type="video", media_key=media_key, cached=True)
+        
+        report("warning", f"{label} {i+1}: every quality is over 50MB - re-encoding the smallest to fit")
+        
+        if STREAM_TRANSCODE if stream is None else stream:
+            # Download -> ffmpeg -> upload through pipes; it starts when the upload reads it
+            tee = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4")
+            tee.close()
+            duration = (source_media.get("duration_ms") or 0) / 1000
+            width, height = variant_dimensions(source_media, variant)
+            return {
+                "type": "video",
+                "media_key": media_key,
+                "file": tee.name,  # Filled by the stream; cached once the upload succeeds
+                "stream": StreamingTranscode(
+                    variant["url"],
+                    sized_encode_args(duration, TELEGRAM_UPLOAD_LIMIT, width, height),
+                    tee_path=tee.name,
+                    owner=self.transcode_owner,
+                    priority=self.transcode_priority,
+                    timeout=transcode_timeout(duration),
+                    max_bytes=TELEGRAM_UPLOAD_LIMIT
+                ),
+                "cache_url": fit_url,
+                "size": 0
+            }
+        
+        try:
+            source = self._download_variant(i, variant["url"], report, TRANSCODE_SOURCE_LIMIT)
+        except Exception as e:
+            report("error", f"❌ {label} {i+1}: download failed: {str(e)}")
+            return None
+        if source is None:
+            report("error", f"❌ {label} {i+1}: too large even to re-encode")
+            return None
+        source = source["file"]
+        
+        output = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4")
+        output.close()
+        try:
+            fits = self.shrink_video(source, output.name, TELEGRAM_UPLOAD_LIMIT)
+        except JobCancelled:
+            os.unlink(output.name)
+            raise
+        finally:
+            os.unlink(source)
+        if not fits:
+            os.unlink(output.name)
+            report("error", f"❌ {label} {i+1}: could not re-encode under 50MB")
+            return None
+        
+        stored = media_cache.store(media_key, fit_url, output.name)
+        report("success", f"✓ {label} {i+1} re-encoded to {stored['size']/1024/1024:.1f}MB")
+        return dict(stored, type="video", media_key=media_key, cached=True)
+    
+    def bot_id(self):
+        token = self.config.get('TELEGRAM_BOT_TOKEN')
+        return token.split(":")[0] if token else None
+    
+    @metrics.timed("upload_album", ok=lambda result: result[0])
+    def post_media_group(self, chat_id, text, media_list, retry_uploads=True):
         if not self.config['TELEGRAM_BOT_TOKEN']:
-            st.error("No Telegram token configured")
+            self.last_error = "No Telegram token configured"
+            self.ui.error(self.last_error)
             return False, None
         
-        url = f"https://api.telegram.org/bot{self.config['TELEGRAM_BOT_TOKEN']}/sendMediaGroup"
+        url = f"{TELEGRAM_API_BASE}/bot{self.config['TELEGRAM_BOT_TOKEN']}/sendMediaGroup"
+        file_ids = get_file_id_store()
+        bot_id = self.bot_id()
         
+        body = None
         try:
-            files = []
+            uploads = []
             media_group = []
+            reused = []
+            streamed = {}  # Part name -> media entry of each streamed video
             
             for i, media in enumerate(media_list):
-                file_handle = open(media["file"], "rb")
-                files.append(file_handle)
-                
-                media_item = {
-                    "type": media["type"],
-                    "media": f"attach://file{i}"
-                }
+                file_id = media.get("file_id") or file_ids.get(bot_id, self._x_media_key(media), media.get("sha256"))
+                if file_id:
+                    # Telegram already has these bytes - send the reference, not the file
+                    media_item = {
+                        "type": media["type"],
+                        "media": file_id
+                    }
+                    reused.append(file_id)
+                else:
+                    if media.get("stream"):
+                        # Live ffmpeg output - encoded while it uploads
+                        uploads.append((f"file{i}", f"file{i}.mp4", media["stream"], "video/mp4"))
+                        streamed[f"file{i}"] = media
+                    elif media["type"] == "video":
+                        uploads.append((f"file{i}", f"file{i}.mp4", media["file"], "video/mp4"))
+                    else:
+                        uploads.append((f"file{i}", f"file{i}.jpg", media["file"], "image/jpeg"))
+                    media_item = {
+                        "type": media["type"],
+                        "media": f"attach://file{i}"
+                    }
                 if i == 0:
                     media_item["caption"] = text
                 media_group.append(media_item)
             
-            multipart_data = {
-                "chat_id": (None, str(chat_id)),
-                "media": (None, json.dumps(media_group))
-            }
+            if reused:
+                self.ui.write(f"Reusing {len(reused)} file(s) already on Telegram, uploading {len(uploads)}")
             
-            for i, file_handle in enumerate(files):
-                filename = f"file{i}.mp4" if media_list[i]["type"] == "video" else f"file{i}.jpg"
-                multipart_data[f"file{i}"] = (filename, file_handle)
+            # Streamed from disk with a known Content-Length - memory stays flat however big the videos are
+            upload_bar = self.ui.progress(0.0) if uploads else None
+            uploaded = [0]  # Bytes of the latest attempt
+            def show_upload(key, sent, total):
+                if total is None:
+                    # Streaming transcode: the final size isn't known yet
+                    upload_bar.progress(0.5, text=f"Encoding and uploading {sent/1024/1024:.1f}MB")
+                else:
+                    fraction = sent / total if total else 1.0
+                    upload_bar.progress(fraction, text=f"Uploading {sent/1024/1024:.1f}/{total/1024/1024:.1f}MB")
+            upload_view = UIAdapter(self.ui, EventBus(), show_upload if upload_bar else None)
             
-            with st.spinner("Posting to Telegram..."):
-                response = requests.post(url, files=multipart_data, timeout=120)
+            def upload_progress(sent, total):
+                # Called for every chunk the HTTP client reads; drawing is throttled by the adapter
+                uploaded[0] = sent
+                self._stage("uploading", sent / total if total else None)
+                upload_view.bus.progress("upload", sent, total)
+                upload_view.update()
             
-            for file_handle in files:
-                file_handle.close()
+            fields = [("chat_id", str(chat_id)), ("media", json.dumps(media_group))]
             
-            if response.status_code == 200:
+            def send_album():
+                # Built per attempt: the send queue calls this again after a 429
+                nonlocal body
+                if body is not None:
+                    body.close()
+                parts = []
+                for name, filename, source, content_type in uploads:
+                    if name in streamed:
+                        source = streamed[name]["stream"]
+                        if source.completed:
+                            source = source.tee_path  # Consumed by an earlier attempt - resend the copy it wrote
+                        elif source.started_at is not None:
+                            # Cut off by an earlier attempt or a failed cross-post target - encode it again
+                            source = streamed[name]["stream"] = source.restart()
+                    parts.append((name, filename, source, content_type))
+                with self._span("multipart build", parts=len(parts)) as span:
+                    body = MultipartStream(fields, parts, on_progress=upload_progress)
+                    span.set(bytes=body.length)  # None while a part is still being encoded
+                # Unknown length (a streamed part) goes out with chunked transfer encoding
+                data = body if body.length is not None else body.iter_chunks()
+                return http_client.post(url, data=data, headers={"Content-Type": body.content_type}, timeout=120)
+            
+            self._stage("uploading", 0.0 if uploads else None)
+            with self._span("telegram request", method="sendMediaGroup", items=len(media_group), uploads=len(uploads)) as span, \
+                    self.ui.spinner("Posting to Telegram..."):
+                response = get_send_queue().send(chat_id, send_album, cost=len(media_group))
+                span.set(status=response.status_code, bytes=uploaded[0])
+            upload_view.update(force=True)
+            body.close()
+            metrics.BYTES.inc(uploaded[0], direction="upload")
+            
+            try:
                 result = response.json()
-                if result.get("ok"):
-                    self.cleanup_media(media_list)
-                    st.success("Posted successfully!")
-                    return True, result["result"][0]["message_id"]
-                else:
-                    st.error(f"Telegram error: {result.get('description')}")
+            except ValueError:
+                result = {}
+            
+            if response.status_code == 200 and result.get("ok"):
+                self._finish_streams(media_list)
+                self.remember_file_ids(result["result"], media_list)
+                self.cleanup_media(media_list)
+                self.ui.success("Posted successfully!")
+                return True, result["result"][0]["message_id"]
+            
+            description = result.get("description") or response.text
+            if reused and retry_uploads and "file" in description.lower():
+                # Stale or foreign file_id - forget it and upload the bytes instead
+                self.ui.warning("Telegram rejected a saved file_id, uploading the media again")
+                for file_id in reused:
+                    file_ids.forget(file_id)
+                return self.post_media_group(chat_id, text, self._reload_media(media_list), retry_uploads=False)
+            
+            if response.status_code == 200:
+                self.last_error = f"Telegram error: {description}"
             else:
-                st.error(f"HTTP Error {response.status_code}: {response.text}")
+                self.last_error = f"HTTP Error {response.status_code}: {response.text}"
+            self.ui.error(self.last_error)
+        except StreamTooLarge as e:
+            if retry_uploads:
+                # The sized encode can't always hit its budget live; the two-step path checks the result
+                self.ui.warning(f"{e} - re-encoding to a file instead")
+                if self._unstream(media_list):
+                    return self.post_media_group(chat_id, text, media_list, retry_uploads=False)
+            self.last_error = f"Post failed: {str(e)}"
+            self.ui.error(self.last_error)
         except Exception as e:
-            st.error(f"Post failed: {str(e)}")
+            self.last_error = f"Post failed: {str(e)}"
+            self.ui.error(self.last_error)
+        finally:
+            if body is not None:
+                body.close()
         
         self.cleanup_media(media_list)
         return False, None
     
+    def _unstream(self, media_list):
+        """Swap each streamed video for a temp-file encode_to_size result; False if one fails
+
+        The entries are updated in place, so later cross-post targets get the file too.
+        """
+        view = UIAdapter(self.ui, EventBus())
+        for i, media in enumerate(media_list):
+            stream = media.get("stream")
+            if not stream:
+                continue
+            stream.close()
+            if media.get("file") and os.path.exists(media["file"]):
+                os.unlink(media["file"])  # The partial tee copy
+            item = self._download_and_shrink(
+                i, media["media_key"], "Video", {"url": stream.url}, view.bus, media.get("source"), stream=False
+            )
+            view.update(force=True)
+            if not item:
+                return False
+            kept = {key: media[key] for key in ("keep_file", "source") if key in media}
+            media.clear()
+            media.update(item, **kept)
+        return True
+    
+    def _finish_streams(self, media_list):
+        """Move the copy of each fully streamed video into the media cache"""
+        for media in media_list:
+            stream = media.get("stream")
+            if not stream:
+                continue
+            stream.close()
+            if stream.completed and stream.tee_path and os.path.exists(stream.tee_path):
+                stored = get_media_cache().store(media["media_key"], media["cache_url"], stream.tee_path)
+                media.update(stored, cached=True)
+            del media["stream"]
+    
+    def _x_media_key(self, media):
+        # Only real X media_keys identify media across tweets ("photo_0" style fallbacks don't)
+        return media.get("source", {}).get("media_key")
+    
+    def remember_file_ids(self, messages, media_list):
+        file_ids = get_file_id_store()
+        bot_id = self.bot_id()
+        for file_id, media in zip(file_ids_from_result(messages), media_list):
+            if file_id and not media.get("file_id"):
+                file_ids.put(bot_id, file_id, media["type"], self._x_media_key(media),
+                             media.get("sha256"), media.get("size", 0))
+            media["file_id"] = file_id
+    
+    def _reload_media(self, media_list):
+        """Media entries with real files again, for when a file_id was rejected"""
+        reloaded = []
+        for i, media in enumerate(media_list):
+            if media.get("file") and os.path.exists(media["file"]) and not media.get("stream"):
+                reloaded.append({k: v for k, v in media.items() if k != "file_id"})
+            elif media.get("source"):
+                item = self._download_item(i, media["source"], lambda level, message: None, reuse_file_ids=False)
+                if item:
+                    item["source"] = media["source"]
+                    reloaded.append(item)
+        return reloaded
+    
+    @metrics.timed("upload_text", ok=lambda result: result[0])
     def post_text(self, chat_id, text):
         if not self.config['TELEGRAM_BOT_TOKEN']:
             return False, None
         
-        url = f"https://api.telegram.org/bot{self.config['TELEGRAM_BOT_TOKEN']}/sendMessage"
+        url = f"{TELEGRAM_API_BASE}/bot{self.config['TELEGRAM_BOT_TOKEN']}/sendMessage"
         data = {
             "chat_id": chat_id,
             "text": text[:4096],
@@ -523,33 +1005,51 @@ class SecureXTelegramScheduler:
         }
         
         try:
-            with st.spinner("Posting to Telegram..."):
-                response = requests.post(url, data=data, timeout=30)
+            self._stage("uploading")
+            with self._span("telegram request", method="sendMessage", chars=len(data["text"])) as span, \
+                    self.ui.spinner("Posting to Telegram..."):
+                response = get_send_queue().send(chat_id, lambda: http_client.post(url, data=data, timeout=30))
+                span.set(status=response.status_code)
             if response.status_code == 200:
                 result = response.json()
                 if result.get("ok"):
-                    st.success("Posted successfully!")
+                    self.ui.success("Posted successfully!")
                     return True, result["result"]["message_id"]
                 else:
-                    st.error(f"Telegram error: {result.get('description')}")
+                    self.last_error = f"Telegram error: {result.get('description')}"
+                    self.ui.error(self.last_error)
             else:
-                st.error(f"HTTP Error {response.status_code}")
+                self.last_error = f"HTTP Error {response.status_code}"
+                self.ui.error(self.last_error)
         except Exception as e:
-            st.error(f"Post failed: {str(e)}")
+            self.last_error = f"Post failed: {str(e)}"
+            self.ui.error(self.last_error)
         return False, None
     
     def delete_post(self, chat_id, message_id):
         if not self.config['TELEGRAM_BOT_TOKEN']:
             return False
-        url = f"https://api.telegram.org/bot{self.config['TELEGRAM_BOT_TOKEN']}/deleteMessage"
+        url = f"{TELEGRAM_API_BASE}/bot{self.config['TELEGRAM_BOT_TOKEN']}/deleteMessage"
         try:
-            response = requests.post(url, data={"chat_id": chat_id, "message_id": message_id}, timeout=10)
+            response = get_send_queue().send(
+                chat_id, lambda: http_client.post(url, data={"chat_id": chat_id, "message_id": message_id}, timeout=10)
+            )
             return response.json().get("ok", False)
         except:
             return False
     
     def cleanup_media(self, media_list):
+        with self._span("cleanup", items=len(media_list)):
+            self._cleanup_media(media_list)
+    
+    def _cleanup_media(self, media_list):
         for media in media_list:
+            if media.get("keep_file"):
+                continue  # Still needed by a later cross-post target, live stream included
+            if media.get("stream"):
+                media["stream"].close()
+            if media.get("cached") or not media.get("file"):
+                continue  # Owned by the media cache, or never downloaded
             try:
                 if os.path.exists(media["file"]):
                     os.unlink(media["file"])
@@ -570,103 +1070,110 @@ class SecureXTelegramScheduler:
         else:
             return f"@{channel_input}"
     
-    def reencode_video(self, input_path, output_path):
-        """Re-encode video to standard format for Telegram compatibility"""
+    def prepare_video(self, i, label, path, report, sha256=None):
+        """Probe a downloaded video and skip, remux or re-encode it as needed
+
+        Returns (path, sha256) of the file to upload; sha256 is None if unknown.
+        Anything that goes wrong falls back to uploading the download as it is,
+        except a cancelled transcode, which raises JobCancelled.
+        """
         try:
-            st.write(f"Re-encoding video for optimal quality...")
-            
-            cmd = [
-                'ffmpeg',
-                '-i', input_path,
-                '-c:v', 'libx264',           # H.264 codec
-                '-preset', 'fast',           # Balance speed vs quality
-                '-crf', '23',                # Quality (lower = better, 23 is good)
-                '-vf', 'scale=trunc(iw/2)*2:trunc(ih/2)*2',  # Ensure even dimensions
-                '-c:a', 'aac',               # Audio codec
-                '-b:a', '128k',              # Audio bitrate
-                '-movflags', '+faststart',   # Enable streaming
-                '-y',                        # Overwrite output
-                output_path
-            ]
-            
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
-            
-            if result.returncode == 0:
-                # Check output file exists and has reasonable size
-                if os.path.exists(output_path):
-                    output_size = os.path.getsize(output_path)
-                    if output_size > 100000:  # At least 100KB
-                        st.success(f"Video re-encoded: {output_size/1024/1024:.1f}MB")
-                        return True
-                    else:
-                        st.error("Re-encoded video too small - may be corrupted")
-                        return False
-            else:
-                st.error(f"Re-encoding failed: {result.stderr[:200]}")
-                return False
-                
-        except subprocess.TimeoutExpired:
-            st.error("Video re-encoding timeout (>2 minutes)")
-            return False
+            with self._span("probe", bytes=os.path.getsize(path)) as span:
+                probe = probe_media(path, sha256)
+                action, reason = transcode_plan(probe)
+                span.set(action=action, codec=probe["video_codec"], duration=probe["duration"])
         except Exception as e:
-            st.error(f"Re-encoding error: {str(e)}")
-            return False
-        """Get video dimensions and duration using FFprobe (part of FFmpeg)"""
+            report("warning", f"{label} {i+1}: could not inspect video ({str(e)}), sending as downloaded")
+            return path, sha256
+        
+        if action == "skip":
+            report("debug", f"{label} {i+1}: {reason}")
+            return path, probe["sha256"]
+        
+        report("write", f"{label} {i+1}: {reason} - {'remuxing' if action == 'remux' else 're-encoding'}")
+        self._stage("transcoding")
+        output = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4")
+        output.close()
+        with self._span(action, bytes_in=os.path.getsize(path)) as span:
+            if action == "remux":
+                error = timed_remux(path, output.name, probe["duration"], self.transcode_owner, self.transcode_priority)
+            else:
+                error = self.reencode_video(
+                    path, output.name, capped_encode_args(probe["duration"], TELEGRAM_UPLOAD_LIMIT), probe["duration"]
+                )
+            span.set(bytes_out=os.path.getsize(output.name), error=error)
+        
+        if error is None and 100000 < os.path.getsize(output.name) <= TELEGRAM_UPLOAD_LIMIT:
+            os.unlink(path)
+            return output.name, None
+        
+        os.unlink(output.name)
+        if error == CANCELLED:
+            # Cancel means don't post - uploading the original instead would defeat it
+            os.unlink(path)
+            raise JobCancelled(f"{label} {i+1}: {action} cancelled")
+        report("warning", f"{label} {i+1}: {action} failed ({error or 'unusable output'}), sending as downloaded")
+        return path, probe["sha256"]
+    
+    @metrics.timed("shrink", ok=bool)
+    def shrink_video(self, input_path, output_path, max_bytes):
+        """Re-encode a video that is too big for Telegram to a size budget; True if the result fits
+
+        Raises JobCancelled if the encode was cancelled.
+        """
+        self._stage("transcoding")
         try:
-            cmd = [
-                'ffprobe',
-                '-v', 'error',
-                '-select_streams', 'v:0',
-                '-show_entries', 'stream=width,height,display_aspect_ratio:format=duration',
-                '-of', 'json',
-                video_path
-            ]
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
-            if result.returncode == 0:
-                data = json.loads(result.stdout)
-                width, height, duration = 0, 0, 0
-                
-                if 'streams' in data and len(data['streams']) > 0:
-                    stream = data['streams'][0]
-                    width = stream.get('width', 0)
-                    height = stream.get('height', 0)
-                    dar = stream.get('display_aspect_ratio', '')
-                    st.write(f"Video info: {width}x{height}, DAR: {dar}")
-                
-                if 'format' in data:
-                    duration = int(float(data['format'].get('duration', 0)))
-                    st.write(f"Duration: {duration}s")
-                
-                return width, height, duration
-        except Exception as e:
-            st.warning(f"Could not read video info: {str(e)}")
-        return None, None, None
+            with self._span("probe", bytes=os.path.getsize(input_path)):
+                probe = probe_media(input_path)
+        except Exception:
+            error = self.reencode_video(input_path, output_path)
+        else:
+            with self._span("encode to size", bytes_in=os.path.getsize(input_path), max_bytes=max_bytes) as span:
+                error = encode_to_size(
+                    input_path, output_path, probe, max_bytes, TWO_PASS_ENCODE,
+                    self.transcode_owner, self.transcode_priority
+                )
+                span.set(bytes_out=os.path.getsize(output_path), error=error)
+        if error == CANCELLED:
+            raise JobCancelled("Video conversion cancelled")
+        # The budget leaves headroom, so this only fails on a broken encode
+        return error is None and os.path.getsize(output_path) <= max_bytes
+    
+    @metrics.timed("transcode", ok=lambda error: error is None)
+    def reencode_video(self, input_path, output_path, encode_args=None, duration=0):
+        """Re-encode video to H.264/AAC for Telegram compatibility; returns an error or None"""
+        error = encode(input_path, output_path, encode_args, duration, self.transcode_owner, self.transcode_priority)
+        if error is None and os.path.getsize(output_path) <= 100000:  # At least 100KB
+            error = "re-encoded video too small - may be corrupted"
+        return error
     
     def post_now(self, chat_id, content_data):
         text = content_data["text"]
         media_list = content_data.get("media", [])
         
-        # Check user choices for long posts with media
-        post_media_choice = st.session_state.get("post_media_choice", True)
-        post_text_choice = st.session_state.get("post_text_choice", False)
+        # Check user choices for long posts with media (worker.py and post jobs pass them in content_data)
+        if "post_media" in content_data:
+            post_media_choice, post_text_choice = content_data["post_media"], content_data.get("post_text", False)
+        else:
+            post_media_choice = st.session_state.get("post_media_choice", True)
+            post_text_choice = st.session_state.get("post_text_choice", False)
         
         if media_list and len(text) > 1024:
             # Long text with media - handle based on user choices
             if post_media_choice and post_text_choice:
                 # Post both: media with truncated caption, then full text
-                st.write("Posting media with short caption...")
+                self.ui.write("Posting media with short caption...")
                 caption = text[:1000] + "..."
                 success1, msg_id1 = self.post_media_group(chat_id, caption, media_list)
                 
                 if success1:
-                    st.write("Posting full text separately...")
-                    time.sleep(1)
+                    self.ui.write("Posting full text separately...")
                     success2, msg_id2 = self.post_text(chat_id, text)
                     if success2:
-                        st.success("Posted media + full text in 2 messages")
+                        self.ui.success("Posted media + full text in 2 messages")
                         return True, msg_id1
                     else:
-                        st.warning("Media posted but text failed")
+                        self.ui.warning("Media posted but text failed")
                         return True, msg_id1
                 return False, None
                 
@@ -679,7 +1186,7 @@ class SecureXTelegramScheduler:
                 # Only post full text, no media
                 return self.post_text(chat_id, text)
             else:
-                st.error("No posting option selected")
+                self.ui.error("No posting option selected")
                 return False, None
         
         elif media_list:
@@ -689,6 +1196,156 @@ class SecureXTelegramScheduler:
             # Text only
             return self.post_text(chat_id, text)
     
+    def post_job(self, targets, text, media, tweet_id, post_media=True, post_text=False, user=None, fetch_seconds=0.0):
+        """work(job) for the job runner: download the tweet's media once, then post to every target"""
+        if not targets:
+            raise ValueError("A post needs at least one channel")
+        
+        def work(job):
+            poster = self.for_job(job)
+            # The trace starts with the Analyze fetch; the time spent editing before POST is left out
+            poster.trace = tracing.Trace(
+                "post", already_elapsed=fetch_seconds, job=job.id, tweet_id=tweet_id, user=user,
+                channels=[name for name, _ in targets]
+            )
+            if fetch_seconds:
+                poster.trace.add_span("tweet fetch", 0.0, fetch_seconds, tweet_id=tweet_id)
+            try:
+                media_data = poster.download_media_batch(media, tweet_id) if media else []
+                content_data = {"text": text, "media": media_data, "post_media": post_media, "post_text": post_text}
+                results = poster.cross_post(targets, content_data)
+            finally:
+                poster.trace.finish()
+            # Logged from the job, so it's recorded even if the page is closed meanwhile
+            activity = get_activity_store()
+            for result in results:
+                activity.record(
+                    user, result["channel"], result["chat_id"], result["message_id"],
+                    text[:50], len(media_data), result["error"]
+                )
+            return {
+                "results": results,
+                "preview": text[:50],
+                "media_count": len(media_data),
+                "error": None if any(r["message_id"] for r in results) else next(
+                    (r["error"] for r in results if r["error"]), "Nothing was posted"
+                )
+            }
+        return work
+    
+    def render_jobs(self):
+        """This session's post jobs: live stage progress while running, results when done"""
+        jobs = get_job_runner().jobs_for(self.session_id)
+        if not jobs:
+            return False
+        
+        active = [job for job in jobs if job["status"] in JOB_ACTIVE]
+        with st.expander(f"Post jobs ({len(active)} running)", expanded=bool(active)):
+            for job in jobs[:10]:
+                icon = {"done": "✅", "failed": "❌", "cancelled": "🚫", "queued": "⏳"}.get(job["status"], "🔄")
+                st.markdown(f"{icon} **{job['label']}** - {job['status']}")
+                if job["status"] in JOB_ACTIVE:
+                    fraction = job["progress"].get(job["status"])
+                    st.progress(fraction or 0.0, text=job["detail"] or job["status"])
+                elif job["result"] and len(job["result"]["results"]) > 1:
+                    st.table([
+                        {"Channel": r["channel"], "Chat ID": r["chat_id"], "Message ID": r["message_id"] or "", "Error": r["error"] or ""}
+                        for r in job["result"]["results"]
+                    ])
+                elif job["error"]:
+                    st.caption(job["error"][:200])
+                if st.checkbox("Show log", key=f"job_log_{job['id']}"):
+                    st.code("\n".join(f"{level}: {message}" for _, level, message in job["log"][-40:]))
+        return bool(active)
+    
+    def render_waterfall(self, trace):
+        """One trace's spans as bars on a shared time axis, nested spans indented under their parent"""
+        children = {}
+        for span in trace["spans"]:
+            children.setdefault(span["parent"], []).append(span)
+        rows = []
+        seen = set()
+        def add(parent, depth):
+            for span in sorted(children.get(parent, []), key=lambda s: s["start"]):
+                label = f"{'· ' * depth}{span['name']}"
+                if label in seen:
+                    label = f"{label} ({span['id']})"  # The axis needs a distinct label per bar
+                seen.add(label)
+                details = ", ".join(f"{k}={v}" for k, v in span["attrs"].items() if v not in (None, ""))
+                rows.append({
+                    "span": label,
+                    "start": span["start"],
+                    "end": span["start"] + span["duration"],
+                    "duration": round(span["duration"], 3),
+                    "details": details[:300]
+                })
+                add(span["id"], depth + 1)
+        add(None, 0)
+        if not rows:
+            st.caption("No spans recorded")
+            return
+        
+        chart = alt.Chart(alt.Data(values=rows)).mark_bar().encode(
+            x=alt.X("start:Q", title="seconds"),
+            x2="end:Q",
+            y=alt.Y("span:N", sort=None, title=None),
+            tooltip=["span:N", "duration:Q", "details:N"]
+        ).properties(height=max(120, 22 * len(rows)))
+        st.altair_chart(chart, use_container_width=True)
+        st.dataframe(
+            [{"Span": r["span"], "Start": f"{r['start']:.2f}s", "Took": f"{r['duration']:.2f}s", "Details": r["details"]} for r in rows],
+            use_container_width=True, hide_index=True
+        )
+    
+    def cross_post(self, targets, content_data, concurrency=None):
+        """Post the same content to several (channel name, chat_id) targets
+
+        Posts go one at a time until one succeeds - that one uploads the media and
+        records its file_ids - then the rest go out concurrently, re-sending the
+        file_ids. Returns one {"channel", "chat_id", "message_id", "error"} per target.
+        """
+        media_list = content_data.get("media", [])
+        for media in media_list:
+            media["keep_file"] = True  # Later targets may still need the bytes
+        results = []
+        remaining = list(targets)
+        while remaining:
+            name, chat_id = remaining.pop(0)
+            results.append(self._post_to(name, chat_id, content_data))
+            if results[-1]["message_id"]:
+                break
+        
+        if remaining:
+            # Lets Streamlit output from the pool threads reach the page (None inside a post job)
+            ctx = get_script_run_ctx(suppress_warning=True)
+            workers = min(len(remaining), concurrency or CROSS_POST_CONCURRENCY)
+            with ThreadPoolExecutor(max_workers=workers, initializer=lambda: ctx and add_script_run_ctx(ctx=ctx)) as pool:
+                results += list(pool.map(lambda target: self._post_to(*target, content_data), remaining))
+        
+        for media in media_list:
+            media.pop("keep_file", None)
+        self.cleanup_media(media_list)
+        return results
+    
+    def _post_to(self, name, chat_id, content_data):
+        # A copy per target so concurrent posts don't overwrite each other's last_error
+        poster = copy.copy(self)
+        poster.last_error = None
+        with self._span(f"post to {name}", chat_id=chat_id) as span:
+            try:
+                if poster.job:
+                    poster.job.raise_if_cancelled()  # Targets not yet started are skipped
+                success, message_id = poster.post_now(chat_id, content_data)
+            except Exception as e:
+                success, message_id, poster.last_error = False, None, str(e)
+            span.set(message_id=message_id if success else None, error=None if success else poster.last_error)
+        return {
+            "channel": name,
+            "chat_id": chat_id,
+            "message_id": message_id if success else None,
+            "error": None if success else (poster.last_error or "Post failed")
+        }
+    
     def run(self):
         st.title("X to Telegram Scheduler")
         st.markdown(f"**Logged in as:** {st.session_state.current_user}")
@@ -702,26 +1359,26 @@ class SecureXTelegramScheduler:
                 st.subheader(f"Edit: {st.session_state.editing_channel}")
                 
                 old_name = st.session_state.editing_channel
+                if old_name not in st.session_state.channels:
+                    # Deleted by another team member meanwhile
+                    del st.session_state.editing_channel
+                    st.rerun()
                 old_cid = st.session_state.channels[old_name]
                 old_link = st.session_state.channel_links.get(old_name, "")
+                old_tags = (get_channel_store(self.channels_file).get(old_name) or {}).get("tags", [])
                 
                 new_name = st.text_input("Name", value=old_name, key="edit_name")
                 new_cid = st.text_input("ID", value=old_cid, key="edit_cid")
                 new_link = st.text_input("Custom Link", value=old_link, key="edit_link")
+                new_tags = st.text_input("Tags", value=", ".join(old_tags), key="edit_tags")
                 
                 col_save, col_cancel = st.columns(2)
                 with col_save:
                     if st.button("Save Changes", type="primary", use_container_width=True):
-                        # Delete old entry if name changed
-                        if new_name != old_name:
-                            del st.session_state.channels[old_name]
-                            if old_name in st.session_state.channel_links:
-                                del st.session_state.channel_links[old_name]
-                        
-                        # Save new values
-                        st.session_state.channels[new_name] = self.format_channel_id(new_cid)
-                        st.session_state.channel_links[new_name] = new_link if new_link else ""
-                        self.save_channels()
+                        # Replaces the old entry if the name changed
+                        get_channel_store(self.channels_file).put(
+                            new_name, self.format_channel_id(new_cid), new_link, new_tags, replaces=old_name
+                        )
                         
                         # Update selected channel if it was the one being edited
                         if "selected_channel" in st.session_state and st.session_state.channel_name == old_name:
@@ -741,10 +1398,7 @@ class SecureXTelegramScheduler:
                 # Delete option
                 st.markdown("---")
                 if st.button("Delete Channel", type="secondary", use_container_width=True):
-                    del st.session_state.channels[old_name]
-                    if old_name in st.session_state.channel_links:
-                        del st.session_state.channel_links[old_name]
-                    self.save_channels()
+                    get_channel_store(self.channels_file).delete(old_name)
                     
                     # Clear selection if deleted channel was selected
                     if "selected_channel" in st.session_state and st.session_state.channel_name == old_name:
@@ -764,11 +1418,10 @@ class SecureXTelegramScheduler:
             name = st.text_input("Name", key="ch_name", placeholder="My Channel")
             cid = st.text_input("ID", key="ch_id", placeholder="-100123456789")
             link = st.text_input("Custom Link", key="ch_link", placeholder="https://t.me/channel")
+            tags = st.text_input("Tags", key="ch_tags", placeholder="news, sports")
             
             if st.button("Save", use_container_width=True) and name and cid:
-                st.session_state.channels[name] = self.format_channel_id(cid)
-                st.session_state.channel_links[name] = link if link else ""
-                self.save_channels()
+                get_channel_store(self.channels_file).put(name, self.format_channel_id(cid), link, tags)
                 st.success(f"Saved {name}")
                 time.sleep(0.5)
                 st.rerun()
@@ -776,44 +1429,62 @@ class SecureXTelegramScheduler:
             st.markdown("---")
             st.subheader("Your Channels")
             
-            # Add search/filter for channels
-            if len(st.session_state.channels) > 5:
-                search_channel = st.text_input("🔍 Search channels", placeholder="Type to filter...", key="search_ch")
-            else:
-                search_channel = ""
+            # Only one page of matches is drawn, however many channels there are
+            search_channel = st.text_input(
+                "🔍 Search channels", placeholder="Name, chat ID or #tag", key="search_ch"
+            )
+            if st.session_state.get("channel_search") != search_channel:
+                st.session_state.channel_search = search_channel
+                st.session_state.channel_page = 0
+            page = st.session_state.get("channel_page", 0)
             
-            if st.session_state.channels:
-                # Filter channels based on search
-                filtered_channels = {
-                    name: cid for name, cid in st.session_state.channels.items()
-                    if search_channel.lower() in name.lower()
-                } if search_channel else st.session_state.channels
-                
-                if not filtered_channels and search_channel:
-                    st.info(f"No channels match '{search_channel}'")
-                
-                for name, cid in filtered_channels.items():
+            page_channels, total = get_channel_store(self.channels_file).search(
+                search_channel, offset=page * CHANNELS_PER_PAGE, limit=CHANNELS_PER_PAGE
+            )
+            if not page_channels and page > 0:
+                # The page emptied under us (deletes elsewhere); go back to the first
+                st.session_state.channel_page = 0
+                st.rerun()
+            
+            if page_channels:
+                for channel in page_channels:
                     # Compact single-line display per channel
-                    st.write(f"**{name}**")
-                    st.caption(f"{cid[:25]}...")
+                    st.write(f"**{channel['name']}**")
+                    st.caption(f"{channel['chat_id'][:25]}..." + (f"  #{' #'.join(channel['tags'])}" if channel["tags"] else ""))
                     
-                    # Buttons with unique keys
-                    select_clicked = st.button("✓ Select", key=f"select_btn_{name}", help=f"Select {name}", use_container_width=True)
+                    # Keyed by the stable id, so a rename keeps the same widgets
+                    select_clicked = st.button("✓ Select", key=f"select_btn_{channel['id']}", help=f"Select {channel['name']}", use_container_width=True)
                     if select_clicked:
-                        st.session_state.selected_channel = cid
-                        st.session_state.channel_name = name
+                        st.session_state.selected_channel = channel["chat_id"]
+                        st.session_state.channel_name = channel["name"]
                         st.rerun()
                     
-                    edit_clicked = st.button("✏️ Edit", key=f"edit_btn_{name}", help=f"Edit {name}", use_container_width=True)
+                    edit_clicked = st.button("✏️ Edit", key=f"edit_btn_{channel['id']}", help=f"Edit {channel['name']}", use_container_width=True)
                     if edit_clicked:
-                        st.session_state.editing_channel = name
+                        st.session_state.editing_channel = channel["name"]
                         st.rerun()
                     
                     # Show link if exists
-                    if st.session_state.channel_links.get(name):
-                        st.caption(f"🔗 {st.session_state.channel_links[name][:30]}...")
+                    if channel["link"]:
+                        st.caption(f"🔗 {channel['link'][:30]}...")
                     
                     st.markdown("---")
+                
+                pages = (total + CHANNELS_PER_PAGE - 1) // CHANNELS_PER_PAGE
+                if pages > 1:
+                    col_prev, col_page, col_next = st.columns([1, 2, 1])
+                    with col_prev:
+                        if st.button("◀", key="channel_prev", disabled=page == 0):
+                            st.session_state.channel_page = page - 1
+                            st.rerun()
+                    with col_page:
+                        st.caption(f"Page {page + 1}/{pages} · {total} channels")
+                    with col_next:
+                        if st.button("▶", key="channel_next", disabled=page >= pages - 1):
+                            st.session_state.channel_page = page + 1
+                            st.rerun()
+            elif search_channel:
+                st.info(f"No channels match '{search_channel}'")
             else:
                 st.info("No channels yet")
             
@@ -827,10 +1498,16 @@ class SecureXTelegramScheduler:
             
             # Show selected channel prominently at the top
             if "selected_channel" in st.session_state:
+                # Follow renames made by other team members; the chat_id is what we post to
+                selected = get_channel_store(self.channels_file).by_chat_id(st.session_state.selected_channel)
+                if selected:
+                    st.session_state.channel_name = selected["name"]
                 st.success(f"📢 Posting to: **{st.session_state.channel_name}** ({st.session_state.selected_channel})")
             else:
                 st.warning("⚠️ No channel selected - Please select a channel from the sidebar")
             
+            jobs_running = self.render_jobs()
+            
             st.markdown("---")
             
             col1, col2 = st.columns([1, 2])
@@ -846,19 +1523,26 @@ class SecureXTelegramScheduler:
                     cancel_btn = st.button("Cancel", type="secondary", use_container_width=True)
                 
                 if cancel_btn:
+                    # Stop this session's unfinished post jobs and only their video conversions
+                    cancelled = get_job_runner().cancel(self.session_id)
+                    stopped = sum(get_transcode_pool().cancel(job_id) for job_id in cancelled)
                     # Clear all tweet data
                     for key in ["tweet_data", "original_text", "tweet_url"]:
                         if key in st.session_state:
                             del st.session_state[key]
-                    st.success("Cancelled - form cleared")
+                    done = f", cancelled {len(cancelled)} post jobs" if cancelled else ""
+                    done += f", stopped {stopped} video conversions" if stopped else ""
+                    st.success(f"Cancelled - form cleared{done}")
                     time.sleep(0.5)
                     st.rerun()
                 
                 if analyze_btn:
                     tweet_id = self.extract_tweet_id(x_url)
                     if tweet_id:
+                        fetch_started = time.perf_counter()
                         tweet_data = self.fetch_tweet(tweet_id)
                         if tweet_data:
+                            st.session_state.tweet_fetch_seconds = time.perf_counter() - fetch_started
                             st.session_state.tweet_data = tweet_data
                             st.session_state.original_text = tweet_data["data"].get("text", "")
                             st.session_state.tweet_url = x_url
@@ -866,6 +1550,55 @@ class SecureXTelegramScheduler:
                             st.rerun()
                     else:
                         st.error("Invalid URL format")
+                
+                with st.expander("Bulk analyze"):
+                    bulk_urls = st.text_area("Paste X URLs (one per line)", key="bulk_urls", height=120)
+                    if st.button("Analyze all", use_container_width=True):
+                        tweet_ids = [self.extract_tweet_id(u) for u in bulk_urls.split()]
+                        tweet_ids = list(dict.fromkeys(t for t in tweet_ids if t))
+                        if tweet_ids:
+                            with st.spinner(f"Fetching {len(tweet_ids)} tweets..."):
+                                results = self.fetch_tweets(tweet_ids)
+                            st.session_state.bulk_tweets = [results[t] for t in tweet_ids if t in results]
+                            st.success(f"Fetched {len(st.session_state.bulk_tweets)}/{len(tweet_ids)} tweets")
+                        else:
+                            st.error("No valid X URLs found")
+                    
+                    for i, bulk_tweet in enumerate(st.session_state.get("bulk_tweets", [])):
+                        media_count = len(bulk_tweet.get("includes", {}).get("media", []))
+                        st.caption(f"{bulk_tweet['data'].get('text', '')[:80]} ({media_count} media)")
+                        if st.button("Load", key=f"bulk_load_{i}_{bulk_tweet['data']['id']}", use_container_width=True):
+                            st.session_state.tweet_data = bulk_tweet
+                            st.session_state.original_text = bulk_tweet["data"].get("text", "")
+                            st.session_state.tweet_url = f"https://x.com/i/status/{bulk_tweet['data']['id']}"
+                            st.rerun()
+                    
+                    # Queue the whole batch, spaced out, for worker.py
+                    if st.session_state.get("bulk_tweets") and os.getenv("DATABASE_URL") and "selected_channel" in st.session_state:
+                        st.markdown("---")
+                        bulk_start = st.time_input("First post at", value=(datetime.now() + timedelta(hours=1)).time(), key="bulk_start")
+                        bulk_gap = st.number_input("Minutes between posts", min_value=1, value=60, key="bulk_gap")
+                        if st.button(f"Schedule all to {st.session_state.channel_name}", use_container_width=True):
+                            first_time = datetime.combine(datetime.now().date(), bulk_start)
+                            if first_time < datetime.now():
+                                first_time += timedelta(days=1)
+                            try:
+                                conn = get_connection()
+                                for i, bulk_tweet in enumerate(st.session_state.bulk_tweets):
+                                    text = re.sub(r'https?://(twitter\.com|x\.com|t\.co)/\S+', '', bulk_tweet["data"].get("text", "")).strip()
+                                    enqueue_post(
+                                        conn,
+                                        st.session_state.selected_channel,
+                                        text,
+                                        bulk_tweet.get("includes", {}).get("media", []),
+                                        first_time + timedelta(minutes=bulk_gap * i),
+                                        channel_name=st.session_state.channel_name,
+                                        user_name=st.session_state.current_user
+                                    )
+                                conn.close()
+                                st.success(f"Scheduled {len(st.session_state.bulk_tweets)} posts")
+                            except Exception as e:
+                                st.error(f"Could not schedule: {str(e)}")
             
             with col2:
                 if "tweet_data" in st.session_state:
@@ -873,8 +1606,8 @@ class SecureXTelegramScheduler:
                     tweet = st.session_state.tweet_data["data"]
                     
                     if "includes" in st.session_state.tweet_data and "users" in st.session_state.tweet_data["includes"]:
-                        user = next((u for u in st.session_state.tweet_data["includes"]["users"] 
-                                   if u["id"] == tweet["author_id"]), None)
+                        _, users_by_id = index_includes(st.session_state.tweet_data["includes"])
+                        user = users_by_id.get(tweet.get("author_id"))
                         if user:
                             st.markdown(f"**{user['name']}** @{user['username']}")
                     
@@ -942,6 +1675,9 @@ class SecureXTelegramScheduler:
                     if "selected_channel" in st.session_state:
                         st.success(f"{st.session_state.channel_name}")
                         st.caption(f"ID: {st.session_state.selected_channel}")
+                        other_channels = [n for n in st.session_state.channels if n != st.session_state.channel_name]
+                        if other_channels:
+                            st.multiselect("Also post to", other_channels, key="cross_post_channels")
                     else:
                         st.warning("No channel selected")
                 
@@ -988,7 +1724,13 @@ class SecureXTelegramScheduler:
                         st.info(f"**{media_count}** media items will be attached")
                 
                 if "selected_channel" in st.session_state:
-                    if st.button("POST TO TELEGRAM", type="primary", use_container_width=True):
+                    targets = [(st.session_state.channel_name, st.session_state.selected_channel)] + [
+                        (n, st.session_state.channels[n])
+                        for n in st.session_state.get("cross_post_channels", [])
+                        if n in st.session_state.channels and n != st.session_state.channel_name
+                    ]
+                    post_label = "POST TO TELEGRAM" if len(targets) == 1 else f"POST TO {len(targets)} CHANNELS"
+                    if st.button(post_label, type="primary", use_container_width=True):
                         # Check if text is too long and no options selected
                         text_too_long = st.session_state.get("text_too_long", False)
                         post_media = st.session_state.get("post_media_choice", True)
@@ -997,103 +1739,221 @@ class SecureXTelegramScheduler:
                         if text_too_long and not post_media and not post_text:
                             st.error("Please select at least one posting option above")
                         else:
-                            st.write("=" * 50)
-                            st.write("**STARTING POST PROCESS**")
-                            st.write("=" * 50)
-                        
-                        with st.spinner("Processing..."):
-                            media_data = []
-                            
-                            # Check if there's media to download
-                            if "includes" in st.session_state.tweet_data and "media" in st.session_state.tweet_data["includes"]:
-                                st.write(f"**Found {len(st.session_state.tweet_data['includes']['media'])} media items in tweet**")
-                                
-                                for idx, media in enumerate(st.session_state.tweet_data["includes"]["media"]):
-                                    st.write(f"Media {idx+1} type: {media.get('type', 'unknown')}")
-                                
-                                media_data = self.download_media_batch(
-                                    st.session_state.tweet_data["includes"]["media"],
-                                    st.session_state.tweet_data["data"]["id"]
+                            # Runs in the background; the form is free for the next tweet straight away
+                            get_job_runner().submit(
+                                self.session_id,
+                                f"{final_text[:40] or 'Media post'} → {', '.join(name for name, _ in targets)}",
+                                self.post_job(
+                                    targets,
+                                    final_text,
+                                    st.session_state.tweet_data.get("includes", {}).get("media", []),
+                                    st.session_state.tweet_data["data"]["id"],
+                                    post_media,
+                                    post_text,
+                                    user=st.session_state.current_user,
+                                    fetch_seconds=st.session_state.get("tweet_fetch_seconds", 0.0)
                                 )
-                                
-                                st.write(f"**Download complete: {len(media_data)} items ready**")
-                            else:
-                                st.write("**No media to download - text only post**")
-                            
-                            content_data = {
-                                "text": final_text,
-                                "media": media_data,
-                                "channel_name": st.session_state.channel_name
-                            }
-                            
-                            st.write("**Attempting to post...**")
-                            success, message_id = self.post_now(st.session_state.selected_channel, content_data)
+                            )
+                            del st.session_state.tweet_data
+                            del st.session_state.original_text
+                            if "tweet_url" in st.session_state:
+                                del st.session_state.tweet_url
+                            st.rerun()
+                    
+                    # Scheduled posts are picked up by worker.py
+                    if os.getenv("DATABASE_URL"):
+                        with st.expander("Schedule for later"):
+                            col_date, col_time = st.columns(2)
+                            with col_date:
+                                post_date = st.date_input("Date", value=datetime.now().date(), key="schedule_date")
+                            with col_time:
+                                post_time = st.time_input("Time", value=(datetime.now() + timedelta(hours=1)).time(), key="schedule_clock")
                             
-                            st.write("=" * 50)
-                            if success:
-                                st.write("**POST COMPLETED SUCCESSFULLY**")
-                                if "activity_log" not in st.session_state:
-                                    st.session_state.activity_log = []
-                                st.session_state.activity_log.append({
-                                    "user": st.session_state.current_user,
-                                    "channel": st.session_state.channel_name,
-                                    "time": datetime.now(),
-                                    "preview": final_text[:50],
-                                    "media_count": len(media_data),
-                                    "message_id": message_id
-                                })
-                                
-                                del st.session_state.tweet_data
-                                del st.session_state.original_text
-                                if "tweet_url" in st.session_state:
-                                    del st.session_state.tweet_url
-                                
-                                time.sleep(2)
-                                st.rerun()
-                            else:
-                                st.write("**POST FAILED - SEE ERRORS ABOVE**")
+                            if st.button("SCHEDULE POST", use_container_width=True):
+                                schedule_time = datetime.combine(post_date, post_time)
+                                try:
+                                    conn = get_connection()
+                                    post_id = enqueue_post(
+                                        conn,
+                                        st.session_state.selected_channel,
+                                        final_text,
+                                        st.session_state.tweet_data.get("includes", {}).get("media", []),
+                                        schedule_time,
+                                        channel_name=st.session_state.channel_name,
+                                        user_name=st.session_state.current_user
+                                    )
+                                    conn.close()
+                                    st.success(f"Scheduled post #{post_id} for {schedule_time.strftime('%Y-%m-%d %H:%M')}")
+                                except Exception as e:
+                                    st.error(f"Could not schedule: {str(e)}")
                 else:
                     st.warning("Please select a channel first")
         
         with tab2:
             st.header("Activity Log")
             
-            if "activity_log" in st.session_state and st.session_state.activity_log:
-                st.info(f"**Total posts:** {len(st.session_state.activity_log)}")
+            activity_store = get_activity_store()
+            unwritten, write_error = activity_store.backlog()
+            if write_error:
+                st.warning(f"{unwritten} activity rows are waiting to be saved - last write failed: {write_error}")
+            col_user, col_channel = st.columns(2)
+            with col_user:
+                user_filter = st.selectbox("User", ["Everyone"] + activity_store.users(), key="activity_user")
+            with col_channel:
+                channel_filter = st.selectbox("Channel", ["All channels"] + list(st.session_state.channels), key="activity_channel")
+            user = None if user_filter == "Everyone" else user_filter
+            chat_id = st.session_state.channels.get(channel_filter)
+            
+            # Keyset pagination: a stack of (created_at, id) cursors, one per page visited
+            if st.session_state.get("activity_filters") != (user, chat_id):
+                st.session_state.activity_filters = (user, chat_id)
+                st.session_state.activity_cursors = [None]
+            cursors = st.session_state.setdefault("activity_cursors", [None])
+            activities, next_cursor = activity_store.page(user, chat_id, before=cursors[-1], limit=20)
+            
+            if activities:
+                st.info(f"**Total posts:** {activity_store.count(user, chat_id)}")
                 
-                for activity in reversed(st.session_state.activity_log[-20:]):
+                for activity in activities:
                     with st.container():
                         col1, col2, col3, col4 = st.columns([2, 3, 1, 1])
                         
+                        channel = get_channel_store(self.channels_file).by_chat_id(activity['chat_id'])
+                        
                         with col1:
-                            st.write(f"**{activity['channel']}**")
+                            st.write(f"**{channel['name'] if channel else activity['channel']}**")
                             st.caption(f"{activity['user']}")
                         
                         with col2:
                             st.write(f"{activity['preview']}...")
-                            if activity.get('media_count', 0) > 0:
+                            if activity['media_count'] > 0:
                                 st.caption(f"{activity['media_count']} media items")
+                            if activity['error']:
+                                st.caption(f"❌ {activity['error'][:100]}")
                         
                         with col3:
-                            st.write(f"{activity['time'].strftime('%H:%M')}")
+                            st.write(f"{datetime.fromtimestamp(activity['created_at']).strftime('%m-%d %H:%M')}")
                         
                         with col4:
-                            if activity.get('message_id') and "selected_channel" in st.session_state:
-                                if st.button("Delete", key=f"del_{activity['message_id']}", help="Delete post"):
-                                    if self.delete_post(st.session_state.selected_channel, activity['message_id']):
+                            if activity['deleted_at']:
+                                st.caption("Deleted")
+                            elif activity['message_id']:
+                                # The row's own chat, whichever channel is selected now
+                                if st.button("Delete", key=f"del_{activity['id']}", help="Delete post"):
+                                    if self.delete_post(activity['chat_id'], activity['message_id']):
+                                        activity_store.mark_deleted(activity['id'])
                                         st.success("Deleted!")
                                         time.sleep(0.5)
                                         st.rerun()
                         
                         st.markdown("---")
                 
-                col_clear1, col_clear2 = st.columns([3, 1])
-                with col_clear2:
-                    if st.button("Clear Log", type="secondary", use_container_width=True):
-                        st.session_state.activity_log = []
+                col_newer, col_page, col_older = st.columns([1, 2, 1])
+                with col_newer:
+                    if st.button("◀ Newer", key="activity_newer", disabled=len(cursors) == 1):
+                        cursors.pop()
+                        st.rerun()
+                with col_page:
+                    st.caption(f"Page {len(cursors)}")
+                with col_older:
+                    if st.button("Older ▶", key="activity_older", disabled=next_cursor is None):
+                        cursors.append(next_cursor)
                         st.rerun()
             else:
                 st.info("No activity yet")
+            
+            with st.expander("Post traces"):
+                traces = tracing.recent_traces(20)
+                if traces:
+                    by_label = {
+                        f"{datetime.fromtimestamp(t['started_at']).strftime('%m-%d %H:%M:%S')} · {t['name']} → "
+                        f"{', '.join(str(c) for c in t['attrs'].get('channels', []))[:60]} · {t['duration']:.1f}s": t
+                        for t in traces
+                    }
+                    self.render_waterfall(by_label[st.selectbox("Trace", list(by_label), key="trace_pick")])
+                    st.caption(f"Every trace is kept as one JSON line in {tracing.TRACE_FILE}")
+                else:
+                    st.caption("No posts traced yet")
+            
+            with st.expander("Connections"):
+                pool_stats = http_client.pool_stats()
+                if pool_stats:
+                    st.dataframe([{
+                        "Host": p["host"],
+                        "Requests": p["requests"],
+                        "Connections opened": p["connections"],
+                        "Reused": f"{p['reuse']:.0%}"
+                    } for p in pool_stats], use_container_width=True, hide_index=True)
+                else:
+                    st.caption("No requests made yet")
+            
+            with st.expander("Media cache"):
+                stats = get_media_cache().stats()
+                col_a, col_b, col_c = st.columns(3)
+                col_a.metric("Hit rate", f"{stats['hit_rate']:.0%}", f"{stats['hits']} hits / {stats['misses']} misses")
+                col_b.metric("Downloads avoided", f"{stats['bytes_served']/1024/1024:.0f} MB", f"{stats['evictions']} evicted")
+                col_c.metric("On disk", f"{stats['bytes']/1024/1024:.0f} MB", f"{stats['files']} files of {stats['max_bytes']/1024/1024:.0f} MB budget")
+            
+            with st.expander("Telegram send queue"):
+                stats = get_send_queue().stats()
+                col_a, col_b, col_c = st.columns(3)
+                col_a.metric("Backlog", stats["backlog"], f"{stats['in_flight']} sending, {stats['chats_on_hold']} chats on hold", delta_color="off")
+                col_b.metric("Queue latency", f"{stats['avg_latency']:.1f}s", f"p95 {stats['p95_latency']:.1f}s, oldest {stats['oldest_wait']:.0f}s", delta_color="off")
+                col_c.metric("Sent", stats["sent"], f"{stats['rate_limited']} rate limited (last retry_after {stats['last_retry_after']:.0f}s)", delta_color="off")
+            
+            with st.expander("Transcoding"):
+                stats = get_transcode_pool().stats()
+                col_a, col_b, col_c = st.columns(3)
+                col_a.metric("Queued", stats["queued"], f"{stats['running']} running on {stats['workers']} workers")
+                col_b.metric("Avg wait", f"{stats['avg_wait']:.1f}s", f"max {stats['max_wait']:.1f}s", delta_color="off")
+                col_c.metric("Done", stats["completed"], f"{stats['failed']} failed, {stats['timeouts']} timed out, {stats['cancelled']} cancelled", delta_color="off")
+                st.caption(f"{stats['threads']} ffmpeg threads per job")
+            
+            with st.expander("Telegram file reuse"):
+                stats = get_file_id_store().stats()
+                col_a, col_b = st.columns(2)
+                col_a.metric("Saved file_ids", stats["file_ids"], f"{stats['reuses']} re-sends without upload")
+                col_b.metric("Upload avoided", f"{stats['bytes_saved']/1024/1024:.0f} MB")
+            
+            with st.expander("Tweet cache"):
+                stats = get_tweet_cache().stats()
+                col_a, col_b, col_c = st.columns(3)
+                col_a.metric("Hit rate", f"{stats['hit_rate']:.0%}", f"{stats['hits']} hits / {stats['misses']} misses")
+                col_b.metric("Saved", f"{stats['bytes_saved']/1024:.0f} KB", f"{stats['coalesced']} shared requests")
+                col_c.metric("Cached tweets", stats["entries"], f"{stats['bytes']/1024:.0f} KB on disk")
+            
+            if st.session_state.current_user == "Admin":
+                with st.expander("Pipeline metrics"):
+                    stages = metrics.STAGE_SECONDS.snapshot()
+                    errors = metrics.STAGE_ERRORS.values()
+                    if stages:
+                        st.dataframe([{
+                            "Stage": stage,
+                            "Calls": s["count"],
+                            "Failed": errors.get((stage,), 0),
+                            "p50": f"{s['p50']:.2f}s",
+                            "p95": f"{s['p95']:.2f}s",
+                            "Avg": f"{s['sum'] / s['count']:.2f}s"
+                        } for (stage,), s in sorted(stages.items())], use_container_width=True, hide_index=True)
+                    else:
+                        st.caption("Nothing timed yet")
+                    transferred = metrics.BYTES.values()
+                    col_a, col_b = st.columns(2)
+                    col_a.metric("Downloaded", f"{transferred.get(('download',), 0)/1024/1024:.0f} MB")
+                    col_b.metric("Uploaded", f"{transferred.get(('upload',), 0)/1024/1024:.0f} MB")
+                    responses = metrics.HTTP_RESPONSES.values()
+                    if responses:
+                        st.dataframe([
+                            {"Host": host, "Status": status, "Responses": count}
+                            for (host, status), count in sorted(responses.items())
+                        ], use_container_width=True, hide_index=True)
+                    if os.getenv("METRICS_PORT"):
+                        st.caption(f"Prometheus: :{os.getenv('METRICS_PORT')}/metrics")
+        
+        if jobs_running:
+            # Poll: cheap snapshot reads, and any click interrupts the wait
+            time.sleep(JOB_POLL_SECONDS)
+            st.rerun()
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,96 @@
+# Serial vs concurrent download_media_batch against a local, deliberately slow server
+#
+#   python benchmarks/bench_download_concurrency.py --items 4 --size-mb 4 --rate-mbps 16
+#
+# Each video is served at --rate-mbps, so the serial time is roughly
+# items * size / rate and a good concurrent run approaches size / rate. The
+# media cache lives in a temp directory and every pass asks for new URLs and
+# media keys, so each pass really downloads.
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def make_handler(size, rate):
+    block = os.urandom(64 * 1024)
+
+    class SlowHandler(BaseHTTPRequestHandler):
+        def _headers(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "video/mp4")
+            self.send_header("Content-Length", str(size))
+            self.end_headers()
+
+        def do_HEAD(self):
+            # The variant size probe: answered without sending the body
+            self._headers()
+
+        def do_GET(self):
+            self._headers()
+            sent = 0
+            started = time.perf_counter()
+            while sent < size:
+                chunk = block[:min(len(block), size - sent)]
+                self.wfile.write(chunk)
+                sent += len(chunk)
+                # Throttle to the configured bandwidth
+                ahead = sent / rate - (time.perf_counter() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+
+        def log_message(self, *args):
+            pass
+
+    return SlowHandler
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=4)
+    parser.add_argument("--size-mb", type=float, default=4)
+    parser.add_argument("--rate-mbps", type=float, default=16, help="Per-connection bandwidth in megabits/s")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    size = int(args.size_mb * 1024 * 1024)
+    rate = args.rate_mbps * 1_000_000 / 8
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(size, rate))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    workdir = tempfile.mkdtemp(prefix="bench-download-")
+    os.environ.update({
+        "MEDIA_CACHE_DIR": os.path.join(workdir, "media"),
+        "TELEGRAM_FILE_ID_DB": os.path.join(workdir, "file_ids.db"),
+        "TRACE_FILE": os.path.join(workdir, "traces.jsonl")
+    })
+    # Set before app is imported, so nothing touches the real caches or trace log
+    from app import SecureXTelegramScheduler
+    scheduler = SecureXTelegramScheduler.headless({})
+
+    print(f"{args.items} videos x {args.size_mb}MB at {args.rate_mbps} Mbps each")
+    baseline = None
+    for run, concurrency in enumerate(args.concurrency):
+        media = [{
+            "type": "video",
+            "media_key": f"bench_{run}_{i}",
+            "variants": [{
+                "bit_rate": 2_000_000, "content_type": "video/mp4",
+                "url": f"{base}/run{run}/video{i}.mp4"
+            }]
+        } for i in range(args.items)]
+        started = time.perf_counter()
+        downloaded = scheduler.download_media_batch(media, None, concurrency=concurrency)
+        elapsed = time.perf_counter() - started
+        scheduler.cleanup_media(downloaded)
+        baseline = baseline or elapsed
+        print(f"concurrency={concurrency:<3} {elapsed:6.2f}s  {len(downloaded)} items  speedup x{baseline / elapsed:.1f}")
+
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# CPU cost per GB downloaded: iter_content(8192) + separate hash vs download_to_file
+#
+#   python benchmarks/bench_download_engine.py --size-mb 50 --repeat 10
+#
+# A separate process serves an in-memory body over localhost, so the CPU time
+# measured here (time.process_time of this process) is the client's alone. The
+# old path is what a video went through before: iter_content(8192) into a
+# NamedTemporaryFile, getsize, then a full re-read for its SHA-256 (media cache /
+# ffprobe cache). The engine does the same work in one pass. Localhost is far
+# faster than any CDN, so this measures CPU per byte, not download time.
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+
+from download import download_to_file
+from media_cache import file_sha256
+
+def serve(size, port_queue):
+    body = os.urandom(size)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "video/mp4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            view = memoryview(body)
+            for offset in range(0, len(body), 1024 * 1024):
+                self.wfile.write(view[offset:offset + 1024 * 1024])
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    port_queue.put(server.server_port)
+    server.serve_forever()
+
+def old_path(session, url):
+    response = session.get(url, stream=True, timeout=60)
+    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4")
+    for chunk in response.iter_content(8192):
+        if not chunk:
+            break
+        temp_file.write(chunk)
+    temp_file.close()
+    response.close()
+    size = os.path.getsize(temp_file.name)
+    sha256 = file_sha256(temp_file.name)
+    os.unlink(temp_file.name)
+    return size, sha256
+
+def engine(session, url):
+    response = session.get(url, stream=True, timeout=60)
+    try:
+        download = download_to_file(response, ".mp4")
+    finally:
+        response.close()
+    os.unlink(download["file"])
+    return download["size"], download["sha256"]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    port_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(args.size_mb * 1024 * 1024, port_queue), daemon=True)
+    server.start()
+    url = f"http://127.0.0.1:{port_queue.get()}/video.mp4"
+    session = requests.Session()
+
+    results = {}
+    for name, download in [("iter_content(8192)", old_path), ("download_to_file", engine)]:
+        results[name] = download(session, url)  # Warm-up; also checks both agree
+        cpu_started, wall_started = time.process_time(), time.perf_counter()
+        for _ in range(args.repeat):
+            download(session, url)
+        cpu = time.process_time() - cpu_started
+        wall = time.perf_counter() - wall_started
+        gb = args.size_mb * args.repeat / 1024
+        print(f"{name:<20} {cpu / gb:6.2f} CPU s/GB  {args.size_mb * args.repeat / wall:8.0f} MB/s")
+        results[name + " cpu"] = cpu / gb
+
+    assert results["iter_content(8192)"] == results["download_to_file"], "downloads differ"
+    saved = results["iter_content(8192) cpu"] - results["download_to_file cpu"]
+    print(f"saved {saved:.2f} CPU s/GB ({saved / results['iter_content(8192) cpu'] * 100:.0f}%)")
+    server.terminate()
+
+if __name__ == "__main__":
+    main()
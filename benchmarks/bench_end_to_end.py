@@ -0,0 +1,186 @@
+# Posts per minute and per-stage latency of the whole pipeline, against local fakes
+#
+#   python benchmarks/bench_end_to_end.py --posts 40 --concurrency 4 --output e2e.json
+#   python benchmarks/bench_end_to_end.py --compare e2e.json     # after a change
+#
+# Starts benchmarks/fake_services.py (X API, twimg CDN and Telegram Bot API on one
+# local port), points the app at it with X_API_BASE/TELEGRAM_API_BASE, and runs
+# --posts posts through a headless SecureXTelegramScheduler the way a post job
+# does: fetch_tweet -> download_media_batch -> post_now (-> delete_post with
+# --delete). Caches live in a temp directory and every URL serves distinct bytes,
+# so each post does the full work. Each post is traced (tracing.py); the report
+# has exact p50/p95 per span name, posts/minute, post latency and peak RSS, and is
+# written as JSON so two commits can be compared with --compare.
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_services import FakeServices
+
+# Report keys compared by --compare, and whether higher is better
+COMPARED = [("posts_per_minute", True), ("post_latency.p50", False), ("post_latency.p95", False),
+            ("peak_rss_mb", False)]
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return {"count": 0, "p50": 0.0, "p95": 0.0, "mean": 0.0}
+    return {
+        "count": len(values),
+        "p50": round(values[len(values) // 2], 4),
+        "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))], 4),
+        "mean": round(statistics.fmean(values), 4)
+    }
+
+def span_kind(name):
+    # "item 3" / "post to @chan" -> one row each in the report
+    for prefix in ("item ", "post to "):
+        if name.startswith(prefix):
+            return prefix.strip()
+    return name
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def lookup(report, dotted):
+    for key in dotted.split("."):
+        report = report.get(key, {}) if isinstance(report, dict) else {}
+    return report if isinstance(report, (int, float)) else None
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--posts", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4, help="Posts in flight at once (post job workers)")
+    parser.add_argument("--chats", type=int, default=0, help="Spread posts over this many chats (0 = one chat per post)")
+    parser.add_argument("--media", type=int, default=4, help="Media items per tweet")
+    parser.add_argument("--media-type", choices=["video", "photo"], default="video")
+    parser.add_argument("--video-seconds", type=int, default=10)
+    parser.add_argument("--photo-kb", type=int, default=300)
+    parser.add_argument("--bandwidth-mbps", type=float, default=200, help="CDN bandwidth per connection, megabits/s")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Added before every fake response")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0, help="Share of Telegram calls answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--delete", action="store_true", help="Also delete each post (deleteMessage)")
+    parser.add_argument("--reuse-media", action="store_true", help="Serve identical bytes everywhere (warm caches)")
+    parser.add_argument("--output", default="bench_end_to_end.json")
+    parser.add_argument("--compare", help="Earlier report to compare this run against")
+    args = parser.parse_args()
+
+    services = FakeServices(
+        media_per_tweet=args.media, media_type=args.media_type, video_seconds=args.video_seconds,
+        photo_bytes=args.photo_kb * 1024, bandwidth=args.bandwidth_mbps * 1_000_000 / 8,
+        latency=args.latency_ms / 1000, rate_limit_ratio=args.rate_limit_ratio,
+        retry_after=args.retry_after, unique_media=not args.reuse_media
+    ).start()
+
+    workdir = tempfile.mkdtemp(prefix="bench-e2e-")
+    os.environ.update({
+        "X_API_BASE": services.base,
+        "TELEGRAM_API_BASE": services.base,
+        "MEDIA_CACHE_DIR": os.path.join(workdir, "media"),
+        "TELEGRAM_FILE_ID_DB": os.path.join(workdir, "file_ids.db"),
+        "TWEET_CACHE_PATH": os.path.join(workdir, "tweets.db"),
+        "TRACE_FILE": os.path.join(workdir, "traces.jsonl")
+    })
+    # Imported after the environment is set: these read it at import time
+    import metrics
+    import tracing
+    from app import SecureXTelegramScheduler
+    from jobs import Job
+    from send_queue import get_send_queue
+
+    scheduler = SecureXTelegramScheduler.headless({"X_BEARER_TOKEN": "bench", "TELEGRAM_BOT_TOKEN": "1:bench"})
+    run_id = int(time.time())
+
+    def post(i):
+        poster = scheduler.for_job(Job("bench", f"post {i}"))
+        poster.trace = tracing.Trace("bench post", post=i)
+        poster.last_error = None
+        tweet_id = f"{run_id}{i:05d}"
+        chat_id = f"-100{(i % args.chats) if args.chats else i}"
+        started = time.perf_counter()
+        try:
+            with poster._span("tweet fetch"):
+                data = poster.fetch_tweet(tweet_id)
+            media = poster.download_media_batch(data.get("includes", {}).get("media", []), tweet_id)
+            ok, message_id = poster.post_now(chat_id, {"text": data["data"]["text"], "media": media, "post_media": True})
+            if ok and args.delete:
+                with poster._span("delete"):
+                    poster.delete_post(chat_id, message_id)
+        except Exception as e:
+            ok, poster.last_error = False, str(e)
+        return ok, time.perf_counter() - started, poster.trace.finish(), poster.last_error
+
+    print(f"{args.posts} posts x {args.media} {args.media_type}s, concurrency {args.concurrency}, "
+          f"CDN {args.bandwidth_mbps:g} Mbps, latency {args.latency_ms:g}ms, 429 ratio {args.rate_limit_ratio:g}")
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(post, range(args.posts)))
+    wall = time.perf_counter() - started
+
+    durations = {}
+    for _, _, trace, _ in results:
+        for span in trace["spans"]:
+            durations.setdefault(span_kind(span["name"]), []).append(span["duration"])
+    errors = [error for ok, _, _, error in results if not ok]
+    queue_stats = get_send_queue().stats()
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "args": vars(args),
+        "posts": args.posts,
+        "failed": len(errors),
+        "errors": errors[:5],
+        "wall_seconds": round(wall, 3),
+        "posts_per_minute": round(args.posts / wall * 60, 2),
+        "post_latency": percentiles([latency for _, latency, _, _ in results]),
+        "stages": {name: percentiles(values) for name, values in sorted(durations.items())},
+        "stage_errors": {stage: count for (stage,), count in metrics.STAGE_ERRORS.values().items()},
+        # ru_maxrss is KB on Linux. The children figure is the largest ffmpeg/ffprobe
+        # process, and counts what it inherited from this process at fork time.
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "children_peak_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+        "fake_services": dict(services.counts),
+        "send_queue": {k: queue_stats[k] for k in ("sent", "rate_limited", "avg_latency", "p95_latency")}
+    }
+    services.stop()
+
+    print(f"{report['posts_per_minute']:.1f} posts/min, {len(errors)} failed, "
+          f"post latency p50 {report['post_latency']['p50']:.2f}s p95 {report['post_latency']['p95']:.2f}s, "
+          f"peak RSS {report['peak_rss_mb']:.0f}MB")
+    print(f"{'span':<20} {'count':>6} {'p50':>8} {'p95':>8}")
+    for name, stats in report["stages"].items():
+        print(f"{name:<20} {stats['count']:6d} {stats['p50']:7.3f}s {stats['p95']:7.3f}s")
+
+    if args.compare:
+        with open(args.compare) as f:
+            before = json.load(f)
+        print(f"\nvs {args.compare} ({before.get('commit')})")
+        for key, higher_is_better in COMPARED:
+            old, new = lookup(before, key), lookup(report, key)
+            if old and new is not None:
+                change = (new - old) / old * 100
+                better = (change > 0) == higher_is_better
+                print(f"{key:<20} {old:10.2f} -> {new:10.2f}  {change:+6.1f}% {'better' if better or not change else 'worse'}")
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.output}")
+
+if __name__ == "__main__":
+    main()
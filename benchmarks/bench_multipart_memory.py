@@ -0,0 +1,87 @@
+# Peak memory of building a sendMediaGroup upload: requests files=... vs MultipartStream
+#
+#   python benchmarks/bench_multipart_memory.py --files 4 --size-mb 50
+#
+# Both bodies are uploaded to a local server that discards what it receives;
+# peak Python heap usage is measured with tracemalloc during each upload.
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+
+from multipart import MultipartStream
+
+class SinkHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        remaining = int(self.headers.get("Content-Length", 0))
+        while remaining > 0:
+            remaining -= len(self.rfile.read(min(remaining, 1024 * 1024)))
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):
+        pass
+
+def measure(upload):
+    tracemalloc.start()
+    upload()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--size-mb", type=float, default=50)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SinkHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/sendMediaGroup"
+
+    workdir = tempfile.mkdtemp()
+    paths = []
+    block = os.urandom(1024 * 1024)
+    for i in range(args.files):
+        path = os.path.join(workdir, f"file{i}.mp4")
+        with open(path, "wb") as f:
+            for _ in range(int(args.size_mb)):
+                f.write(block)
+        paths.append(path)
+    total_mb = args.files * int(args.size_mb)
+
+    def with_requests_files():
+        handles = [open(p, "rb") for p in paths]
+        files = {"chat_id": (None, "-100"), "media": (None, "[]")}
+        for i, handle in enumerate(handles):
+            files[f"file{i}"] = (f"file{i}.mp4", handle)
+        requests.post(url, files=files, timeout=120)
+        for handle in handles:
+            handle.close()
+
+    def with_stream():
+        uploads = [(f"file{i}", f"file{i}.mp4", p, "video/mp4") for i, p in enumerate(paths)]
+        with MultipartStream([("chat_id", "-100"), ("media", "[]")], uploads) as body:
+            requests.post(url, data=body, headers={"Content-Type": body.content_type}, timeout=120)
+
+    print(f"{args.files} files x {int(args.size_mb)}MB = {total_mb}MB album")
+    for name, upload in [("requests files=", with_requests_files), ("MultipartStream", with_stream)]:
+        peak = measure(upload)
+        print(f"{name:<16} peak heap {peak / 1024 / 1024:8.1f}MB")
+
+    for path in paths:
+        os.unlink(path)
+    os.rmdir(workdir)
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# Time of one Streamlit rerun of app.py for a logged-in session
+#
+#   python benchmarks/bench_rerun_latency.py --channels 200 --runs 200
+#
+# Uses Streamlit's AppTest to execute the script the way a widget interaction
+# does, in a temp directory with a generated channels_data.json of --channels
+# entries (imported into a fresh local channel table; unset DATABASE_URL to keep
+# it off the real database). AppTest.run() polls for the end of the script every
+# 100ms, so its own wall time only comes in 100ms steps; the time reported is
+# that of the script run itself (ScriptRunner._run_script), as a distribution
+# over --runs reruns.
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from streamlit.runtime.scriptrunner.script_runner import ScriptRunner
+from streamlit.testing.v1 import AppTest
+
+script_seconds = []
+
+def _timed_run_script(run_script):
+    def wrapper(self, rerun_data):
+        started = time.perf_counter()
+        try:
+            return run_script(self, rerun_data)
+        finally:
+            script_seconds.append(time.perf_counter() - started)
+    return wrapper
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--channels", type=int, default=200)
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)  # app.py reads channels_data.json from the working directory
+    with open("channels_data.json", "w") as f:
+        json.dump({
+            "channels": {f"Channel {i}": f"-100{1000000000 + i}" for i in range(args.channels)},
+            "channel_links": {f"Channel {i}": f"https://t.me/channel{i}" for i in range(args.channels)}
+        }, f)
+
+    at = AppTest.from_file(os.path.join(REPO, "app.py"), default_timeout=60)
+    at.secrets["app_password"] = "benchmark"
+    at.secrets["telegram_bot_token"] = "1:benchmark"
+    at.session_state["user_authenticated"] = True
+    at.session_state["current_user"] = "Admin"
+
+    ScriptRunner._run_script = _timed_run_script(ScriptRunner._run_script)
+    for _ in range(3):  # First runs import modules and warm caches
+        at.run()
+    del script_seconds[:]
+    for _ in range(args.runs):
+        at.run()
+
+    timings = list(script_seconds)
+
+    timings.sort()
+    ms = lambda q: timings[min(len(timings) - 1, int(len(timings) * q))] * 1000
+    print(f"{args.channels} channels, {args.runs} reruns")
+    print(f"min {timings[0] * 1000:7.1f}ms  p10 {ms(0.1):7.1f}ms  median {statistics.median(timings) * 1000:7.1f}ms  "
+          f"p90 {ms(0.9):7.1f}ms  p99 {ms(0.99):7.1f}ms  max {timings[-1] * 1000:7.1f}ms  "
+          f"stdev {statistics.stdev(timings) * 1000:5.1f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# CPU seconds per video: always re-encoding vs the probe -> skip/remux/encode decision
+#
+#   python benchmarks/bench_transcode_decision.py --seconds 20
+#
+# Generates one clip per case with ffmpeg, then runs both paths on each and
+# reports the CPU time used by ffmpeg/ffprobe child processes. Needs ffmpeg and
+# ffprobe on PATH.
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from transcode import encode, probe_media, remux, transcode_plan
+
+# name, container, extra ffmpeg output args
+CASES = [
+    ("ready", "mp4", ["-c:v", "libx264", "-c:a", "aac", "-movflags", "+faststart"]),
+    ("moov last", "mp4", ["-c:v", "libx264", "-c:a", "aac"]),
+    ("mkv", "mkv", ["-c:v", "libx264", "-c:a", "aac"]),
+    ("mpeg4", "mp4", ["-c:v", "mpeg4", "-q:v", "4", "-c:a", "aac", "-movflags", "+faststart"]),
+]
+
+def child_cpu():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+def timed(fn, *args):
+    before = child_cpu()
+    result = fn(*args)
+    return child_cpu() - before, result
+
+def decide(path, output):
+    action, _ = transcode_plan(probe_media(path))
+    if action == "remux":
+        remux(path, output)
+    elif action == "encode":
+        encode(path, output)
+    return action
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=int, default=20)
+    parser.add_argument("--size", default="1280x720")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    output = os.path.join(workdir, "out.mp4")
+    print(f"{args.seconds}s {args.size} clips - CPU seconds used by ffmpeg/ffprobe")
+    print(f"{'case':<10} {'always encode':>14} {'decision':>10} {'action':>8} {'saved':>8}")
+    for name, container, encode_args in CASES:
+        clip = os.path.join(workdir, f"clip.{container}")
+        subprocess.run(
+            ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+             "-f", "lavfi", "-i", f"testsrc2=size={args.size}:rate=30:duration={args.seconds}",
+             "-f", "lavfi", "-i", f"sine=frequency=440:duration={args.seconds}",
+             "-pix_fmt", "yuv420p", "-preset", "veryfast", *encode_args, clip],
+            check=True
+        )
+        baseline, _ = timed(encode, clip, output)
+        decision, action = timed(decide, clip, output)
+        print(f"{name:<10} {baseline:14.2f} {decision:10.2f} {action:>8} {baseline - decision:8.2f}")
+        os.unlink(clip)
+        if os.path.exists(output):
+            os.unlink(output)
+
+    os.rmdir(workdir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# Oversized-video path: download -> temp file -> ffmpeg -> temp file -> upload,
+# against StreamingTranscode piping download -> ffmpeg -> upload
+#
+#   python benchmarks/bench_transcode_pipeline.py --seconds 20
+#
+# A test clip is generated with ffmpeg and served from a local "CDN"; uploads go
+# to a local sink. Reports time until the sink has the first 64KB of video, total
+# wall time and bytes written to disk for each pipeline.
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+
+from multipart import MultipartStream
+from transcode import H264_AAC_ARGS, StreamingTranscode
+
+# "First byte" = first 64KB, so the multipart part headers alone don't count
+FIRST_BYTES = 64 * 1024
+
+def make_handler(video_path, received):
+    with open(video_path, "rb") as f:
+        video = f.read()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(video)))
+            self.end_headers()
+            self.wfile.write(video)
+
+        def do_POST(self):
+            started = time.perf_counter()
+            first = None
+            seen = 0
+            if self.headers.get("Transfer-Encoding") == "chunked":
+                while True:
+                    size = int(self.rfile.readline().strip(), 16)
+                    if size == 0:
+                        self.rfile.readline()
+                        break
+                    seen += len(self.rfile.read(size))
+                    self.rfile.readline()
+                    if seen >= FIRST_BYTES and first is None:
+                        first = time.perf_counter()
+            else:
+                remaining = int(self.headers.get("Content-Length", 0))
+                while remaining > 0:
+                    chunk = len(self.rfile.read(min(remaining, 64 * 1024)))
+                    remaining -= chunk
+                    seen += chunk
+                    if seen >= FIRST_BYTES and first is None:
+                        first = time.perf_counter()
+            received.append(first or started)
+            self.send_response(200)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+def temp_file_pipeline(url, upload_url, workdir):
+    source = os.path.join(workdir, "source.mp4")
+    output = os.path.join(workdir, "output.mp4")
+    with requests.get(url, stream=True, timeout=60) as response, open(source, "wb") as f:
+        for chunk in response.iter_content(256 * 1024):
+            f.write(chunk)
+    subprocess.run(
+        ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error", "-i", source,
+         *H264_AAC_ARGS, "-movflags", "+faststart", output],
+        check=True
+    )
+    disk = os.path.getsize(source) + os.path.getsize(output)
+    with MultipartStream([("chat_id", "-100")], [("file0", "video.mp4", output, "video/mp4")]) as body:
+        requests.post(upload_url, data=body, headers={"Content-Type": body.content_type}, timeout=120)
+    os.unlink(source)
+    os.unlink(output)
+    return disk
+
+def streaming_pipeline(url, upload_url, workdir):
+    stream = StreamingTranscode(url)
+    with MultipartStream([("chat_id", "-100")], [("file0", "video.mp4", stream, "video/mp4")]) as body:
+        requests.post(upload_url, data=body.iter_chunks(), headers={"Content-Type": body.content_type}, timeout=120)
+    stream.close()
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=int, default=20)
+    parser.add_argument("--size", default="1280x720")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    clip = os.path.join(workdir, "clip.mp4")
+    # +faststart puts moov first, the layout that can be piped straight into ffmpeg
+    subprocess.run(
+        ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+         "-f", "lavfi", "-i", f"testsrc2=size={args.size}:rate=30:duration={args.seconds}",
+         "-f", "lavfi", "-i", f"sine=frequency=440:duration={args.seconds}",
+         "-c:v", "libx264", "-preset", "veryfast", "-b:v", "4M", "-c:a", "aac",
+         "-movflags", "+faststart", clip],
+        check=True
+    )
+
+    received = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(clip, received))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    print(f"{args.seconds}s {args.size} clip, {os.path.getsize(clip) / 1024 / 1024:.1f}MB")
+    for name, pipeline in [("temp files", temp_file_pipeline), ("streaming", streaming_pipeline)]:
+        started = time.perf_counter()
+        disk = pipeline(f"{base}/video.mp4", f"{base}/sendMediaGroup", workdir)
+        total = time.perf_counter() - started
+        first_byte = received[-1] - started
+        print(f"{name:<11} first 64KB {first_byte:6.2f}s  total {total:6.2f}s  disk {disk / 1024 / 1024:6.1f}MB")
+
+    os.unlink(clip)
+    os.rmdir(workdir)
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
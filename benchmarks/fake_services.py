@@ -0,0 +1,212 @@
+# Local stand-ins for the X API, the twimg CDN and the Telegram Bot API
+#
+# One threaded HTTP server answers all three, so the app can be pointed at it with
+# X_API_BASE and TELEGRAM_API_BASE (and media URLs in the tweets it returns):
+#
+#   GET  /2/tweets/{id}                   a tweet with `media_per_tweet` items
+#   HEAD/GET /media/{id}/{i}.mp4|.jpg     the media, at `bandwidth` bytes/s per connection
+#   POST /bot{token}/sendMediaGroup       one message per album item, with file_ids
+#   POST /bot{token}/sendMessage
+#   POST /bot{token}/deleteMessage
+#
+# Every response waits `latency` seconds first. A `rate_limit_ratio` share of
+# Telegram calls is answered with HTTP 429 and parameters.retry_after. Each media
+# URL serves slightly different bytes (a unique tag in the MP4 metadata or the
+# photo data) so content-addressed caches and file_id reuse don't turn a
+# throughput run into a cache benchmark, unless `unique_media` is off.
+import hashlib
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TAG = b"benchtag" * 4  # Replaced per URL with a same-length unique tag
+
+def make_clip(seconds, size="1280x720"):
+    """A faststart H.264/AAC MP4 with TAG in its metadata, or None without ffmpeg"""
+    if not shutil.which("ffmpeg"):
+        return None
+    fd, path = tempfile.mkstemp(suffix=".mp4")
+    os.close(fd)
+    try:
+        subprocess.run(
+            ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+             "-f", "lavfi", "-i", f"testsrc2=size={size}:rate=30:duration={seconds}",
+             "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+             "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p", "-c:a", "aac",
+             "-movflags", "+faststart", "-metadata", f"comment={TAG.decode()}", path],
+            check=True
+        )
+        with open(path, "rb") as f:
+            data = f.read()
+        return data if TAG in data else None
+    finally:
+        os.unlink(path)
+
+class FakeServices:
+    def __init__(self, media_per_tweet=4, media_type="video", video_seconds=10, photo_bytes=300 * 1024,
+                 bandwidth=50 * 1024 * 1024, latency=0.05, rate_limit_ratio=0.0, retry_after=1,
+                 unique_media=True, seed=1):
+        self.media_per_tweet = media_per_tweet
+        self.media_type = media_type
+        self.bandwidth = bandwidth
+        self.latency = latency
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after = retry_after
+        self.unique_media = unique_media
+        self.random = random.Random(seed)
+        self.video = make_clip(video_seconds) if media_type == "video" else None
+        if media_type == "video" and self.video is None:
+            # No ffmpeg: opaque bytes of a similar size; the app uploads them as downloaded
+            self.video = TAG + os.urandom(video_seconds * 250 * 1024)
+        self.photo = TAG + os.urandom(photo_bytes)
+        self.counts = {"tweets": 0, "media_requests": 0, "media_bytes": 0, "telegram_calls": 0,
+                       "telegram_429s": 0, "uploaded_bytes": 0}
+        self._lock = threading.Lock()
+        self._next_message_id = 1000
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.base = f"http://127.0.0.1:{self.server.server_port}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+    def _count(self, **amounts):
+        with self._lock:
+            for name, amount in amounts.items():
+                self.counts[name] += amount
+
+    def _media(self, path):
+        data = self.video if path.endswith(".mp4") else self.photo
+        if self.unique_media:
+            data = data.replace(TAG, hashlib.sha256(path.encode()).hexdigest()[:len(TAG)].encode(), 1)
+        return data
+
+    def _tweet(self, tweet_id):
+        media = []
+        for i in range(self.media_per_tweet):
+            key = f"3_{tweet_id}_{i}"
+            if self.media_type == "video":
+                media.append({
+                    "media_key": key,
+                    "type": "video",
+                    "duration_ms": 10000,
+                    "width": 1280,
+                    "height": 720,
+                    "variants": [{"bit_rate": 2176000, "content_type": "video/mp4",
+                                  "url": f"{self.base}/media/{tweet_id}/{i}.mp4"}]
+                })
+            else:
+                media.append({"media_key": key, "type": "photo", "url": f"{self.base}/media/{tweet_id}/{i}.jpg"})
+        return {
+            "data": {
+                "id": tweet_id,
+                "text": f"Benchmark tweet {tweet_id}",
+                "attachments": {"media_keys": [m["media_key"] for m in media]}
+            },
+            "includes": {"media": media}
+        }
+
+    def _telegram(self, method, body):
+        if self.random.random() < self.rate_limit_ratio:
+            self._count(telegram_calls=1, telegram_429s=1)
+            return 429, {"ok": False, "error_code": 429, "description": "Too Many Requests",
+                         "parameters": {"retry_after": self.retry_after}}
+        self._count(telegram_calls=1, uploaded_bytes=len(body))
+        with self._lock:
+            message_id = self._next_message_id
+            self._next_message_id += self.media_per_tweet or 1
+        if method == "sendMediaGroup":
+            match = re.search(rb'name="media"\r\n\r\n(.*?)\r\n--', body, re.S)
+            items = json.loads(match.group(1)) if match else []
+            return 200, {"ok": True, "result": [
+                {"message_id": message_id + i, item["type"]: (
+                    [{"file_id": f"photo-{message_id + i}"}] if item["type"] == "photo"
+                    else {"file_id": f"video-{message_id + i}"}
+                )} for i, item in enumerate(items)
+            ]}
+        if method == "sendMessage":
+            return 200, {"ok": True, "result": {"message_id": message_id}}
+        if method == "deleteMessage":
+            return 200, {"ok": True, "result": True}
+        return 404, {"ok": False, "description": "Not Found"}
+
+    def _handler(self):
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _send(self, status, body, content_type="application/json", head=False):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if not head:
+                    self.wfile.write(body)
+
+            def _serve_media(self, head):
+                data = services._media(self.path)
+                services._count(media_requests=1)
+                if head:
+                    self._send(200, data, "video/mp4", head=True)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "video/mp4" if self.path.endswith(".mp4") else "image/jpeg")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                started = time.perf_counter()
+                for offset in range(0, len(data), 64 * 1024):
+                    self.wfile.write(data[offset:offset + 64 * 1024])
+                    ahead = (offset + 64 * 1024) / services.bandwidth - (time.perf_counter() - started)
+                    if ahead > 0:
+                        time.sleep(ahead)
+                services._count(media_bytes=len(data))
+
+            def do_HEAD(self):
+                time.sleep(services.latency)
+                if self.path.startswith("/media/"):
+                    self._serve_media(head=True)
+                else:
+                    self._send(404, b"", head=True)
+
+            def do_GET(self):
+                time.sleep(services.latency)
+                path = self.path.split("?")[0]
+                if path.startswith("/2/tweets/"):
+                    services._count(tweets=1)
+                    self._send(200, json.dumps(services._tweet(path.rsplit("/", 1)[-1])).encode())
+                elif path.startswith("/media/"):
+                    self._serve_media(head=False)
+                else:
+                    self._send(404, b"{}")
+
+            def do_POST(self):
+                if self.headers.get("Transfer-Encoding") == "chunked":
+                    body = b""
+                    while True:
+                        size = int(self.rfile.readline().strip(), 16)
+                        if size == 0:
+                            self.rfile.readline()
+                            break
+                        body += self.rfile.read(size)
+                        self.rfile.readline()
+                else:
+                    body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                time.sleep(services.latency)
+                status, payload = services._telegram(self.path.rsplit("/", 1)[-1], body)
+                self._send(status, json.dumps(payload).encode())
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
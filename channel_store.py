@@ -0,0 +1,232 @@
+# channel_store.py - Channel registry in an indexed SQL table
+#
+# Channels live in a `channels` table in DATABASE_URL (Postgres in production),
+# or in a local SQLite file when it isn't set. Every row has a stable id, so a
+# rename keeps the same row, plus the chat_id, custom link and tags. The sidebar
+# asks search() for one page of matches by name, chat ID or tag instead of
+# drawing every channel. Posting and delete resolve chat_ids through an
+# in-process index that is only rebuilt when the table changes (row count or
+# newest updated_at, checked at most once a second), so the lookup is a dict
+# access. channels_data.json from older versions is imported when the table is
+# first created.
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from db_setup import get_connection, is_sqlite, sql
+
+REFRESH_SECONDS = 1.0  # How stale another process's edits may look
+
+COLUMNS = "id, name, chat_id, link, tags"
+
+def parse_tags(tags):
+    """'News, #sports' or a list -> ['news', 'sports']"""
+    if isinstance(tags, str):
+        tags = tags.split(",")
+    parsed = []
+    for tag in tags or []:
+        tag = tag.strip().lstrip("#").lower()
+        if tag and tag not in parsed:
+            parsed.append(tag)
+    return parsed
+
+def _like(text):
+    """LIKE pattern matching text anywhere, with its own % and _ taken literally"""
+    return "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+class ChannelStore:
+    def __init__(self, database_url, legacy_path=None):
+        self.database_url = database_url
+        self.legacy_path = legacy_path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._signature = None
+        self._checked_at = 0.0
+        self._by_name = {}
+        self._by_chat_id = {}
+        with self._lock, self._cursor() as (conn, cur):
+            self._setup(conn, cur)
+
+    def _connection(self):
+        # psycopg2 marks a connection closed after the server drops it
+        if self._conn is None or getattr(self._conn, "closed", 0):
+            if self.database_url.startswith("sqlite:///"):
+                directory = os.path.dirname(self.database_url[len("sqlite:///"):])
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+            self._conn = get_connection(self.database_url)
+            if is_sqlite(self._conn):
+                self._conn.execute("PRAGMA journal_mode=WAL")
+        return self._conn
+
+    @contextmanager
+    def _cursor(self):
+        conn = self._connection()
+        cur = conn.cursor()
+        try:
+            yield conn, cur
+            conn.commit()  # Also ends the transaction Postgres opens for a SELECT
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+
+    def _setup(self, conn, cur):
+        if is_sqlite(conn):
+            cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'channels'")
+            existed = cur.fetchone() is not None
+        else:
+            cur.execute("SELECT to_regclass('channels')")
+            existed = cur.fetchone()[0] is not None
+
+        id_column = "id INTEGER PRIMARY KEY AUTOINCREMENT" if is_sqlite(conn) else "id SERIAL PRIMARY KEY"
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS channels (
+                {id_column},
+                name VARCHAR(255) NOT NULL UNIQUE,
+                chat_id VARCHAR(255) NOT NULL,
+                link TEXT DEFAULT '',
+                tags TEXT DEFAULT '',
+                updated_at DOUBLE PRECISION NOT NULL
+            )
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_channels_chat_id ON channels (chat_id)")
+
+        if not existed:
+            self._import_legacy(conn, cur)
+
+    def _import_legacy(self, conn, cur):
+        if not self.legacy_path or not os.path.exists(self.legacy_path):
+            return
+        try:
+            with open(self.legacy_path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        links = data.get("channel_links", {})
+        now = time.time()
+        for name, chat_id in data.get("channels", {}).items():
+            # Another process may be importing the same file at the same moment
+            cur.execute(sql(conn, """
+                INSERT INTO channels (name, chat_id, link, tags, updated_at)
+                VALUES (%s, %s, %s, '', %s)
+                ON CONFLICT (name) DO NOTHING
+            """), (name, str(chat_id), links.get(name, "") or "", now))
+
+    @staticmethod
+    def _row(row):
+        return {
+            "id": row[0],
+            "name": row[1],
+            "chat_id": row[2],
+            "link": row[3] or "",
+            "tags": parse_tags(row[4])
+        }
+
+    def _refresh(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._checked_at < REFRESH_SECONDS:
+            return
+        with self._cursor() as (conn, cur):
+            cur.execute("SELECT COUNT(*), MAX(updated_at) FROM channels")
+            signature = tuple(cur.fetchone())
+            if signature != self._signature:
+                cur.execute(f"SELECT {COLUMNS} FROM channels ORDER BY LOWER(name), id")
+                channels = [self._row(row) for row in cur.fetchall()]
+                self._by_name = {channel["name"]: channel for channel in channels}
+                self._by_chat_id = {}
+                for channel in channels:
+                    self._by_chat_id.setdefault(channel["chat_id"], channel)
+                self._signature = signature
+        self._checked_at = now
+
+    def snapshot(self):
+        """(channels, channel_links) name-keyed copies - safe to hand to session_state"""
+        with self._lock:
+            self._refresh()
+            return (
+                {name: channel["chat_id"] for name, channel in self._by_name.items()},
+                {name: channel["link"] for name, channel in self._by_name.items()}
+            )
+
+    def get(self, name):
+        with self._lock:
+            self._refresh()
+            channel = self._by_name.get(name)
+        return dict(channel) if channel else None
+
+    def by_chat_id(self, chat_id):
+        """The channel registered for a chat_id, or None"""
+        with self._lock:
+            self._refresh()
+            channel = self._by_chat_id.get(str(chat_id))
+        return dict(channel) if channel else None
+
+    def search(self, query="", offset=0, limit=20):
+        """One page of channels matching name, chat ID or tag ("#news" for an exact tag)
+
+        Returns (channels, total matches).
+        """
+        query = query.strip()
+        if query.startswith("#") and parse_tags(query):
+            where, params = "WHERE tags LIKE %s ESCAPE '\\'", [_like(f",{parse_tags(query)[0]},")]
+        elif query:
+            pattern = _like(query.lower())
+            where = "WHERE LOWER(name) LIKE %s ESCAPE '\\' OR LOWER(chat_id) LIKE %s ESCAPE '\\' OR tags LIKE %s ESCAPE '\\'"
+            params = [pattern, pattern, pattern]
+        else:
+            where, params = "", []
+        with self._lock, self._cursor() as (conn, cur):
+            cur.execute(sql(conn, f"SELECT COUNT(*) FROM channels {where}"), params)
+            total = cur.fetchone()[0]
+            cur.execute(sql(conn, f"""
+                SELECT {COLUMNS} FROM channels {where}
+                ORDER BY LOWER(name), id LIMIT %s OFFSET %s
+            """), params + [limit, offset])
+            channels = [self._row(row) for row in cur.fetchall()]
+        return channels, total
+
+    def put(self, name, chat_id, link="", tags="", replaces=None):
+        """Add or update a channel; replaces=old name when it is being renamed (keeps its id)"""
+        tags = parse_tags(tags)
+        values = (name, str(chat_id), link or "", f",{','.join(tags)}," if tags else "", time.time())
+        with self._lock:
+            with self._cursor() as (conn, cur):
+                updated = 0
+                if replaces and replaces != name:
+                    # Renaming onto another channel's name replaces that channel, as saving over it would
+                    cur.execute(sql(conn, "DELETE FROM channels WHERE name = %s"), (name,))
+                    cur.execute(sql(conn, """
+                        UPDATE channels SET name = %s, chat_id = %s, link = %s, tags = %s, updated_at = %s
+                        WHERE name = %s
+                    """), values + (replaces,))
+                    updated = cur.rowcount
+                if not updated:
+                    cur.execute(sql(conn, """
+                        INSERT INTO channels (name, chat_id, link, tags, updated_at)
+                        VALUES (%s, %s, %s, %s, %s)
+                        ON CONFLICT (name) DO UPDATE SET
+                            chat_id = excluded.chat_id, link = excluded.link,
+                            tags = excluded.tags, updated_at = excluded.updated_at
+                    """), values)
+            self._refresh(force=True)
+
+    def delete(self, name):
+        with self._lock:
+            with self._cursor() as (conn, cur):
+                cur.execute(sql(conn, "DELETE FROM channels WHERE name = %s"), (name,))
+            self._refresh(force=True)
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_channel_store(legacy_path="channels_data.json"):
+    """The process-wide store: DATABASE_URL, else CHANNELS_DB (local SQLite)"""
+    database_url = os.getenv("DATABASE_URL") or f"sqlite:///{os.getenv('CHANNELS_DB', '.cache/channels.db')}"
+    with _stores_lock:
+        if database_url not in _stores:
+            _stores[database_url] = ChannelStore(database_url, legacy_path)
+        return _stores[database_url]
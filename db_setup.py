@@ -1,14 +1,51 @@
-import psycopg2
 import os
+import sqlite3
 
-def setup_database():
+def get_connection(database_url=None):
+    """Open DATABASE_URL - Postgres in production, sqlite:///path for local runs"""
+    database_url = database_url or os.getenv('DATABASE_URL')
+    if not database_url:
+        raise RuntimeError("DATABASE_URL is not set")
+
+    if database_url.startswith("sqlite://"):
+        path = database_url[len("sqlite:///"):] or ":memory:"
+        conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    import psycopg2
+    return psycopg2.connect(database_url)
+
+def is_sqlite(conn):
+    return isinstance(conn, sqlite3.Connection)
+
+def sql(conn, query):
+    """Queries are written with %s placeholders; SQLite wants ?"""
+    return query.replace("%s", "?") if is_sqlite(conn) else query
+
+def add_column(conn, table, column_def):
+    """ALTER TABLE ... ADD COLUMN that is safe to run on every deploy"""
+    cur = conn.cursor()
+    if is_sqlite(conn):
+        try:
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN {column_def}")
+        except sqlite3.OperationalError:
+            pass  # Column already exists
+    else:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column_def}")
+    cur.close()
+
+def setup_database(database_url=None):
     """Create the scheduled_posts table"""
-    conn = psycopg2.connect(os.getenv('DATABASE_URL'))
+    conn = get_connection(database_url)
     cur = conn.cursor()
-    
-    cur.execute("""
+
+    id_column = "id INTEGER PRIMARY KEY AUTOINCREMENT" if is_sqlite(conn) else "id SERIAL PRIMARY KEY"
+    now = "CURRENT_TIMESTAMP" if is_sqlite(conn) else "NOW()"
+
+    cur.execute(f"""
         CREATE TABLE IF NOT EXISTS scheduled_posts (
-            id SERIAL PRIMARY KEY,
+            {id_column},
             chat_id VARCHAR(255) NOT NULL,
             content_text TEXT NOT NULL,
             media_files TEXT,
@@ -16,16 +53,47 @@ def setup_database():
             schedule_time TIMESTAMP NOT NULL,
             status VARCHAR(50) DEFAULT 'scheduled',
             user_name VARCHAR(255),
-            created_at TIMESTAMP DEFAULT NOW(),
+            created_at TIMESTAMP DEFAULT {now},
             posted_at TIMESTAMP,
             error TEXT
         )
     """)
-    
+
+    # Worker bookkeeping (see worker.py)
+    add_column(conn, "scheduled_posts", "claimed_by VARCHAR(255)")
+    add_column(conn, "scheduled_posts", "claimed_at TIMESTAMP")
+    add_column(conn, "scheduled_posts", "attempts INTEGER DEFAULT 0")
+    add_column(conn, "scheduled_posts", "message_id BIGINT")
+
+    # The dispatcher only ever asks for "scheduled rows ordered by time"
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_scheduled_posts_status_time
+        ON scheduled_posts (status, schedule_time)
+    """)
+
+    if not is_sqlite(conn):
+        # Wake dispatchers (LISTEN scheduled_posts) when a row becomes due-able
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION notify_scheduled_post() RETURNS trigger AS $$
+            BEGIN
+                IF NEW.status = 'scheduled' THEN
+                    PERFORM pg_notify('scheduled_posts', NEW.id::text);
+                END IF;
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql
+        """)
+        cur.execute("DROP TRIGGER IF EXISTS scheduled_posts_notify ON scheduled_posts")
+        cur.execute("""
+            CREATE TRIGGER scheduled_posts_notify
+            AFTER INSERT OR UPDATE OF schedule_time, status ON scheduled_posts
+            FOR EACH ROW EXECUTE FUNCTION notify_scheduled_post()
+        """)
+
     conn.commit()
     cur.close()
     conn.close()
     print("Database setup complete!")
 
 if __name__ == "__main__":
-    setup_database()
\ No newline at end of file
+    setup_database()
@@ -0,0 +1,222 @@
+# dispatcher.py - Fires scheduled_posts at their schedule_time without polling
+#
+# Upcoming rows are kept in a min-heap keyed on schedule_time and the loop sleeps
+# until the next deadline. New or rescheduled rows wake it early: Postgres through
+# LISTEN scheduled_posts (trigger in db_setup.py), the SQLite stand-in through a
+# UDP datagram from worker.enqueue_post. While nothing is due the DB traffic is
+# one reload per horizon and a check for posts whose worker died mid-post every
+# half lease; any it hands back are reloaded straight away, since SQLite has no
+# NOTIFY for them. A post that can't be claimed (the database hiccuped) goes back
+# on the heap and is retried after a short backoff.
+#
+# Catch-up after a restart: posts that are late by less than catchup_window are
+# sent immediately, oldest first. Older ones are marked 'missed' (or sent anyway
+# with missed_policy="post") so a long outage doesn't flood the channels.
+import heapq
+import os
+import select
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from db_setup import get_connection, is_sqlite, sql
+from worker import claim_post, release_stale, rows_as_dicts
+
+CLAIM_RETRY_MAX = 60
+
+def as_datetime(value):
+    # SQLite hands timestamps back as ISO strings
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+class Dispatcher:
+    def __init__(self, worker, max_concurrent=4, catchup_window=3600, missed_policy="skip",
+                 horizon=6 * 3600, fallback_interval=30):
+        self.worker = worker
+        self.catchup_window = catchup_window
+        self.missed_policy = missed_policy
+        self.horizon = horizon
+        self.fallback_interval = fallback_interval
+        self.conn = get_connection(worker.database_url)
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrent)
+
+        self.heap = []        # (due epoch, post id)
+        self.due = {}         # post id -> latest due epoch; older heap entries are stale
+        self.loaded_until = 0
+        self.stale_check_at = 0
+        self.claim_failures = {}  # post id -> (failed claims, original due epoch)
+        self.lateness_ms = []
+
+        self.listen_conn = None
+        self.notify_socket = None
+        self._listen()
+
+    def _listen(self):
+        if is_sqlite(self.conn):
+            port = int(os.getenv("DISPATCH_NOTIFY_PORT", "8765"))
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                sock.bind(("127.0.0.1", port))
+                sock.setblocking(False)
+                self.notify_socket = sock
+            except OSError:
+                sock.close()
+                print(f"Notify port {port} busy - rechecking every {self.fallback_interval}s instead")
+                self.horizon = self.fallback_interval
+        else:
+            from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+            self.listen_conn = get_connection(self.worker.database_url)
+            self.listen_conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+            cur = self.listen_conn.cursor()
+            cur.execute("LISTEN scheduled_posts")
+            cur.close()
+
+    def _wait_sources(self):
+        if self.listen_conn is not None:
+            return [self.listen_conn]
+        if self.notify_socket is not None:
+            return [self.notify_socket]
+        return []
+
+    def _notified_ids(self):
+        ids = []
+        if self.listen_conn is not None:
+            self.listen_conn.poll()
+            while self.listen_conn.notifies:
+                ids.append(self.listen_conn.notifies.pop(0).payload)
+        elif self.notify_socket is not None:
+            while True:
+                try:
+                    data, _ = self.notify_socket.recvfrom(64)
+                except BlockingIOError:
+                    break
+                ids.append(data.decode())
+        return [int(i) for i in ids if i.strip().isdigit()]
+
+    def push(self, post_id, schedule_time):
+        due = as_datetime(schedule_time).timestamp()
+        if post_id in self.claim_failures:
+            due = max(due, self.due.get(post_id, due))  # A reload doesn't cut a retry backoff short
+        if self.due.get(post_id) == due:
+            return
+        self.due[post_id] = due
+        heapq.heappush(self.heap, (due, post_id))
+
+    def catch_up(self):
+        """Apply the missed-post policy to rows that are too late to send"""
+        if self.missed_policy == "post":
+            return 0
+        cutoff = datetime.now() - timedelta(seconds=self.catchup_window)
+        cur = self.conn.cursor()
+        cur.execute(sql(self.conn, """
+            UPDATE scheduled_posts SET status = 'missed', error = %s
+            WHERE status = 'scheduled' AND schedule_time < %s
+        """), (f"Missed by more than {self.catchup_window}s (dispatcher was down)", cutoff))
+        missed = cur.rowcount
+        self.conn.commit()
+        cur.close()
+        if missed:
+            print(f"Marked {missed} posts as missed")
+        return missed
+
+    def load(self):
+        """(Re)load every scheduled row due before the end of the horizon"""
+        self.loaded_until = time.time() + self.horizon
+        until = datetime.fromtimestamp(self.loaded_until)
+        cur = self.conn.cursor()
+        cur.execute(sql(self.conn, """
+            SELECT id, schedule_time FROM scheduled_posts
+            WHERE status = 'scheduled' AND schedule_time <= %s
+            ORDER BY schedule_time
+        """), (until,))
+        rows = rows_as_dicts(cur)
+        self.conn.commit()
+        cur.close()
+        for row in rows:
+            self.push(row["id"], row["schedule_time"])
+
+    def load_post(self, post_id):
+        cur = self.conn.cursor()
+        cur.execute(sql(self.conn, """
+            SELECT id, schedule_time FROM scheduled_posts
+            WHERE id = %s AND status = 'scheduled'
+        """), (post_id,))
+        rows = rows_as_dicts(cur)
+        self.conn.commit()
+        cur.close()
+        if rows and as_datetime(rows[0]["schedule_time"]).timestamp() <= self.loaded_until:
+            self.push(post_id, rows[0]["schedule_time"])
+
+    def requeue_stale(self):
+        """Hand back posts from dead workers and load them; no NOTIFY covers them on SQLite"""
+        self.stale_check_at = time.time() + min(self.worker.lease_seconds / 2, self.horizon)
+        released = release_stale(self.conn, self.worker.lease_seconds)
+        if released:
+            print(f"[{self.worker.worker_id}] {released} posts from a stopped worker are scheduled again")
+            self.load()
+        return released
+
+    def retry_claim(self, post_id, due, error):
+        """Put a post whose claim failed back on the heap, backing off up to CLAIM_RETRY_MAX seconds"""
+        try:
+            self.conn.rollback()  # Postgres refuses everything after an error until then
+        except Exception:
+            pass
+        failures, original_due = self.claim_failures.get(post_id, (0, due))
+        failures += 1
+        self.claim_failures[post_id] = (failures, original_due)
+        delay = min(CLAIM_RETRY_MAX, 2 ** failures)
+        print(f"[{self.worker.worker_id}] could not claim post {post_id}: {error} - retrying in {delay}s")
+        self.due[post_id] = time.time() + delay
+        heapq.heappush(self.heap, (self.due[post_id], post_id))
+
+    def fire(self, post_id, due):
+        # Lateness counts from the schedule, not from a retry after a failed claim
+        due = self.claim_failures.get(post_id, (0, due))[1]
+        post = claim_post(self.conn, post_id, self.worker.worker_id)
+        self.claim_failures.pop(post_id, None)
+        if not post:
+            return  # Another dispatcher got it, or it was cancelled/rescheduled
+        late_ms = (time.time() - due) * 1000
+        self.lateness_ms = (self.lateness_ms + [late_ms])[-100:]
+        print(f"[{self.worker.worker_id}] dispatching post {post_id} ({late_ms:.0f} ms after schedule)")
+        self.executor.submit(self.worker.process, post)
+
+    def run_forever(self):
+        self.requeue_stale()
+        self.catch_up()
+        self.load()
+        print(f"[{self.worker.worker_id}] dispatcher ready with {len(self.due)} upcoming posts")
+
+        while True:
+            now = time.time()
+            while self.heap and self.heap[0][0] <= now:
+                due, post_id = heapq.heappop(self.heap)
+                if self.due.get(post_id) != due:
+                    continue  # Superseded by a reschedule
+                del self.due[post_id]
+                try:
+                    self.fire(post_id, due)
+                except Exception as e:
+                    self.retry_claim(post_id, due, e)
+                now = time.time()
+
+            if now >= self.loaded_until:
+                if not self.requeue_stale():  # Which reloads when it hands anything back
+                    self.load()
+                continue
+            if now >= self.stale_check_at:
+                self.requeue_stale()
+                continue
+
+            next_due = self.heap[0][0] if self.heap else self.loaded_until
+            timeout = max(0, min(next_due, self.loaded_until, self.stale_check_at) - now)
+            sources = self._wait_sources()
+            if sources:
+                readable, _, _ = select.select(sources, [], [], timeout)
+            else:
+                time.sleep(timeout)
+                readable = []
+            if readable:
+                for post_id in self._notified_ids():
+                    self.load_post(post_id)
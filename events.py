@@ -0,0 +1,146 @@
+# events.py - Progress events from the post pipeline, drawn a few times a second
+#
+# Download and upload loops (and their worker threads) don't talk to Streamlit.
+# They emit into an EventBus: log lines (write/info/success/warning/error, plus
+# debug lines that are dropped unless DEBUG_OUTPUT is set) and progress values,
+# which are (key, done, total) and overwrite the previous value for the same key
+# until it is drawn. Emitting is a lock and a deque/dict update, so the same code
+# runs in post jobs, worker.py and the benchmarks. UIAdapter drains the bus onto
+# st or a jobs.JobUI at most every UI_UPDATE_INTERVAL seconds, joining
+# consecutive lines of one level into one element - a download that reports
+# every megabyte costs a handful of frontend updates, not hundreds.
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+DEBUG_OUTPUT = os.getenv("DEBUG_OUTPUT", "").lower() in ("1", "true", "yes")
+UI_UPDATE_INTERVAL = float(os.getenv("UI_UPDATE_INTERVAL", "0.25"))
+
+LEVELS = ("debug", "write", "info", "success", "warning", "error")
+
+class EventBus:
+    """Thread-safe sink for pipeline events; callable as report(level, message)"""
+
+    def __init__(self, debug=None):
+        self.debug = DEBUG_OUTPUT if debug is None else debug
+        self._lines = deque()
+        self._progress = {}
+        self._lock = threading.Lock()
+
+    def emit(self, level, message):
+        if level == "progress":
+            key, done, total = message
+            with self._lock:
+                self._progress[key] = (done, total)
+            return
+        if level == "debug" and not self.debug:
+            return
+        with self._lock:
+            self._lines.append((level, str(message)))
+
+    __call__ = emit
+
+    def progress(self, key, done, total=None):
+        self.emit("progress", (key, done, total))
+
+    def drain(self):
+        """(lines, {key: (done, total)}) emitted since the last drain"""
+        with self._lock:
+            lines, self._lines = list(self._lines), deque()
+            progress, self._progress = self._progress, {}
+        return lines, progress
+
+def coalesce(lines):
+    """Join runs of same-level lines, so each run is one element on the page"""
+    joined = []
+    for level, message in lines:
+        if joined and joined[-1][0] == level:
+            joined[-1] = (level, joined[-1][1] + "  \n" + message)
+        else:
+            joined.append((level, message))
+    return joined
+
+class UIAdapter:
+    """Draws an EventBus onto st or a jobs.JobUI, at most every `interval` seconds
+
+    on_progress(key, done, total) draws progress values; without it they are dropped.
+    Debug lines go out as ui.write.
+    """
+
+    def __init__(self, ui, bus=None, on_progress=None, interval=UI_UPDATE_INTERVAL):
+        self.ui = ui
+        self.bus = bus or EventBus()
+        self.on_progress = on_progress
+        self.interval = interval
+        self._drawn_at = 0.0
+        self._lock = threading.Lock()
+
+    def update(self, force=False):
+        """Draw what was emitted since the last update, if the interval has passed"""
+        now = time.monotonic()
+        if not force and now - self._drawn_at < self.interval:
+            return
+        # Uploads report from whichever thread reads the body; one draws at a time
+        if not self._lock.acquire(blocking=force):
+            return
+        try:
+            self._drawn_at = now
+            lines, progress = self.bus.drain()
+            for level, message in coalesce(lines):
+                getattr(self.ui, "write" if level == "debug" else level)(message)
+            if self.on_progress:
+                for key, (done, total) in progress.items():
+                    self.on_progress(key, done, total)
+        finally:
+            self._lock.release()
+
+class _Discard:
+    def caption(self, text):
+        pass
+
+    def progress(self, value, text=None):
+        pass
+
+    write = info = caption
+
+class HeadlessUI:
+    """The slice of the Streamlit API the posting code uses, for worker.py and scripts
+
+    Warnings and errors go to stderr; the rest is dropped unless DEBUG_OUTPUT is set.
+    """
+
+    def __init__(self, prefix="", debug=None):
+        self.prefix = prefix
+        self.debug = DEBUG_OUTPUT if debug is None else debug
+
+    def _print(self, level, message):
+        print(f"{self.prefix}{level}: {message}", file=sys.stderr)
+
+    def write(self, message):
+        if self.debug:
+            self._print("write", message)
+
+    def info(self, message):
+        if self.debug:
+            self._print("info", message)
+
+    success = info
+
+    def warning(self, message):
+        self._print("warning", message)
+
+    def error(self, message):
+        self._print("error", message)
+
+    def empty(self):
+        return _Discard()
+
+    def progress(self, value, text=None):
+        return _Discard()
+
+    @contextmanager
+    def spinner(self, text):
+        yield
@@ -0,0 +1,94 @@
+# file_id_store.py - Remembers Telegram file_ids so media is uploaded only once
+#
+# Every photo/video Telegram accepts comes back with a file_id that can be sent
+# again ("media": "<file_id>") without uploading the bytes. file_ids belong to the
+# bot that received them, so keys are namespaced by the bot id from the token.
+import os
+import sqlite3
+import threading
+import time
+
+class FileIdStore:
+    def __init__(self, path):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS file_ids (
+                lookup_key TEXT PRIMARY KEY,
+                file_id TEXT NOT NULL,
+                media_type TEXT,
+                size INTEGER DEFAULT 0,
+                created_at REAL NOT NULL,
+                uses INTEGER DEFAULT 0
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_file_ids_file_id ON file_ids (file_id)")
+        self.db.commit()
+
+    @staticmethod
+    def _keys(bot_id, media_key=None, sha256=None):
+        # Content hash first: it survives a media_key change and matches re-uploads
+        keys = []
+        if sha256:
+            keys.append(f"{bot_id}:sha256:{sha256}")
+        if media_key:
+            keys.append(f"{bot_id}:media:{media_key}")
+        return keys
+
+    def get(self, bot_id, media_key=None, sha256=None):
+        with self._lock:
+            for key in self._keys(bot_id, media_key, sha256):
+                row = self.db.execute("SELECT file_id FROM file_ids WHERE lookup_key = ?", (key,)).fetchone()
+                if row:
+                    self.db.execute("UPDATE file_ids SET uses = uses + 1 WHERE lookup_key = ?", (key,))
+                    self.db.commit()
+                    return row[0]
+        return None
+
+    def put(self, bot_id, file_id, media_type, media_key=None, sha256=None, size=0):
+        with self._lock:
+            for key in self._keys(bot_id, media_key, sha256):
+                self.db.execute("""
+                    INSERT OR REPLACE INTO file_ids (lookup_key, file_id, media_type, size, created_at, uses)
+                    VALUES (?, ?, ?, ?, ?, 0)
+                """, (key, file_id, media_type, size, time.time()))
+            self.db.commit()
+
+    def forget(self, file_id):
+        """Drop a file_id Telegram no longer accepts"""
+        with self._lock:
+            self.db.execute("DELETE FROM file_ids WHERE file_id = ?", (file_id,))
+            self.db.commit()
+
+    def stats(self):
+        with self._lock:
+            stored, reuses, saved = self.db.execute("""
+                SELECT COUNT(DISTINCT file_id), COALESCE(SUM(uses), 0), COALESCE(SUM(uses * size), 0)
+                FROM file_ids
+            """).fetchone()
+        return {"file_ids": stored, "reuses": reuses, "bytes_saved": saved}
+
+def file_ids_from_result(messages):
+    """file_id of each sent item, in album order, from a sendMediaGroup result"""
+    file_ids = []
+    for message in messages:
+        if message.get("photo"):
+            # Sizes come smallest first; the last one is the original upload
+            file_ids.append(message["photo"][-1]["file_id"])
+        else:
+            sent = message.get("video") or message.get("animation") or message.get("document") or {}
+            file_ids.append(sent.get("file_id"))
+    return file_ids
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_file_id_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = FileIdStore(os.getenv("TELEGRAM_FILE_ID_DB", ".cache/file_ids.db"))
+        return _store
@@ -0,0 +1,97 @@
+# http_client.py - One pooled HTTP session per process for X, twimg and Telegram
+#
+# Module state survives Streamlit reruns (only app.py is re-executed), so every
+# session and the worker reuse the same keep-alive connections instead of paying
+# a TCP + TLS handshake on each call.
+#
+# Retries: connection errors are retried for every method (the request never
+# reached the server); 5xx responses only for GET/HEAD, so a slow sendMediaGroup
+# is never posted twice.
+import os
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import metrics
+
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+RETRIES = int(os.getenv("HTTP_RETRIES", "3"))
+BACKOFF = float(os.getenv("HTTP_BACKOFF", "0.5"))
+
+_session = None
+_session_lock = threading.Lock()
+
+def _build_session():
+    retry = Retry(
+        total=RETRIES,
+        connect=RETRIES,
+        read=RETRIES,
+        status=RETRIES,
+        backoff_factor=BACKOFF,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=frozenset({"GET", "HEAD", "OPTIONS"}),
+        raise_on_status=False
+    )
+    # pool_connections = how many hosts keep a pool, pool_maxsize = sockets per host
+    adapter = HTTPAdapter(pool_connections=32, pool_maxsize=POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["User-Agent"] = "x-telegram-scheduler"
+    return session
+
+def get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+def request(method, url, timeout=None, **kwargs):
+    """Session request; a plain number for timeout is the read timeout"""
+    if timeout is None:
+        timeout = READ_TIMEOUT
+    if not isinstance(timeout, tuple):
+        timeout = (CONNECT_TIMEOUT, timeout)
+    host = urlsplit(url).hostname or ""
+    try:
+        response = get_session().request(method, url, timeout=timeout, **kwargs)
+    except Exception:
+        metrics.HTTP_RESPONSES.inc(host=host, status="error")
+        raise
+    metrics.HTTP_RESPONSES.inc(host=host, status=str(response.status_code))
+    return response
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+def head(url, **kwargs):
+    return request("HEAD", url, **kwargs)
+
+def pool_stats():
+    """Per-host request and connection counts; reuse = requests served on an existing socket"""
+    stats = []
+    for adapter in set(get_session().adapters.values()):
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            requests_made = pool.num_requests
+            connections = pool.num_connections
+            stats.append({
+                "host": f"{key.key_scheme}://{key.key_host}:{key.key_port or ''}".rstrip(":"),
+                "requests": requests_made,
+                "connections": connections,
+                "reuse": 1 - connections / requests_made if requests_made else 0.0
+            })
+    return sorted(stats, key=lambda s: -s["requests"])
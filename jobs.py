@@ -0,0 +1,202 @@
+# jobs.py - Background post jobs, so posting never blocks (or dies with) the page
+#
+# Download, transcode and upload run on a process-wide executor instead of inside
+# the Streamlit script run. Each job has an id, a status that moves through
+# queued -> downloading/transcoding/uploading -> done/failed/cancelled, the
+# progress of each stage and a short log. The page reads job.snapshot() on every
+# rerun, which only copies a few fields, so polling is cheap. cancel() only sets a
+# flag: the work checks it between stages (raise_if_cancelled) and stops there.
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+ACTIVE = ("queued", "downloading", "transcoding", "uploading")
+
+class JobCancelled(Exception):
+    """Raised by work that notices its job was cancelled"""
+
+class Job:
+    def __init__(self, owner, label):
+        self.id = uuid.uuid4().hex[:8]
+        self.owner = owner
+        self.label = label
+        self.status = "queued"
+        self.progress = {}  # stage -> fraction done (None while unknown)
+        self.detail = ""
+        self.log = deque(maxlen=200)
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.cancelled = False
+        self._lock = threading.Lock()
+
+    def stage(self, status, progress=None):
+        with self._lock:
+            self.status = status
+            if progress is not None or status not in self.progress:
+                self.progress[status] = progress
+
+    def add_log(self, level, message):
+        with self._lock:
+            self.log.append((time.time(), level, str(message)))
+
+    def set_detail(self, text):
+        with self._lock:
+            self.detail = str(text)
+
+    def cancel(self):
+        with self._lock:
+            if self.status not in ACTIVE:
+                return False
+            self.cancelled = True
+        self.add_log("warning", "Cancelled")
+        return True
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise JobCancelled("Cancelled")
+
+    def finish(self, result=None, error=None):
+        with self._lock:
+            self.result = result
+            self.error = error
+            if self.cancelled:
+                self.status = "cancelled"
+                self.error = error or "Cancelled"
+            else:
+                self.status = "failed" if error else "done"
+            self.finished_at = time.time()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "id": self.id,
+                "label": self.label,
+                "status": self.status,
+                "progress": dict(self.progress),
+                "detail": self.detail,
+                "log": list(self.log),
+                "result": self.result,
+                "error": self.error,
+                "created_at": self.created_at,
+                "finished_at": self.finished_at
+            }
+
+class _Placeholder:
+    """Stand-in for st.empty(): keeps only the latest text, as the job's detail line"""
+
+    def __init__(self, job):
+        self.job = job
+
+    def caption(self, text):
+        self.job.set_detail(text)
+
+    write = info = caption
+
+class _ProgressBar:
+    def __init__(self, job):
+        self.job = job
+
+    def progress(self, value, text=None):
+        if text:
+            self.job.set_detail(text)
+
+class JobUI:
+    """The slice of the Streamlit API the posting code uses, recorded into a job's log"""
+
+    def __init__(self, job):
+        self.job = job
+
+    def write(self, message):
+        self.job.add_log("write", message)
+
+    def info(self, message):
+        self.job.add_log("info", message)
+
+    def success(self, message):
+        self.job.add_log("success", message)
+
+    def warning(self, message):
+        self.job.add_log("warning", message)
+
+    def error(self, message):
+        self.job.add_log("error", message)
+
+    def empty(self):
+        return _Placeholder(self.job)
+
+    def progress(self, value, text=None):
+        return _ProgressBar(self.job)
+
+    @contextmanager
+    def spinner(self, text):
+        self.job.set_detail(text)
+        yield
+
+class JobRunner:
+    def __init__(self, workers=2, keep=200):
+        self.keep = keep  # Finished jobs remembered for the page
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="post-job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, owner, label, work):
+        """Queue work(job) to run in the background; returns the job id"""
+        job = Job(owner, label)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._forget_old()
+        self._executor.submit(self._run, job, work)
+        return job.id
+
+    def _run(self, job, work):
+        if job.cancelled:
+            job.finish()  # Cancelled while still queued
+            return
+        try:
+            result = work(job)
+            # A dict result with an "error" marks the job failed without losing the result
+            job.finish(result=result, error=result.get("error") if isinstance(result, dict) else None)
+        except JobCancelled as e:
+            job.finish(error=str(e))
+        except Exception as e:
+            job.add_log("error", f"Job failed: {str(e)}")
+            job.finish(error=str(e))
+
+    def _forget_old(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.status not in ACTIVE]
+        for job_id in finished[:max(0, len(self._jobs) - self.keep)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return job.snapshot() if job else None
+
+    def cancel(self, owner):
+        """Cancel one session's unfinished jobs; returns the ids of those cancelled"""
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if job.owner == owner]
+        return [job.id for job in jobs if job.cancel()]
+
+    def jobs_for(self, owner):
+        """Snapshots of one session's jobs, newest first"""
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if job.owner == owner]
+        return [job.snapshot() for job in reversed(jobs)]
+
+_runner = None
+_runner_lock = threading.Lock()
+
+def get_job_runner():
+    """The process-wide job runner, sized from the environment on first use"""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = JobRunner(workers=int(os.getenv("POST_JOB_WORKERS", "2")))
+        return _runner
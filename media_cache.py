@@ -0,0 +1,154 @@
+# media_cache.py - Content-addressed disk cache for downloaded photos and videos
+#
+# Entries are keyed by (media_key, variant URL) and point at a blob named after
+# its SHA-256, so the same bytes reached through different keys are stored once.
+# Blobs are evicted least-recently-used once the disk budget is exceeded, but
+# never while they may still be in use by a post (touched in the last few minutes).
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+# Blobs handed out more recently than this are never evicted
+IN_USE_SECONDS = 600
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class MediaCache:
+    def __init__(self, root, max_bytes=2 * 1024 * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(root, "blobs"), exist_ok=True)
+
+        self.db = sqlite3.connect(os.path.join(root, "index.db"), check_same_thread=False, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                sha256 TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                cache_key TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL REFERENCES blobs (sha256)
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_blobs_last_access ON blobs (last_access)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self.db.commit()
+
+    @staticmethod
+    def cache_key(media_key, url):
+        return f"{media_key}|{url}"
+
+    def _bump(self, name, amount=1):
+        self.db.execute("""
+            INSERT INTO stats (name, value) VALUES (?, ?)
+            ON CONFLICT(name) DO UPDATE SET value = value + excluded.value
+        """, (name, amount))
+
+    def lookup(self, media_key, url):
+        """{'file', 'sha256', 'size'} for a cached download, or None"""
+        with self._lock:
+            row = self.db.execute("""
+                SELECT b.sha256, b.path, b.size FROM entries e JOIN blobs b ON b.sha256 = e.sha256
+                WHERE e.cache_key = ?
+            """, (self.cache_key(media_key, url),)).fetchone()
+            if row and not os.path.exists(row[1]):
+                # Blob removed behind our back - forget it
+                self.db.execute("DELETE FROM entries WHERE sha256 = ?", (row[0],))
+                self.db.execute("DELETE FROM blobs WHERE sha256 = ?", (row[0],))
+                row = None
+            if row:
+                self.db.execute("UPDATE blobs SET last_access = ? WHERE sha256 = ?", (time.time(), row[0]))
+                self._bump("hits")
+                self._bump("bytes_served", row[2])
+            else:
+                self._bump("misses")
+            self.db.commit()
+        return {"sha256": row[0], "file": row[1], "size": row[2]} if row else None
+
+    def store(self, media_key, url, temp_path, sha256=None):
+        """Move a finished download into the cache; returns the same dict as lookup()"""
+        sha256 = sha256 or file_sha256(temp_path)
+        size = os.path.getsize(temp_path)
+        ext = os.path.splitext(temp_path)[1]
+        path = os.path.join(self.root, "blobs", sha256[:2], sha256 + ext)
+
+        with self._lock:
+            existing = self.db.execute("SELECT path FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()
+            if existing and os.path.exists(existing[0]):
+                os.unlink(temp_path)  # Same bytes already cached under another key
+                path = existing[0]
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                shutil.move(temp_path, path)
+            self.db.execute("""
+                INSERT OR REPLACE INTO blobs (sha256, path, size, last_access) VALUES (?, ?, ?, ?)
+            """, (sha256, path, size, time.time()))
+            self.db.execute("""
+                INSERT OR REPLACE INTO entries (cache_key, sha256) VALUES (?, ?)
+            """, (self.cache_key(media_key, url), sha256))
+            self._evict()
+            self.db.commit()
+        return {"sha256": sha256, "file": path, "size": size}
+
+    def _evict(self):
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        candidates = self.db.execute("""
+            SELECT sha256, path, size FROM blobs WHERE last_access < ? ORDER BY last_access
+        """, (time.time() - IN_USE_SECONDS,)).fetchall()
+        for sha256, path, size in candidates:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            self.db.execute("DELETE FROM entries WHERE sha256 = ?", (sha256,))
+            self.db.execute("DELETE FROM blobs WHERE sha256 = ?", (sha256,))
+            total -= size
+            self._bump("evictions")
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.db.execute("SELECT name, value FROM stats").fetchall())
+            blobs, total = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+        hits, misses = counters.get("hits", 0), counters.get("misses", 0)
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "bytes_served": counters.get("bytes_served", 0),
+            "evictions": counters.get("evictions", 0),
+            "files": blobs,
+            "bytes": total,
+            "max_bytes": self.max_bytes
+        }
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_media_cache():
+    """The process-wide media cache, configured from the environment on first use"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = MediaCache(
+                os.getenv("MEDIA_CACHE_DIR", ".cache/media"),
+                max_bytes=int(os.getenv("MEDIA_CACHE_MB", "2048")) * 1024 * 1024
+            )
+        return _cache
@@ -0,0 +1,179 @@
+# metrics.py - Latency histograms and counters for the post pipeline, in Prometheus format
+#
+# fetch -> download -> transcode -> upload: each stage is timed with @timed(stage),
+# and bytes moved, HTTP statuses per host and failures are counted. Everything is
+# in-process (a lock and a few increments per observation, ~3us per timed call
+# against stages that take milliseconds to minutes - see
+# benchmarks/bench_metrics_overhead.py), shared by all sessions, and rendered in
+# the Prometheus text format by render(). With METRICS_PORT set,
+# start_metrics_server() serves it at http://<host>:METRICS_PORT/metrics.
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+def _escape(value):
+    return "" if value is None else str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _label_text(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(map(labels.get, self.labels))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def values(self):
+        """{label values: count}"""
+        with self._lock:
+            return dict(self._values)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.values().items()):
+            lines.append(f"{self.name}{_label_text(self.labels, key)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=STAGE_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(map(labels.get, self.labels))
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self):
+        """{label values: {"count", "sum", "p50", "p95"}}, quantiles estimated from the buckets"""
+        with self._lock:
+            series = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        return {key: {
+            "count": count,
+            "sum": total,
+            "p50": self._quantile(0.5, counts, count),
+            "p95": self._quantile(0.95, counts, count)
+        } for key, (counts, total, count) in series.items()}
+
+    def _quantile(self, q, counts, count):
+        # Linear within the bucket, as Prometheus' histogram_quantile() does
+        if not count:
+            return 0.0
+        rank = q * count
+        seen = 0
+        for i, bucket_count in enumerate(counts):
+            if seen + bucket_count >= rank and bucket_count:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        for key, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_label_text(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_label_text(self.labels, key)} {count}")
+        return lines
+
+STAGE_SECONDS = Histogram("pipeline_stage_seconds", "Time spent in each post pipeline stage", ["stage"])
+STAGE_ERRORS = Counter("pipeline_stage_errors_total", "Pipeline stage calls that failed", ["stage"])
+BYTES = Counter("pipeline_bytes_total", "Bytes downloaded from X/twimg and uploaded to Telegram", ["direction"])
+HTTP_RESPONSES = Counter("http_responses_total", "HTTP responses by host and status (error = no response)", ["host", "status"])
+
+REGISTRY = [STAGE_SECONDS, STAGE_ERRORS, BYTES, HTTP_RESPONSES]
+
+def timed(stage, ok=None):
+    """Decorator timing each call into STAGE_SECONDS
+
+    The call also counts in STAGE_ERRORS if it raises or ok(result) is false.
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            failed = True
+            try:
+                result = fn(*args, **kwargs)
+                failed = ok is not None and not ok(result)
+                return result
+            finally:
+                STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage)
+                if failed:
+                    STAGE_ERRORS.inc(stage=stage)
+        return wrapper
+    return decorate
+
+def render():
+    """Every metric in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes every few seconds would flood the app log
+
+_server = None
+_server_tried = False
+_server_lock = threading.Lock()
+
+def start_metrics_server(port=None):
+    """Serve /metrics on METRICS_PORT in a daemon thread, once per process; None if unset or busy"""
+    global _server, _server_tried
+    port = port or os.getenv("METRICS_PORT")
+    with _server_lock:
+        if not _server_tried and port:
+            _server_tried = True  # Called on every rerun; only the first call binds
+            try:
+                _server = ThreadingHTTPServer((os.getenv("METRICS_HOST", "0.0.0.0"), int(port)), _MetricsHandler)
+            except OSError:
+                print(f"Metrics port {port} busy - /metrics not served by this process")
+                return None
+            threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+        return _server
@@ -0,0 +1,153 @@
+# multipart.py - Constant-memory multipart/form-data body for large uploads
+#
+# requests builds the whole multipart body in memory when given files=..., which
+# for a sendMediaGroup album of videos means hundreds of MB per post. This builds
+# the part headers up front, streams file contents from disk as the socket asks
+# for them, and knows its exact length so Content-Length is sent (no chunking).
+# A file part can also be a readable object of unknown size (a live ffmpeg
+# output); the body is then sent with chunked transfer encoding via iter_chunks().
+import os
+import uuid
+
+class MultipartStream:
+    """File-like request body; pass as data= with headers={"Content-Type": body.content_type}"""
+
+    def __init__(self, fields, files, on_progress=None):
+        """fields: [(name, value)], files: [(name, filename, path or readable, content_type)]
+
+        on_progress(sent_bytes, total_bytes) is called as the body is read;
+        total_bytes is None when a part is a stream.
+        """
+        self.boundary = uuid.uuid4().hex
+        self.on_progress = on_progress
+        self._parts = []  # (start offset, size, bytes | file path | readable)
+        self._handle = None
+        self._handle_path = None
+        self._pos = 0
+
+        for name, value in fields:
+            self._add(self._part_header(name) + str(value).encode() + b"\r\n")
+        for name, filename, path, content_type in files:
+            self._add(self._part_header(name, filename, content_type))
+            self._add_file(path)
+            self._add(b"\r\n")
+        self._add(f"--{self.boundary}--\r\n".encode())
+        self.length = self._end()
+
+    @property
+    def content_type(self):
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def _part_header(self, name, filename=None, content_type=None):
+        disposition = f'form-data; name="{name}"'
+        if filename:
+            disposition += f'; filename="{filename}"'
+        header = f"--{self.boundary}\r\nContent-Disposition: {disposition}\r\n"
+        if content_type:
+            header += f"Content-Type: {content_type}\r\n"
+        return (header + "\r\n").encode()
+
+    def _end(self):
+        """Offset where the next part starts; None once a part of unknown size is added"""
+        if not self._parts:
+            return 0
+        start, size, _ = self._parts[-1]
+        return None if start is None or size is None else start + size
+
+    def _add(self, data):
+        self._parts.append((self._end(), len(data), data))
+
+    def _add_file(self, source):
+        size = None if hasattr(source, "read") else os.path.getsize(source)
+        self._parts.append((self._end(), size, source))
+
+    def __len__(self):
+        if self.length is None:
+            raise TypeError("Body contains a stream; send iter_chunks() instead")
+        return self.length
+
+    def iter_chunks(self, chunk_size=64 * 1024):
+        """Yield the body front to back - works whether or not the length is known"""
+        sent = 0
+        for _, _, payload in self._parts:
+            if isinstance(payload, bytes):
+                chunks = [payload]
+            elif isinstance(payload, str):
+                chunks = self._iter_file(payload, chunk_size)
+            else:
+                chunks = iter(lambda: payload.read(chunk_size), b"")
+            for chunk in chunks:
+                sent += len(chunk)
+                yield chunk
+                if self.on_progress:
+                    self.on_progress(sent, self.length)
+
+    def _iter_file(self, path, chunk_size):
+        with open(path, "rb") as f:
+            yield from iter(lambda: f.read(chunk_size), b"")
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        # urllib3 rewinds the body before retrying after a connection error
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += self.length
+        self._pos = max(0, min(offset, self.length))
+        return self._pos
+
+    def read(self, size=-1):
+        if self.length is None:
+            raise TypeError("Body contains a stream; send iter_chunks() instead")
+        if size is None or size < 0:
+            size = self.length - self._pos
+        chunks = []
+        while size > 0 and self._pos < self.length:
+            start, part_size, payload = self._part_at(self._pos)
+            offset = self._pos - start
+            wanted = min(size, part_size - offset)
+            if isinstance(payload, bytes):
+                chunk = payload[offset:offset + wanted]
+            else:
+                chunk = self._read_file(payload, offset, wanted)
+                if not chunk:
+                    raise IOError(f"{payload} shrank while uploading")
+            chunks.append(chunk)
+            self._pos += len(chunk)
+            size -= len(chunk)
+
+        if self.on_progress:
+            self.on_progress(self._pos, self.length)
+        return chunks[0] if len(chunks) == 1 else b"".join(chunks)
+
+    def _part_at(self, pos):
+        for part in self._parts:
+            if part[0] <= pos < part[0] + part[1]:
+                return part
+        raise ValueError(f"Offset {pos} outside the body")
+
+    def _read_file(self, path, offset, size):
+        if self._handle_path != path:
+            self._close_handle()
+            self._handle = open(path, "rb")
+            self._handle_path = path
+        if self._handle.tell() != offset:
+            self._handle.seek(offset)
+        return self._handle.read(size)
+
+    def _close_handle(self):
+        if self._handle:
+            self._handle.close()
+        self._handle = None
+        self._handle_path = None
+
+    def close(self):
+        self._close_handle()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,174 @@
+# send_queue.py - Paces every outbound Telegram call within the Bot API limits
+#
+# Telegram allows about 30 messages per second per bot, 1 per second in a single
+# chat and 20 per minute in a group or channel; going over gets HTTP 429 with
+# parameters.retry_after. Callers hand SendQueue.send() a function that makes the
+# request and it is run on the caller's thread once it is that chat's turn (FIFO
+# per chat) and the token buckets allow it. A 429 puts the chat on hold for
+# retry_after seconds and the same request is made again, so a busy day shows up
+# as delay instead of lost posts.
+import os
+import threading
+import time
+from collections import deque
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost, now):
+        """Seconds until `cost` tokens are available (0 if they are now)"""
+        self._refill(now)
+        cost = min(cost, self.capacity)  # A 10-item album mustn't wait forever on a 1-token bucket
+        return max(0.0, (cost - self.tokens) / self.rate)
+
+    def take(self, cost, now):
+        self._refill(now)
+        self.tokens -= min(cost, self.capacity)
+
+class _Chat:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.waiting = deque()  # Tickets in arrival order; only the head may send
+        self.busy = False
+        self.blocked_until = 0.0
+
+def retry_after(response):
+    """Seconds Telegram asked us to wait, or None if the response isn't a 429"""
+    if response is None or response.status_code != 429:
+        return None
+    try:
+        return float(response.json().get("parameters", {}).get("retry_after", 1))
+    except ValueError:
+        return 1.0
+
+class SendQueue:
+    def __init__(self, global_rate=30, chat_rate=1, chat_per_minute=20, max_wait=900):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_per_minute = chat_per_minute
+        self.max_wait = max_wait  # Give up retrying 429s after this long and return the error
+        self._cond = threading.Condition()
+        self._chats = {}
+        self._latencies = deque(maxlen=500)
+        self._counts = {"sent": 0, "rate_limited": 0}
+        self._last_retry_after = 0.0
+
+    def _chat(self, chat_id):
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _Chat([
+                TokenBucket(self.chat_rate, 1),
+                TokenBucket(self.chat_per_minute / 60, self.chat_per_minute)
+            ])
+        return chat
+
+    def send(self, chat_id, request, cost=1):
+        """Run request() when the rate limits allow; returns its response
+
+        cost is how many messages the call produces (an album counts each item).
+        """
+        chat_id = str(chat_id)
+        ticket = (object(), time.monotonic())
+        with self._cond:
+            chat = self._chat(chat_id)
+            chat.waiting.append(ticket)
+        first_attempt = True
+        try:
+            while True:
+                self._acquire(chat, ticket, cost)
+                if first_attempt:
+                    self._latencies.append(time.monotonic() - ticket[1])
+                    first_attempt = False
+                try:
+                    response = request()
+                finally:
+                    with self._cond:
+                        chat.busy = False
+                        self._cond.notify_all()
+
+                wait = retry_after(response)
+                if wait is None:
+                    with self._cond:
+                        self._counts["sent"] += 1
+                    return response
+                with self._cond:
+                    self._counts["rate_limited"] += 1
+                    self._last_retry_after = wait
+                    chat.blocked_until = max(chat.blocked_until, time.monotonic() + wait)
+                if time.monotonic() + wait - ticket[1] > self.max_wait:
+                    return response
+        finally:
+            with self._cond:
+                chat.waiting.remove(ticket)
+                if self._idle(chat, time.monotonic()):
+                    del self._chats[chat_id]  # Keep the table to chats with recent traffic
+                self._cond.notify_all()
+
+    def _idle(self, chat, now):
+        """Nothing queued or held, and forgetting the buckets wouldn't allow a burst"""
+        if chat.waiting or chat.busy or chat.blocked_until > now:
+            return False
+        return all(bucket.wait_time(bucket.capacity, now) == 0 for bucket in chat.buckets)
+
+    def _acquire(self, chat, ticket, cost):
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if chat.waiting[0] is ticket and not chat.busy:
+                    wait = max(
+                        chat.blocked_until - now,
+                        self.global_bucket.wait_time(cost, now),
+                        *(bucket.wait_time(cost, now) for bucket in chat.buckets)
+                    )
+                    if wait <= 0:
+                        self.global_bucket.take(cost, now)
+                        for bucket in chat.buckets:
+                            bucket.take(cost, now)
+                        chat.busy = True
+                        return
+                    self._cond.wait(timeout=wait)
+                else:
+                    self._cond.wait()
+
+    def stats(self):
+        with self._cond:
+            now = time.monotonic()
+            waiting = [ticket for chat in self._chats.values() for ticket in chat.waiting]
+            in_flight = sum(1 for chat in self._chats.values() if chat.busy)
+            held = sum(1 for chat in self._chats.values() if chat.blocked_until > now)
+            latencies = sorted(self._latencies)
+            counts = dict(self._counts)
+            last_retry_after = self._last_retry_after
+        return dict(
+            counts,
+            backlog=len(waiting) - in_flight,
+            in_flight=in_flight,
+            chats_on_hold=held,
+            oldest_wait=max((now - t[1] for t in waiting), default=0.0),
+            avg_latency=sum(latencies) / len(latencies) if latencies else 0.0,
+            p95_latency=latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+            last_retry_after=last_retry_after
+        )
+
+_queue = None
+_queue_lock = threading.Lock()
+
+def get_send_queue():
+    """The process-wide send queue, configured from the environment on first use"""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = SendQueue(
+                global_rate=float(os.getenv("TELEGRAM_GLOBAL_RATE", "30")),
+                chat_rate=float(os.getenv("TELEGRAM_CHAT_RATE", "1")),
+                chat_per_minute=float(os.getenv("TELEGRAM_CHAT_PER_MINUTE", "20"))
+            )
+        return _queue
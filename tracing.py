@@ -0,0 +1,205 @@
+# tracing.py - Per-post traces: nested, timed spans written to a rotating JSONL file
+#
+# Each POST TO TELEGRAM job and each scheduled dispatch gets a Trace. Code on the
+# posting path opens spans with `with trace.span(name, **attrs) as span:` and adds
+# sizes with span.set(...). Spans nest under whatever span is open on the same
+# thread; work handed to a pool thread passes its parent explicitly. When the post
+# is done, finish() appends the trace as one JSON line to TRACE_FILE
+# (.cache/traces.jsonl), which rotates at TRACE_MAX_MB into .1, .2, ... so
+# offline analysis can read it with any JSONL tool. recent_traces() reads the tail
+# of the current file for the waterfall in the Activity tab.
+import json
+import os
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends from one process are still whole lines
+    fcntl = None
+
+TRACE_FILE = os.getenv("TRACE_FILE", ".cache/traces.jsonl")
+TRACE_MAX_BYTES = int(float(os.getenv("TRACE_MAX_MB", "10")) * 1024 * 1024)
+TRACE_BACKUPS = int(os.getenv("TRACE_BACKUPS", "3"))
+TAIL_BYTES = 512 * 1024  # How far back recent_traces() reads
+
+class Span:
+    def __init__(self, trace, span_id, parent_id, name, attrs):
+        self.trace = trace
+        self.id = span_id
+        self.parent_id = parent_id
+        self.name = name
+        self.attrs = attrs
+        self.start = None
+        self.duration = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.start = time.perf_counter() - self.trace.perf_start
+        self.trace._stack().append(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.trace.perf_start - self.start
+        if exc is not None:
+            self.attrs["error"] = str(exc)
+        stack = self.trace._stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+        self.trace._add(self)
+
+class _NoSpan:
+    """What span() hands out when nothing is being traced"""
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+NO_SPAN = _NoSpan()
+
+class Trace:
+    def __init__(self, name, already_elapsed=0.0, **attrs):
+        """already_elapsed: seconds of work done before the trace began (see add_span)"""
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.attrs = attrs
+        self.started_at = time.time() - already_elapsed
+        self.perf_start = time.perf_counter() - already_elapsed
+        self.spans = []
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def _add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def _new_id(self):
+        with self._lock:
+            self._next_id += 1
+            return self._next_id
+
+    def current(self):
+        """The innermost span open on this thread, or None"""
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    def span(self, name, parent=None, **attrs):
+        """A span under `parent`, else under the innermost open span on this thread"""
+        parent = parent or self.current()
+        return Span(self, self._new_id(), parent.id if parent else None, name, attrs)
+
+    def add_span(self, name, start, duration, **attrs):
+        """Record a span that was timed elsewhere, start seconds after the trace began"""
+        span = Span(self, self._new_id(), None, name, attrs)
+        span.start, span.duration = start, duration
+        self._add(span)
+
+    def to_dict(self):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: (s.start, s.id))
+        return {
+            "trace_id": self.id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration": round(time.perf_counter() - self.perf_start, 6),
+            "attrs": self.attrs,
+            "spans": [{
+                "id": span.id,
+                "parent": span.parent_id,
+                "name": span.name,
+                "start": round(span.start, 6),
+                "duration": round(span.duration, 6),
+                "attrs": span.attrs
+            } for span in spans]
+        }
+
+    def finish(self, **attrs):
+        """Append the trace to the JSONL file; never lets a logging problem fail the post"""
+        self.attrs.update(attrs)
+        record = self.to_dict()
+        try:
+            get_trace_log().write(record)
+        except Exception as e:
+            print(f"Could not write trace {self.id}: {e}")
+        return record
+
+class TraceLog:
+    def __init__(self, path, max_bytes=TRACE_MAX_BYTES, backups=TRACE_BACKUPS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._lock = threading.Lock()
+        self._tail_signature = None
+        self._tail = []
+
+    def write(self, record):
+        line = json.dumps(record, default=str) + "\n"
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # Workers and the app share the file: one lock covers the rotate-or-append decision
+        with self._lock, open(self.path + ".lock", "a") as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            if os.path.exists(self.path) and os.path.getsize(self.path) + len(line) > self.max_bytes:
+                self._rotate()
+            with open(self.path, "a") as f:
+                f.write(line)
+
+    def _rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.unlink(self.path)
+
+    def recent(self, limit=20):
+        """The newest traces in the current file, newest first"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return []
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if signature != self._tail_signature:
+                with open(self.path, "rb") as f:
+                    f.seek(max(0, stat.st_size - TAIL_BYTES))
+                    lines = f.read().splitlines()
+                if stat.st_size > TAIL_BYTES:
+                    lines = lines[1:]  # Probably cut mid-line
+                traces = []
+                for line in lines:
+                    try:
+                        traces.append(json.loads(line))
+                    except ValueError:
+                        continue
+                self._tail, self._tail_signature = traces, signature
+            return list(reversed(self._tail[-limit:]))
+
+_log = None
+_log_lock = threading.Lock()
+
+def get_trace_log():
+    global _log
+    with _log_lock:
+        if _log is None:
+            _log = TraceLog(TRACE_FILE)
+        return _log
+
+def recent_traces(limit=20):
+    return get_trace_log().recent(limit)
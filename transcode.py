@@ -0,0 +1,657 @@
+# transcode.py - ffmpeg helpers for getting X videos into Telegram
+#
+# StreamingTranscode connects the HTTP download, ffmpeg and the upload body with
+# pipes: the CDN response is fed to ffmpeg's stdin while the multipart upload
+# reads fragmented MP4 from its stdout, so nothing round-trips through temp files.
+# Fragmented MP4 (moov up front, then fragments) is what makes a streamable
+# output possible at all - +faststart needs a seekable output file.
+#
+# probe_media/transcode_plan decide what a downloaded file needs: nothing, a
+# stream-copy remux into a faststart MP4, or a full re-encode. Those run on the
+# process-wide TranscodePool so simultaneous posts don't all fight for every core.
+import itertools
+import json
+import os
+import queue
+import subprocess
+import threading
+import time
+from collections import OrderedDict, deque
+
+import http_client
+import metrics
+from media_cache import file_sha256
+
+FRAGMENTED_MP4 = "frag_keyframe+empty_moov+default_base_moof"
+# Cut a fragment at least every second so the upload doesn't wait a whole GOP
+FRAGMENT_MICROSECONDS = 1000000
+
+# Largest frame side H.264 level 5.1 allows; bigger sources are scaled down
+MAX_DIMENSION = 4096
+
+# Fit within MAX_DIMENSION, then ensure even dimensions
+VIDEO_FILTER = (
+    f"scale='min({MAX_DIMENSION},iw)':'min({MAX_DIMENSION},ih)':force_original_aspect_ratio=decrease,"
+    "scale=trunc(iw/2)*2:trunc(ih/2)*2"
+)
+
+# reencode_video's long-standing settings, plus the size cap and 8-bit 4:2:0 output
+H264_AAC_ARGS = [
+    "-c:v", "libx264",
+    "-preset", "fast",
+    "-crf", "23",
+    "-vf", VIDEO_FILTER,
+    "-pix_fmt", "yuv420p",
+    "-c:a", "aac",
+    "-b:a", "128k"
+]
+
+# Pixel formats every Telegram client decodes
+PLAYABLE_PIX_FMTS = ("yuv420p", "yuvj420p")
+
+PROBE_CACHE_SIZE = 256
+_probes = OrderedDict()
+_probes_lock = threading.Lock()
+
+def top_level_atoms(head):
+    """Names of the top-level MP4 boxes visible in the first bytes of a file"""
+    atoms = []
+    pos = 0
+    while pos + 8 <= len(head):
+        size = int.from_bytes(head[pos:pos + 4], "big")
+        atoms.append(head[pos + 4:pos + 8].decode("latin-1"))
+        if size == 1:
+            if pos + 16 > len(head):
+                break
+            size = int.from_bytes(head[pos + 8:pos + 16], "big")
+        if size < 8:
+            break  # 0 = runs to end of file, anything else is corrupt
+        pos += size
+    return atoms
+
+def moov_first(head):
+    """True/False if the bytes show where moov is relative to mdat, None if they don't"""
+    atoms = top_level_atoms(head)
+    if "moov" in atoms and "mdat" in atoms:
+        return atoms.index("moov") < atoms.index("mdat")
+    if "mdat" in atoms:
+        return False
+    if "moov" in atoms:
+        return True
+    return None
+
+def frame_rate(rate):
+    """Frames per second from ffprobe's "30000/1001" form; 0 if unknown"""
+    try:
+        num, _, den = (rate or "").partition("/")
+        return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0
+
+def probe_media(path, sha256=None):
+    """Container, codecs, dimensions, duration and moov position of a media file
+
+    Results are cached by content hash, so the same bytes are only probed once.
+    """
+    sha256 = sha256 or file_sha256(path)
+    with _probes_lock:
+        if sha256 in _probes:
+            _probes.move_to_end(sha256)
+            return dict(_probes[sha256])
+
+    result = subprocess.run(
+        ["ffprobe", "-v", "error",
+         "-show_entries", "stream=codec_type,codec_name,width,height,pix_fmt,avg_frame_rate:format=format_name,duration",
+         "-of", "json", path],
+        capture_output=True, text=True, timeout=30
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"ffprobe failed: {result.stderr[:200]}")
+    data = json.loads(result.stdout)
+    streams = data.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), {})
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), {})
+    with open(path, "rb") as f:
+        head = f.read(64 * 1024)
+
+    probe = {
+        "sha256": sha256,
+        "container": data.get("format", {}).get("format_name", ""),
+        "duration": float(data.get("format", {}).get("duration") or 0),
+        "video_codec": video.get("codec_name"),
+        "audio_codec": audio.get("codec_name"),
+        "width": video.get("width", 0),
+        "height": video.get("height", 0),
+        "pix_fmt": video.get("pix_fmt"),
+        "fps": frame_rate(video.get("avg_frame_rate")),
+        "faststart": moov_first(head) is True
+    }
+    with _probes_lock:
+        _probes[sha256] = probe
+        while len(_probes) > PROBE_CACHE_SIZE:
+            _probes.popitem(last=False)
+    return dict(probe)
+
+def transcode_plan(probe):
+    """("skip" | "remux" | "encode", reason) for getting a probed video onto Telegram"""
+    if probe["video_codec"] != "h264":
+        return "encode", f"video codec is {probe['video_codec'] or 'missing'}"
+    if probe["audio_codec"] not in (None, "aac"):
+        return "encode", f"audio codec is {probe['audio_codec']}"
+    if probe["pix_fmt"] not in PLAYABLE_PIX_FMTS:
+        return "encode", f"pixel format is {probe['pix_fmt']}"
+    if probe["width"] % 2 or probe["height"] % 2:
+        return "encode", f"odd dimensions {probe['width']}x{probe['height']}"
+    if max(probe["width"], probe["height"]) > MAX_DIMENSION:
+        return "encode", f"{probe['width']}x{probe['height']} is larger than {MAX_DIMENSION}px"
+    if "mp4" not in probe["container"].split(","):
+        return "remux", f"container is {probe['container']}"
+    if not probe["faststart"]:
+        return "remux", "moov atom is after the media data"
+    return "skip", "already H.264/AAC MP4 with faststart"
+
+# Interactive posts go ahead of scheduled ones in the transcode queue
+PRIORITY_INTERACTIVE = 0
+PRIORITY_SCHEDULED = 1
+
+# ffmpeg time limit: a startup allowance plus so much per second of video, or a
+# flat limit when the duration is unknown
+TIMEOUT_BASE = 60
+TIMEOUT_PER_SECOND = {"remux": 0.5, "encode": 4}
+TIMEOUT_UNKNOWN_DURATION = 600
+
+CANCELLED = "cancelled"
+
+def transcode_timeout(duration, action="encode"):
+    """Seconds to allow ffmpeg for `duration` seconds of video"""
+    if not duration:
+        return TIMEOUT_UNKNOWN_DURATION
+    return TIMEOUT_BASE + duration * TIMEOUT_PER_SECOND[action]
+
+def remux(input_path, output_path, duration=0, owner=None, priority=PRIORITY_INTERACTIVE):
+    """Copy the streams into a faststart MP4 without re-encoding; ffmpeg's error or None"""
+    return get_transcode_pool().run(
+        ["-i", input_path, "-c", "copy", "-movflags", "+faststart"], output_path,
+        transcode_timeout(duration, "remux"), owner, priority
+    )
+
+def encode(input_path, output_path, encode_args=None, duration=0, owner=None, priority=PRIORITY_INTERACTIVE):
+    """Full H.264/AAC re-encode into a faststart MP4; ffmpeg's error or None"""
+    return get_transcode_pool().run(
+        ["-i", input_path, *(encode_args or H264_AAC_ARGS), "-movflags", "+faststart"], output_path,
+        transcode_timeout(duration, "encode"), owner, priority
+    )
+
+def available_cores():
+    try:
+        return len(os.sched_getaffinity(0))  # Respects container CPU pinning
+    except AttributeError:
+        return os.cpu_count() or 1
+
+class TranscodeJob:
+    def __init__(self, args, output_path, timeout, owner, priority):
+        self.args = args
+        self.output_path = output_path
+        self.timeout = timeout
+        self.owner = owner
+        self.priority = priority
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.proc = None
+        self.cancelled = False
+        self.error = None
+        self.done = threading.Event()
+        # Held slots (see TranscodePool.hold): the holder runs ffmpeg itself
+        self.held = args is None
+        self.granted = threading.Event()
+        self.released = threading.Event()
+        self.holder_error = None
+
+    def wait(self):
+        """Block until the job ran or was cancelled; ffmpeg's error or None"""
+        self.done.wait()
+        return self.error
+
+class TranscodePool:
+    """Runs ffmpeg jobs on a fixed set of worker threads, highest priority first
+
+    Each job gets `threads` ffmpeg threads, so workers * threads roughly matches
+    the cores available. Jobs carry an owner (the post job that started them) so
+    cancelling a post stops its ffmpeg processes and no one else's.
+    """
+
+    def __init__(self, workers=None, threads=None):
+        cores = available_cores()
+        self.workers = workers or max(1, cores // 2)
+        self.threads = threads or max(1, cores // self.workers)
+        self._queue = queue.PriorityQueue()
+        self._order = itertools.count()  # FIFO within a priority
+        self._lock = threading.Lock()
+        self._jobs = set()  # Queued and running
+        self._waits = deque(maxlen=200)
+        self._counts = {"completed": 0, "failed": 0, "cancelled": 0, "timeouts": 0}
+        for _ in range(self.workers):
+            threading.Thread(target=self._work, daemon=True).start()
+
+    def hold(self, timeout, owner=None, priority=PRIORITY_INTERACTIVE):
+        """Wait for a worker slot for an ffmpeg process the caller runs itself
+
+        For StreamingTranscode, whose ffmpeg reads and writes pipes instead of files.
+        Returns the job once a worker is free, or after it was cancelled in the queue
+        (job.cancelled). Start ffmpeg with spawn(), so cancel() and the timeout can
+        kill it, and call release() when it is done.
+        """
+        job = self.submit(None, None, timeout, owner, priority)
+        job.granted.wait()
+        return job
+
+    def spawn(self, job, args, **popen_kwargs):
+        """Start a held job's ffmpeg with this pool's thread count; None if it was cancelled"""
+        with self._lock:
+            if job.cancelled or job.done.is_set():
+                return None
+            job.proc = subprocess.Popen(
+                ["ffmpeg", "-hide_banner", "-loglevel", "error", *args, "-threads", str(self.threads)],
+                **popen_kwargs
+            )
+            return job.proc
+
+    def release(self, job, error=None):
+        job.holder_error = error
+        job.released.set()
+
+    def submit(self, args, output_path, timeout, owner=None, priority=PRIORITY_INTERACTIVE):
+        job = TranscodeJob(args, output_path, timeout, owner, priority)
+        with self._lock:
+            self._jobs.add(job)
+        self._queue.put((priority, next(self._order), job))
+        return job
+
+    def run(self, args, output_path, timeout, owner=None, priority=PRIORITY_INTERACTIVE):
+        return self.submit(args, output_path, timeout, owner, priority).wait()
+
+    def _work(self):
+        while True:
+            _, _, job = self._queue.get()
+            with self._lock:
+                if job.cancelled:
+                    self._finish(job, CANCELLED)
+                    continue
+                job.started_at = time.monotonic()
+                self._waits.append(job.started_at - job.submitted_at)
+                if job.held:
+                    job.granted.set()
+                else:
+                    # Started in the same lock section as the cancelled check, so
+                    # cancel() either finds the process to kill or stops it starting
+                    try:
+                        job.proc = subprocess.Popen(
+                            ["ffmpeg", "-hide_banner", "-loglevel", "error", *job.args,
+                             "-threads", str(self.threads), "-y", job.output_path],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+                        )
+                    except OSError as e:
+                        self._finish(job, str(e))
+                        continue
+            if job.held:
+                self._wait_for_holder(job)
+                continue
+
+            try:
+                _, stderr = job.proc.communicate(timeout=job.timeout)
+                if job.cancelled:
+                    error = CANCELLED
+                elif job.proc.returncode != 0:
+                    error = stderr.decode(errors="replace")[-300:] or f"exit code {job.proc.returncode}"
+                else:
+                    error = None
+            except subprocess.TimeoutExpired:
+                job.proc.kill()
+                job.proc.communicate()
+                error = f"timed out after {job.timeout:.0f}s"
+            with self._lock:
+                self._finish(job, error)
+
+    def _wait_for_holder(self, job):
+        # This worker's slot stays taken until the holder releases it
+        if job.released.wait(job.timeout):
+            error = CANCELLED if job.cancelled else job.holder_error
+        else:
+            with self._lock:
+                if job.proc and job.proc.poll() is None:
+                    job.proc.kill()
+            error = f"timed out after {job.timeout:.0f}s"
+        with self._lock:
+            self._finish(job, error)
+
+    def _finish(self, job, error):
+        # Called with the lock held
+        job.granted.set()  # Wakes a holder whose job was cancelled while queued
+        self._jobs.discard(job)
+        if error == CANCELLED:
+            self._counts["cancelled"] += 1
+        elif error and error.startswith("timed out"):
+            self._counts["timeouts"] += 1
+        elif error:
+            self._counts["failed"] += 1
+        else:
+            self._counts["completed"] += 1
+        job.error = error
+        job.done.set()
+
+    def cancel(self, owner):
+        """Cancel every queued or running job of one owner; returns how many"""
+        if owner is None:
+            return 0
+        cancelled = 0
+        with self._lock:
+            for job in self._jobs:
+                if job.owner == owner and not job.cancelled:
+                    job.cancelled = True
+                    cancelled += 1
+                    if job.proc and job.proc.poll() is None:
+                        job.proc.kill()
+        return cancelled
+
+    def stats(self):
+        with self._lock:
+            running = sum(1 for job in self._jobs if job.started_at is not None)
+            waits = list(self._waits)
+            counts = dict(self._counts)
+        return dict(
+            counts,
+            workers=self.workers,
+            threads=self.threads,
+            queued=len(self._jobs) - running,
+            running=running,
+            avg_wait=sum(waits) / len(waits) if waits else 0.0,
+            max_wait=max(waits) if waits else 0.0
+        )
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_transcode_pool():
+    """The process-wide transcode pool, sized from the environment on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = TranscodePool(
+                workers=int(os.getenv("TRANSCODE_WORKERS", "0")) or None,
+                threads=int(os.getenv("TRANSCODE_THREADS", "0")) or None
+            )
+        return _pool
+
+# Share of the byte budget kept for MP4 headers, sample tables and fragment boxes
+CONTAINER_OVERHEAD = 0.04
+# Rate control may run this many seconds of bitrate ahead (-bufsize); budgeted too
+VBV_SECONDS = 1
+# Below this many bits per pixel per frame x264 output turns to mush; downscale instead
+MIN_BITS_PER_PIXEL = 0.04
+# Output heights tried, largest first, when the bitrate is too thin for the source
+SCALE_HEIGHTS = (1080, 720, 540, 480, 360, 240)
+# Audio steps down with the budget so it never takes more than a tenth of it
+AUDIO_BITRATES = (128000, 96000, 64000, 32000)
+
+def target_bitrates(duration, max_bytes):
+    """(video, audio) bits per second that fit `duration` seconds into max_bytes"""
+    total = max_bytes * 8 * (1 - CONTAINER_OVERHEAD) / duration
+    audio = next((a for a in AUDIO_BITRATES if a <= total / 10), AUDIO_BITRATES[-1])
+    video = (total - audio) * duration / (duration + VBV_SECONDS)
+    return int(video), audio
+
+def target_height(width, height, fps, video_bps):
+    """Tallest output height - the source's or a SCALE_HEIGHTS step - video_bps can carry"""
+    if not width or not height:
+        return None
+    for out_height in [height] + [h for h in SCALE_HEIGHTS if h < height]:
+        pixels = width * out_height / height * out_height
+        if video_bps / (pixels * (fps or 30)) >= MIN_BITS_PER_PIXEL:
+            return out_height
+    return min(height, SCALE_HEIGHTS[-1])
+
+def capped_encode_args(duration, max_bytes):
+    """Constant-quality H.264/AAC, with peak bitrate capped so the output fits max_bytes
+
+    Small outputs stay as small as CRF makes them; only the worst case is bounded.
+    """
+    args = list(H264_AAC_ARGS)
+    if duration:
+        video_bps, _ = target_bitrates(duration, max_bytes)
+        args += ["-maxrate", str(video_bps), "-bufsize", str(video_bps * VBV_SECONDS)]
+    return args
+
+def sized_encode_args(duration, max_bytes, width=0, height=0, fps=0):
+    """H.264/AAC settings that make `duration` seconds come out under max_bytes
+
+    The average bitrate comes from the budget, with -maxrate/-bufsize so no stretch
+    of the video can overshoot it. The picture is scaled down when that bitrate is
+    too thin for the source resolution.
+    """
+    if not duration:
+        return list(H264_AAC_ARGS)  # Nothing to budget against
+    video_bps, audio_bps = target_bitrates(duration, max_bytes)
+    out_height = target_height(width, height, fps, video_bps)
+    if out_height and out_height < height:
+        video_filter = f"scale=-2:{out_height}"
+    else:
+        video_filter = VIDEO_FILTER
+    return [
+        "-c:v", "libx264",
+        "-preset", "fast",
+        "-b:v", str(video_bps),
+        "-maxrate", str(video_bps),
+        "-bufsize", str(video_bps * VBV_SECONDS),
+        "-vf", video_filter,
+        "-pix_fmt", "yuv420p",
+        "-c:a", "aac",
+        "-b:a", str(audio_bps)
+    ]
+
+def encode_to_size(input_path, output_path, probe, max_bytes, two_pass=False,
+                   owner=None, priority=PRIORITY_INTERACTIVE):
+    """One size-targeted encode of a probed video, optionally two-pass; ffmpeg's error or None"""
+    args = sized_encode_args(probe["duration"], max_bytes, probe["width"], probe["height"], probe["fps"])
+    if not two_pass or not probe["duration"]:
+        return encode(input_path, output_path, args, probe["duration"], owner, priority)
+
+    # Pass 1 only analyses the video; pass 2 spends the same bits where they're needed
+    pool = get_transcode_pool()
+    timeout = transcode_timeout(probe["duration"], "encode")
+    passlog = output_path + ".passlog"
+    try:
+        error = pool.run(
+            ["-i", input_path, *args, "-pass", "1", "-passlogfile", passlog, "-an", "-f", "null"],
+            os.devnull, timeout, owner, priority
+        )
+        if error is None:
+            error = pool.run(
+                ["-i", input_path, *args, "-pass", "2", "-passlogfile", passlog, "-movflags", "+faststart"],
+                output_path, timeout, owner, priority
+            )
+        return error
+    finally:
+        for suffix in ("-0.log", "-0.log.mbtree"):
+            if os.path.exists(passlog + suffix):
+                os.unlink(passlog + suffix)
+
+class StreamTooLarge(RuntimeError):
+    """A StreamingTranscode's output passed its max_bytes"""
+
+class StreamingTranscode:
+    """Readable fragmented MP4 produced from a video URL on the fly
+
+    Pass it to MultipartStream as a file part. tee_path, if given, receives a copy
+    of the output so a finished upload can still go into the media cache. Once
+    the output passes max_bytes, read() stops ffmpeg and raises StreamTooLarge -
+    the upload fails straight away rather than after Telegram saw all of it.
+    From start() to the end of the output it is timed as the "transcode" stage.
+    """
+
+    def __init__(self, url, encode_args=None, tee_path=None, read_size=256 * 1024,
+                 owner=None, priority=PRIORITY_INTERACTIVE, timeout=TIMEOUT_UNKNOWN_DURATION, max_bytes=None):
+        self.url = url
+        self.encode_args = encode_args or list(H264_AAC_ARGS)
+        self.tee_path = tee_path
+        self.read_size = read_size
+        self.owner = owner
+        self.priority = priority
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.slot = None
+        self.proc = None
+        self.response = None
+        self.tee = None
+        self.completed = False
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.started_at = None
+        self.first_byte_at = None
+        self._timed_from = None
+        self._stderr = b""
+        self._threads = []
+
+    def start(self):
+        # A transcode pool slot for the stream's whole life: it counts against the
+        # worker limit, queues by priority, and can be cancelled or timed out
+        pool = get_transcode_pool()
+        self._timed_from = time.perf_counter()
+        self.slot = pool.hold(self.timeout, self.owner, self.priority)
+        self.started_at = time.perf_counter()
+        try:
+            if self.slot.cancelled:
+                raise RuntimeError(f"ffmpeg failed: {CANCELLED}")
+            self.response = http_client.get(self.url, stream=True, timeout=60)
+            self.response.raise_for_status()
+            chunks = self.response.iter_content(self.read_size)
+
+            head = b""
+            for chunk in chunks:
+                head += chunk
+                if len(head) >= 64 * 1024:
+                    break
+
+            if moov_first(head) is False:
+                # ffmpeg can't read a moov-at-the-end MP4 from a pipe; let it fetch
+                # the URL itself so it can seek to the index
+                self.response.close()
+                self.response = None
+                input_args = ["-i", self.url]
+            else:
+                input_args = ["-i", "pipe:0"]
+
+            self.proc = pool.spawn(
+                self.slot,
+                [*input_args, *self.encode_args, "-movflags", FRAGMENTED_MP4,
+                 "-frag_duration", str(FRAGMENT_MICROSECONDS), "-f", "mp4", "pipe:1"],
+                stdin=subprocess.PIPE if self.response else subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE
+            )
+            if self.proc is None:
+                raise RuntimeError(f"ffmpeg failed: {CANCELLED}")
+        except BaseException as e:
+            if self.response:
+                self.response.close()
+                self.response = None
+            self._release(str(e))
+            raise
+        if self.tee_path:
+            self.tee = open(self.tee_path, "wb")
+
+        if self.response:
+            self._spawn(self._pump, head, chunks)
+        self._spawn(self._drain_stderr)
+
+    def _release(self, error=None):
+        """Give the pool slot back and record the stage timing, once"""
+        if self.slot is not None:
+            get_transcode_pool().release(self.slot, error)
+            self.slot = None
+            metrics.STAGE_SECONDS.observe(time.perf_counter() - self._timed_from, stage="transcode")
+            if error:
+                metrics.STAGE_ERRORS.inc(stage="transcode")
+
+    def _spawn(self, target, *args):
+        thread = threading.Thread(target=target, args=args, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _pump(self, head, chunks):
+        """Download -> ffmpeg stdin"""
+        try:
+            self.proc.stdin.write(head)
+            self.bytes_in += len(head)
+            for chunk in chunks:
+                self.proc.stdin.write(chunk)
+                self.bytes_in += len(chunk)
+        except (BrokenPipeError, OSError, ValueError):
+            pass  # ffmpeg exited or we were closed; read() reports why
+        except Exception as e:
+            self._stderr += f"download failed: {e}".encode()
+        finally:
+            try:
+                self.proc.stdin.close()
+            except OSError:
+                pass
+            self.response.close()
+
+    def _drain_stderr(self):
+        for line in self.proc.stderr:
+            self._stderr = (self._stderr + line)[-4000:]
+
+    def read(self, size=-1):
+        if self.proc is None:
+            self.start()
+        data = self.proc.stdout.read(size if size and size > 0 else self.read_size)
+        if data:
+            if self.first_byte_at is None:
+                self.first_byte_at = time.perf_counter()
+            self.bytes_out += len(data)
+            if self.max_bytes and self.bytes_out > self.max_bytes:
+                self.close()
+                raise StreamTooLarge(f"Streamed video passed {self.max_bytes / 1024 / 1024:.0f}MB")
+            if self.tee:
+                self.tee.write(data)
+            return data
+
+        returncode = self.proc.wait()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        if self.tee:
+            self.tee.close()
+            self.tee = None
+        if returncode != 0:
+            error = self._stderr.decode(errors="replace")[-300:] or f"exit code {returncode}"
+            self._release(error)
+            raise RuntimeError(f"ffmpeg failed: {error}")
+        self.completed = True
+        self._release()
+        return b""
+
+    def restart(self):
+        """A fresh stream of the same video, for when this one was cut off part way"""
+        self.close()
+        return StreamingTranscode(
+            self.url, self.encode_args, self.tee_path, self.read_size, self.owner, self.priority, self.timeout,
+            self.max_bytes
+        )
+
+    @property
+    def time_to_first_byte(self):
+        if self.first_byte_at is None:
+            return None
+        return self.first_byte_at - self.started_at
+
+    def close(self):
+        if self.proc and self.proc.poll() is None:
+            self.proc.kill()
+            self.proc.wait()
+        self._release(None if self.completed else "closed before the end of the stream")
+        if self.response:
+            self.response.close()
+        if self.tee:
+            self.tee.close()
+            self.tee = None
+        if self.proc:
+            self.proc.stdout.close()
@@ -0,0 +1,171 @@
+# tweet_cache.py - Persistent TTL/LRU cache for X API tweet lookups
+#
+# One cache per process (Streamlit sessions are threads in the same process),
+# stored in SQLite so it survives restarts. Concurrent lookups of the same tweet
+# share a single upstream request.
+import json
+import os
+import sqlite3
+import threading
+import time
+
+class _InFlight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.payload = None
+
+class TweetCache:
+    def __init__(self, path, ttl=3600, max_entries=5000, max_bytes=50 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS tweets (
+                tweet_id TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                fetched_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_tweets_last_access ON tweets (last_access)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self.db.commit()
+
+    def _bump(self, name, amount=1):
+        self.db.execute("""
+            INSERT INTO stats (name, value) VALUES (?, ?)
+            ON CONFLICT(name) DO UPDATE SET value = value + excluded.value
+        """, (name, amount))
+
+    def _lookup(self, tweet_id):
+        """Return the cached payload string, counting the hit or miss"""
+        now = time.time()
+        with self._lock:
+            row = self.db.execute(
+                "SELECT payload, size, fetched_at FROM tweets WHERE tweet_id = ?", (tweet_id,)
+            ).fetchone()
+            if row and now - row[2] <= self.ttl:
+                self.db.execute("UPDATE tweets SET last_access = ? WHERE tweet_id = ?", (now, tweet_id))
+                self._bump("hits")
+                self._bump("bytes_saved", row[1])
+                self.db.commit()
+                return row[0]
+            if row:
+                self.db.execute("DELETE FROM tweets WHERE tweet_id = ?", (tweet_id,))
+            self._bump("misses")
+            self.db.commit()
+            return None
+
+    def get(self, tweet_id):
+        payload = self._lookup(str(tweet_id))
+        return json.loads(payload) if payload is not None else None
+
+    def put(self, tweet_id, data):
+        payload = json.dumps(data)
+        now = time.time()
+        with self._lock:
+            self.db.execute("""
+                INSERT OR REPLACE INTO tweets (tweet_id, payload, size, fetched_at, last_access)
+                VALUES (?, ?, ?, ?, ?)
+            """, (str(tweet_id), payload, len(payload), now, now))
+            self._evict()
+            self.db.commit()
+        return payload
+
+    def _evict(self):
+        # Expired rows first, then least recently used until under both limits
+        self.db.execute("DELETE FROM tweets WHERE fetched_at < ?", (time.time() - self.ttl,))
+        count, total = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM tweets").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        evicted = 0
+        for tweet_id, size in self.db.execute(
+            "SELECT tweet_id, size FROM tweets ORDER BY last_access"
+        ).fetchall():
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            self.db.execute("DELETE FROM tweets WHERE tweet_id = ?", (tweet_id,))
+            count -= 1
+            total -= size
+            evicted += 1
+        self._bump("evictions", evicted)
+
+    def get_or_fetch(self, tweet_id, fetch):
+        """Cached data, or fetch() it once no matter how many callers ask at the same time
+
+        fetch returns the API response dict, or None on failure (failures are not cached).
+        """
+        tweet_id = str(tweet_id)
+        payload = self._lookup(tweet_id)
+        if payload is not None:
+            return json.loads(payload)
+
+        with self._lock:
+            call = self._inflight.get(tweet_id)
+            leader = call is None
+            if leader:
+                call = self._inflight[tweet_id] = _InFlight()
+
+        if not leader:
+            call.event.wait()
+            if call.payload is None:
+                return None
+            with self._lock:
+                # Served without an upstream request after all - not a miss
+                self._bump("misses", -1)
+                self._bump("coalesced")
+                self._bump("bytes_saved", len(call.payload))
+                self.db.commit()
+            return json.loads(call.payload)
+
+        try:
+            data = fetch()
+            if data is not None:
+                call.payload = self.put(tweet_id, data)
+            return data
+        finally:
+            with self._lock:
+                del self._inflight[tweet_id]
+            call.event.set()
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.db.execute("SELECT name, value FROM stats").fetchall())
+            entries, total = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM tweets").fetchone()
+        hits = counters.get("hits", 0) + counters.get("coalesced", 0)
+        lookups = hits + counters.get("misses", 0)
+        return {
+            "hits": hits,
+            "misses": counters.get("misses", 0),
+            "coalesced": counters.get("coalesced", 0),
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "bytes_saved": counters.get("bytes_saved", 0),
+            "evictions": counters.get("evictions", 0),
+            "entries": entries,
+            "bytes": total
+        }
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_tweet_cache():
+    """The process-wide cache, configured from the environment on first use"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = TweetCache(
+                os.getenv("TWEET_CACHE_PATH", ".cache/tweets.db"),
+                ttl=int(os.getenv("TWEET_CACHE_TTL", "3600")),
+                max_entries=int(os.getenv("TWEET_CACHE_MAX_ENTRIES", "5000")),
+                max_bytes=int(os.getenv("TWEET_CACHE_MAX_MB", "50")) * 1024 * 1024
+            )
+        return _cache
@@ -0,0 +1,282 @@
+# worker.py - Posts due rows from scheduled_posts in the background
+#
+#   python worker.py                 # run until stopped (heap dispatcher, see dispatcher.py)
+#   python worker.py --poll          # plain polling loop instead of the dispatcher
+#   python worker.py --once          # drain what is due right now and exit
+#   python worker.py --processes 4   # several workers side by side
+#
+# Rows are claimed with SELECT ... FOR UPDATE SKIP LOCKED (Postgres) or a single
+# atomic UPDATE (SQLite stand-in), so any number of workers can share the table
+# without posting the same row twice.
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+from activity_store import get_activity_store
+from db_setup import get_connection, is_sqlite, sql
+from tracing import Trace
+
+CLAIM_COLUMNS = "id, chat_id, content_text, media_files, channel_name, user_name, schedule_time"
+
+def rows_as_dicts(cur):
+    columns = [c[0] for c in cur.description]
+    return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+def claim_next(conn, worker_id, now=None):
+    """Claim the oldest due post for this worker, or return None"""
+    now = now or datetime.now()
+    # SQLite serializes writers, so the UPDATE alone is atomic there
+    lock = "" if is_sqlite(conn) else "FOR UPDATE SKIP LOCKED"
+    cur = conn.cursor()
+    cur.execute(sql(conn, f"""
+        UPDATE scheduled_posts
+        SET status = 'processing', claimed_by = %s, claimed_at = %s,
+            attempts = COALESCE(attempts, 0) + 1
+        WHERE id = (
+            SELECT id FROM scheduled_posts
+            WHERE status = 'scheduled' AND schedule_time <= %s
+            ORDER BY schedule_time
+            LIMIT 1
+            {lock}
+        ) AND status = 'scheduled'
+        RETURNING {CLAIM_COLUMNS}
+    """), (worker_id, now, now))
+    rows = rows_as_dicts(cur)
+    conn.commit()
+    cur.close()
+    return rows[0] if rows else None
+
+def claim_post(conn, post_id, worker_id, now=None):
+    """Claim one specific post if it is still scheduled and due (used by the dispatcher)"""
+    now = now or datetime.now()
+    lock = "" if is_sqlite(conn) else "FOR UPDATE SKIP LOCKED"
+    cur = conn.cursor()
+    cur.execute(sql(conn, f"""
+        UPDATE scheduled_posts
+        SET status = 'processing', claimed_by = %s, claimed_at = %s,
+            attempts = COALESCE(attempts, 0) + 1
+        WHERE id = (
+            SELECT id FROM scheduled_posts
+            WHERE id = %s AND status = 'scheduled' AND schedule_time <= %s
+            {lock}
+        ) AND status = 'scheduled'
+        RETURNING {CLAIM_COLUMNS}
+    """), (worker_id, now, post_id, now))
+    rows = rows_as_dicts(cur)
+    conn.commit()
+    cur.close()
+    return rows[0] if rows else None
+
+def finish_post(conn, post_id, success, message_id=None, error=None):
+    cur = conn.cursor()
+    cur.execute(sql(conn, """
+        UPDATE scheduled_posts
+        SET status = %s, posted_at = %s, message_id = %s, error = %s
+        WHERE id = %s
+    """), ("posted" if success else "failed", datetime.now() if success else None,
+           message_id, error, post_id))
+    conn.commit()
+    cur.close()
+
+def release_stale(conn, lease_seconds):
+    """Hand posts back to the queue if their worker died mid-post"""
+    cutoff = datetime.now() - timedelta(seconds=lease_seconds)
+    cur = conn.cursor()
+    cur.execute(sql(conn, """
+        UPDATE scheduled_posts SET status = 'scheduled', claimed_by = NULL
+        WHERE status = 'processing' AND claimed_at < %s
+    """), (cutoff,))
+    released = cur.rowcount
+    conn.commit()
+    cur.close()
+    return released
+
+def enqueue_post(conn, chat_id, text, media, schedule_time, channel_name=None, user_name=None):
+    """Insert a scheduled post; media is the tweet's includes.media list"""
+    cur = conn.cursor()
+    cur.execute(sql(conn, """
+        INSERT INTO scheduled_posts
+            (chat_id, content_text, media_files, channel_name, schedule_time, status, user_name)
+        VALUES (%s, %s, %s, %s, %s, 'scheduled', %s)
+        RETURNING id
+    """), (str(chat_id), text, json.dumps(media or []), channel_name, schedule_time, user_name))
+    post_id = cur.fetchone()[0]
+    conn.commit()
+    cur.close()
+    # Postgres announces new rows with a trigger (see db_setup.py); SQLite has no
+    # LISTEN/NOTIFY, so poke a local dispatcher directly
+    if is_sqlite(conn):
+        notify_dispatcher(post_id)
+    return post_id
+
+def notify_dispatcher(post_id):
+    """Best-effort UDP wake-up for a dispatcher on this host"""
+    port = int(os.getenv("DISPATCH_NOTIFY_PORT", "8765"))
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.sendto(str(post_id).encode(), ("127.0.0.1", port))
+    except OSError:
+        pass
+
+def config_from_env():
+    return {
+        "X_BEARER_TOKEN": os.getenv("X_BEARER_TOKEN"),
+        "TELEGRAM_BOT_TOKEN": os.getenv("TELEGRAM_BOT_TOKEN"),
+        "APP_PASSWORD": os.getenv("APP_PASSWORD"),
+        "TEAM_PASSWORDS": {}
+    }
+
+class ScheduledPostWorker:
+    def __init__(self, database_url=None, scheduler=None, worker_id=None,
+                 poll_interval=5, lease_seconds=900):
+        self.database_url = database_url or os.getenv("DATABASE_URL")
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self._scheduler = scheduler
+        # The dispatcher runs posts on a thread pool, so each thread gets its own
+        # connection and scheduler (last_error is per instance)
+        self._local = threading.local()
+
+    @property
+    def conn(self):
+        if getattr(self._local, "conn", None) is None:
+            self._local.conn = get_connection(self.database_url)
+        return self._local.conn
+
+    @conn.setter
+    def conn(self, value):
+        self._local.conn = value
+
+    @property
+    def scheduler(self):
+        if self._scheduler is not None:
+            return self._scheduler
+        if getattr(self._local, "scheduler", None) is None:
+            # Imported lazily so the claim/finish helpers work without Streamlit
+            from app import SecureXTelegramScheduler
+            self._local.scheduler = SecureXTelegramScheduler.headless(config_from_env())
+        return self._local.scheduler
+
+    def process(self, post):
+        """Download and post one claimed row through the same path as POST TO TELEGRAM"""
+        scheduler = self.scheduler
+        scheduler.last_error = None
+        scheduler.trace = Trace(
+            "scheduled post", post_id=post["id"], worker=self.worker_id,
+            channels=[post.get("channel_name") or post["chat_id"]]
+        )
+        error = None
+        media_data = []
+        try:
+            media = json.loads(post["media_files"]) if post.get("media_files") else []
+            media_data = scheduler.download_media_batch(media, None) if media else []
+            content_data = {
+                "text": post["content_text"],
+                "media": media_data,
+                "channel_name": post.get("channel_name"),
+                # Long captions: post the media and the full text, like the UI default
+                "post_media": True,
+                "post_text": True
+            }
+            success, message_id = scheduler.post_now(post["chat_id"], content_data)
+            if not success:
+                error = scheduler.last_error or "Telegram post failed"
+        except Exception as e:
+            success, message_id, error = False, None, str(e)
+        finally:
+            scheduler.trace.finish(error=error)
+            scheduler.trace = None
+
+        # Same shared log as posts made from the page
+        get_activity_store().record(
+            post.get("user_name"), post.get("channel_name") or post["chat_id"], post["chat_id"],
+            message_id if success else None, post["content_text"][:50], len(media_data), error
+        )
+        finish_post(self.conn, post["id"], success, message_id, error)
+        print(f"[{self.worker_id}] post {post['id']} -> {'posted' if success else 'failed: ' + error}")
+        return success
+
+    def run_once(self):
+        """Post everything that is due; returns how many rows were handled"""
+        release_stale(self.conn, self.lease_seconds)
+        handled = 0
+        while True:
+            post = claim_next(self.conn, self.worker_id)
+            if not post:
+                return handled
+            self.process(post)
+            handled += 1
+
+    def run_forever(self):
+        print(f"[{self.worker_id}] watching scheduled_posts every {self.poll_interval}s")
+        while True:
+            try:
+                if not self.run_once():
+                    time.sleep(self.poll_interval)
+            except KeyboardInterrupt:
+                break
+            except Exception as e:
+                print(f"[{self.worker_id}] error: {e}")
+                time.sleep(self.poll_interval)
+                # Start over with a fresh connection in case the old one dropped
+                try:
+                    self.conn.close()
+                except Exception:
+                    pass
+                self.conn = None
+
+def _run_worker(args):
+    worker = ScheduledPostWorker(args.database_url, poll_interval=args.interval,
+                                 lease_seconds=args.lease)
+    if args.once:
+        print(f"[{worker.worker_id}] handled {worker.run_once()} posts")
+    elif args.poll:
+        worker.run_forever()
+    else:
+        from dispatcher import Dispatcher
+        while True:
+            try:
+                Dispatcher(worker, max_concurrent=args.concurrency, catchup_window=args.catchup_window,
+                           missed_policy=args.missed).run_forever()
+            except KeyboardInterrupt:
+                break
+            except Exception as e:
+                print(f"[{worker.worker_id}] dispatcher error: {e} - restarting")
+                time.sleep(args.interval)
+    get_activity_store().flush()  # The writer thread dies with the process
+
+def main():
+    parser = argparse.ArgumentParser(description="Post due scheduled_posts rows to Telegram")
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"),
+                        help="Postgres URL, or sqlite:///path.db for a local stand-in")
+    parser.add_argument("--interval", type=float, default=5, help="Seconds between polls when idle")
+    parser.add_argument("--lease", type=int, default=900,
+                        help="Seconds before a 'processing' row from a dead worker is retried")
+    parser.add_argument("--processes", type=int, default=1, help="Workers to run side by side")
+    parser.add_argument("--once", action="store_true", help="Drain due posts and exit")
+    parser.add_argument("--poll", action="store_true", help="Poll every --interval instead of dispatching")
+    parser.add_argument("--concurrency", type=int, default=4, help="Posts sent in parallel by the dispatcher")
+    parser.add_argument("--catchup-window", type=int, default=3600,
+                        help="Posts missed by less than this many seconds are sent late on startup")
+    parser.add_argument("--missed", choices=["skip", "post"], default="skip",
+                        help="What to do with posts missed by more than --catchup-window")
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        _run_worker(args)
+        return
+
+    procs = [multiprocessing.Process(target=_run_worker, args=(args,)) for _ in range(args.processes)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+
+if __name__ == "__main__":
+    main()